@@ -25,3 +25,6 @@ from .trend_line import (
     trend_on_single_price,
     trend_on_hl
 )
+
+from .statistics import RunningStatistics
+from .batch import run_batch
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+"""
+本模块负责对整个数据目录批量做趋势线分析。
+
+每个 csv 文件交给进程池中的一个 worker，主进程把关键点写入 SQLite 结果库。
+结果库同时记录每个源文件的大小、修改时间和分析参数，文件和参数都未变化时跳过。
+"""
+
+
+from typing import Optional, Dict, List, Tuple
+import os
+import os.path
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from . import PriceType
+from .trend_line import trend_on_single_price, trend_on_hl
+
+
+KeyPointList = List[Tuple[str, float]]
+
+
+SCHEMA: str = '''
+CREATE TABLE IF NOT EXISTS source_file (
+    file TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    parameter TEXT NOT NULL DEFAULT '',
+    analyzed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS key_point (
+    file TEXT NOT NULL,
+    method TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    datetime TEXT NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (file, method, seq)
+) WITHOUT ROWID;
+'''
+
+
+def get_data_path() -> str:
+    from ..utility import get_application_path
+    return os.path.join(get_application_path(), 'data_downloaded')
+
+
+def get_result_path() -> str:
+    from ..utility import get_application_path
+    return os.path.join(get_application_path(), 'analysis.sqlite')
+
+
+def open_result_db(db_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    # 旧结果库没有 parameter 列，补上后旧记录的参数为空，会重新分析
+    column_list: List[str] = [row[1] for row in connection.execute('PRAGMA table_info(source_file)')]
+    if 'parameter' not in column_list:
+        with connection:
+            connection.execute("ALTER TABLE source_file ADD COLUMN parameter TEXT NOT NULL DEFAULT ''")
+    return connection
+
+
+def make_parameter(price_type: PriceType, threshold: float) -> str:
+    """
+    分析参数，与文件大小、修改时间一起决定是否需要重新分析。
+    """
+    return f'{price_type.value}:{threshold!r}'
+
+
+def _to_key_point_list(point_list: list) -> KeyPointList:
+    return [(dt.isoformat(), float(price)) for dt, price in point_list]
+
+
+def _analyze_file(csv_path: str,
+                  price_type: PriceType,
+                  threshold: float,
+                  chart_path: Optional[str]) -> Dict[str, KeyPointList]:
+    """
+    进程池中执行：分析单个文件，返回 {方法: 关键点列表}。
+    """
+    from ..utility import load_csv, render
+
+    df = load_csv(csv_path)
+    key_point_list, hl_list = trend_on_hl(df)
+    single_list = trend_on_single_price(df, price_type, threshold)
+    result: Dict[str, KeyPointList] = {
+        'hl': _to_key_point_list(key_point_list),
+        'hl_filtered': _to_key_point_list(hl_list),
+        f'single_{price_type.value}': _to_key_point_list(single_list),
+    }
+
+    if chart_path:
+        name: str = os.path.splitext(os.path.basename(csv_path))[0]
+        render(df,
+               f'{name}.png',
+               title=f'{name}\nwith trend line on High and Low',
+               alines=dict(alines=[key_point_list, hl_list], colors=['b', 'g'], linewidths=0.5),
+               chart_path=chart_path
+               )
+    return result
+
+
+def _is_changed(connection: sqlite3.Connection, csv_file: str, stat: os.stat_result, parameter: str) -> bool:
+    row = connection.execute('SELECT size, mtime_ns, parameter FROM source_file WHERE file = ?',
+                             (csv_file,)).fetchone()
+    return row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns or row[2] != parameter
+
+
+def _save_result(connection: sqlite3.Connection,
+                 csv_file: str,
+                 stat: os.stat_result,
+                 parameter: str,
+                 result: Dict[str, KeyPointList]) -> None:
+    with connection:
+        connection.execute('DELETE FROM key_point WHERE file = ?', (csv_file,))
+        for method, point_list in result.items():
+            connection.executemany(
+                'INSERT INTO key_point (file, method, seq, datetime, price) VALUES (?, ?, ?, ?, ?)',
+                [(csv_file, method, i, dt, price) for i, (dt, price) in enumerate(point_list)]
+            )
+        connection.execute(
+            'INSERT OR REPLACE INTO source_file (file, size, mtime_ns, parameter, analyzed_at) VALUES (?, ?, ?, ?, ?)',
+            (csv_file, stat.st_size, stat.st_mtime_ns, parameter, datetime.now().isoformat())
+        )
+
+
+def run_batch(data_path: Optional[str] = None,
+              db_path: Optional[str] = None,
+              workers: Optional[int] = None,
+              price_type: PriceType = PriceType.Close,
+              threshold: float = 0.002,
+              render: bool = False,
+              force: bool = False) -> Dict[str, int]:
+    """
+    批量趋势线分析。
+    :param data_path: 数据目录，默认为 data_downloaded。
+    :param db_path: 结果库路径，默认为应用目录下的 analysis.sqlite。
+    :param workers: 进程数，默认为 CPU 核数。
+    :param price_type: trend_on_single_price 使用的价格。
+    :param threshold: trend_on_single_price 使用的阈值。
+    :param render: 是否输出图片（无窗口，见 utility.render），输出到 get_chart_path()。
+    :param force: 忽略文件和参数是否变化，全部重新分析。
+    :return: {文件名: 关键点数量}，仅包含本次分析的文件。
+    """
+    if data_path is None:
+        data_path = get_data_path()
+    if db_path is None:
+        db_path = get_result_path()
+
+    chart_path: Optional[str] = None
+    if render:
+        from ..utility import get_chart_path
+        chart_path = get_chart_path()
+
+    parameter: str = make_parameter(price_type, threshold)
+    connection: sqlite3.Connection = open_result_db(db_path)
+    summary: Dict[str, int] = {}
+    try:
+        stat_dict: Dict[str, os.stat_result] = {}
+        for csv_file in sorted(os.listdir(data_path)):
+            if not csv_file.endswith('.csv'):
+                continue
+            stat = os.stat(os.path.join(data_path, csv_file))
+            if force or _is_changed(connection, csv_file, stat, parameter):
+                stat_dict[csv_file] = stat
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            future_dict = {
+                executor.submit(_analyze_file,
+                                os.path.join(data_path, csv_file),
+                                price_type,
+                                threshold,
+                                chart_path): csv_file
+                for csv_file in stat_dict.keys()
+            }
+            for future in as_completed(future_dict):
+                csv_file = future_dict[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f'分析 [{csv_file}] 失败: {e!r}')
+                    continue
+                _save_result(connection, csv_file, stat_dict[csv_file], parameter, result)
+                summary[csv_file] = sum(len(point_list) for point_list in result.values())
+                print(f'分析 [{csv_file}] 完成，关键点 {summary[csv_file]} 个。')
+    finally:
+        connection.close()
+    return summary
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+"""
+本模块提供可增量更新的统计量，用于分块（流式）处理大文件。
+"""
+
+
+from typing import Dict, List, Optional
+import math
+
+import numpy as np
+
+
+class RunningStatistics(object):
+    """
+    增量统计量。
+
+    每次调用 update 只处理一块数据，内存占用与数据总量无关：
+        1, count / sum / sum of squares / min / max 为精确值；
+        2, 分布以 resolution 为桶宽的稀疏直方图保存，分位数在桶内线性插值。
+           价格类数据都是最小变动价位的整数倍，resolution 取最小变动价位时分位数即为精确值。
+    """
+    _resolution: float
+    _count: int
+    _sum: float
+    _sum_of_squares: float
+    _min: float
+    _max: float
+    _histogram: Dict[int, int]      # 桶编号 -> 数量
+
+    def __init__(self, resolution: float = 1.0):
+        if resolution <= 0:
+            raise ValueError('Parameter <resolution> should be positive.')
+        self._resolution = resolution
+        self._count = 0
+        self._sum = 0.0
+        self._sum_of_squares = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._histogram = {}
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        self._count += int(values.size)
+        self._sum += float(values.sum())
+        self._sum_of_squares += float(np.square(values).sum())
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+
+        bucket, number = np.unique(np.rint(values / self._resolution).astype(np.int64), return_counts=True)
+        for b, n in zip(bucket.tolist(), number.tolist()):
+            self._histogram[b] = self._histogram.get(b, 0) + n
+
+    def merge(self, other: 'RunningStatistics') -> None:
+        """
+        合并另一个统计量（桶宽必须一致），用于并行处理后汇总。
+        """
+        if other._resolution != self._resolution:
+            raise ValueError('Can not merge statistics with different resolution.')
+        self._count += other._count
+        self._sum += other._sum
+        self._sum_of_squares += other._sum_of_squares
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        for b, n in other._histogram.items():
+            self._histogram[b] = self._histogram.get(b, 0) + n
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self._count if self._count else math.nan
+
+    @property
+    def std(self) -> float:
+        if self._count < 2:
+            return math.nan
+        variance = (self._sum_of_squares - self._sum * self._sum / self._count) / (self._count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    @property
+    def min(self) -> float:
+        return self._min if self._count else math.nan
+
+    @property
+    def max(self) -> float:
+        return self._max if self._count else math.nan
+
+    @property
+    def distribution(self) -> Dict[float, int]:
+        """
+        分布，{值: 数量}，按值升序。
+        """
+        return {b * self._resolution: self._histogram[b] for b in sorted(self._histogram.keys())}
+
+    def quantile(self, q: float) -> float:
+        if not 0 <= q <= 1:
+            raise ValueError('Parameter <q> should be in [0, 1].')
+        if self._count == 0:
+            return math.nan
+
+        rank: float = q * (self._count - 1)
+        cumulative: int = 0
+        bucket_list: List[int] = sorted(self._histogram.keys())
+        for i, b in enumerate(bucket_list):
+            n = self._histogram[b]
+            if rank < cumulative + n or i == len(bucket_list) - 1:
+                value = b * self._resolution
+                # 落在相邻两个桶之间时，线性插值
+                if rank > cumulative + n - 1 and i + 1 < len(bucket_list):
+                    fraction = rank - (cumulative + n - 1)
+                    value += fraction * (bucket_list[i + 1] - b) * self._resolution
+                return min(max(value, self._min), self._max)
+            cumulative += n
+        return self._max
+
+    def summary(self, quantile_list: Optional[List[float]] = None) -> Dict[str, float]:
+        if quantile_list is None:
+            quantile_list = [0.05, 0.25, 0.5, 0.75, 0.95]
+        result: Dict[str, float] = {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min,
+            'max': self.max,
+        }
+        for q in quantile_list:
+            result[f'{q:.0%}'] = self.quantile(q)
+        return result
@@ -7,7 +7,9 @@ __author__ = 'Bruce Frank Wong'
 """
 
 
-from typing import Optional, Any, Dict, List, Tuple
+from typing import Optional, Any, Callable, Dict, List, Tuple
+import functools
+import os
 import os.path
 
 import pandas as pd
@@ -16,6 +18,22 @@ import numpy as np
 from . import Trend, PriceType
 
 
+def profiled() -> Callable:
+    """
+    utility.profiling.profiled 的延迟导入版本：设置 QW_PROFILER 时才导入 utility 包，
+    import analysis 不经过 utility 的 __init__。
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not os.environ.get('QW_PROFILER'):
+                return func(*args, **kwargs)
+            from QuantWorkshopTq.utility.profiling import profiled as utility_profiled
+            return utility_profiled(func.__name__)(func)(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def get_dataframe_index(df: pd.DataFrame, n: int):
     x: int
     if n < 0:
@@ -101,6 +119,7 @@ def trend_on_single_price(df: pd.DataFrame, price_type: PriceType, threshold: fl
         return key_point_list
 
 
+@profiled()
 def trend_on_hl(df: pd.DataFrame, echo: bool = False) -> tuple:
     """
     用最高价和最低价做趋势判断。
@@ -9,14 +9,15 @@ __author__ = 'Bruce Frank Wong'
 """
 
 
-from typing import Optional, Generator, List, Set
+from typing import Optional, Generator, Iterator, Dict, List, Set
 import os.path
 from datetime import datetime, date, time, timedelta
 
+import numpy as np
 import pandas as pd
 
 from QuantWorkshopTq.utility import get_application_path, load_csv, plot
-from QuantWorkshopTq.analysis import PriceType, trend_on_single_price, trend_on_hl
+from QuantWorkshopTq.analysis import PriceType, RunningStatistics, trend_on_single_price, trend_on_hl
 
 
 TQ_DATA_BEGIN = date(2016, 1, 1)
@@ -105,6 +106,121 @@ def do_analysis(csv_path: str):
     #     data[date] = pd.
 
 
+def _find_column(file_path: str, header: List[str], column: str) -> Optional[str]:
+    """
+    天勤下载的 csv 文件，列名可能带有 '合约代码.' 前缀。
+    :return: 文件中的列名，没有时为 None。
+    """
+    prefix: str = os.path.basename(file_path).split('_')[0]
+    for name in (column, ''.join([prefix, '.', column])):
+        if name in header:
+            return name
+    return None
+
+
+def _ticks_to_bar(price: np.ndarray, ticks_per_bar: int) -> pd.DataFrame:
+    """
+    每 ticks_per_bar 个 tick 合为一根 K 线，price 的长度须为 ticks_per_bar 的整数倍。
+    """
+    matrix: np.ndarray = price.reshape(-1, ticks_per_bar)
+    return pd.DataFrame({'open': matrix[:, 0],
+                         'high': matrix.max(axis=1),
+                         'low': matrix.min(axis=1),
+                         'close': matrix[:, -1]})
+
+
+def read_price_chunk(file_path: str, chunk_size: int, ticks_per_bar: int = 120) -> Iterator[pd.DataFrame]:
+    """
+    分块读取 K 线数据，仅读取 open/high/low/close 四列。
+    tick 数据（有 last_price，没有 open 列）按 last_price 每 ticks_per_bar 个 tick 合为一根 K 线，
+    块末不足一根的 tick 并入下一块，最后不足一根的单独成一根。
+    支持 csv 文件以及 parquet 列式缓存（需要 pyarrow）。
+    """
+    if ticks_per_bar <= 0:
+        raise ValueError('Parameter <ticks_per_bar> should be positive.')
+    column_list: List[str] = ['open', 'high', 'low', 'close']
+
+    price_chunk_list: Iterator[np.ndarray]
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path)
+        header: List[str] = parquet_file.schema_arrow.names
+        if all(column in header for column in column_list):
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=column_list):
+                yield batch.to_pandas()
+            return
+        if 'last_price' not in header:
+            raise ValueError(f'Neither OHLC columns nor <last_price> found in <{file_path}>.')
+        price_chunk_list = (batch.column(0).to_numpy(zero_copy_only=False).astype('float64')
+                            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=['last_price']))
+    else:
+        header = list(pd.read_csv(file_path, nrows=0).columns)
+        column_map: Dict[str, str] = {}
+        for column in column_list:
+            name: Optional[str] = _find_column(file_path, header, column)
+            if name is not None:
+                column_map[name] = column
+        if len(column_map) == len(column_list):
+            for chunk in pd.read_csv(file_path,
+                                     usecols=list(column_map.keys()),
+                                     dtype={k: 'float64' for k in column_map.keys()},
+                                     chunksize=chunk_size):
+                yield chunk.rename(columns=column_map)
+            return
+        last_price: Optional[str] = _find_column(file_path, header, 'last_price')
+        if last_price is None:
+            raise ValueError(f'Neither OHLC columns nor <last_price> found in <{file_path}>.')
+        price_chunk_list = (chunk[last_price].to_numpy()
+                            for chunk in pd.read_csv(file_path,
+                                                     usecols=[last_price],
+                                                     dtype={last_price: 'float64'},
+                                                     chunksize=chunk_size))
+
+    # tick 数据
+    carry: np.ndarray = np.empty(0)
+    for price in price_chunk_list:
+        price = np.concatenate([carry, price[~np.isnan(price)]])
+        count: int = len(price) // ticks_per_bar * ticks_per_bar
+        carry = price[count:]
+        if count:
+            yield _ticks_to_bar(price[:count], ticks_per_bar)
+    if len(carry):
+        yield _ticks_to_bar(carry, len(carry))
+
+
+def do_analysis_chunked(csv_path: str,
+                        chunk_size: int = 1_000_000,
+                        resolution: Optional[float] = None,
+                        ticks_per_bar: int = 120) -> Dict[str, RunningStatistics]:
+    """
+    do_analysis 的流式版本，用于无法一次装入内存的大文件。
+    逐块计算每根K线的 range_max / range_up / range_down，并累加到增量统计量中，
+    峰值内存只与 chunk_size 有关。
+    :param csv_path: 相对于应用目录的文件路径，csv 或 parquet，K 线或 tick 数据。
+    :param chunk_size: 每块行数。
+    :param resolution: 直方图桶宽，默认取该品种的最小变动价位（由文件名得到品种）。
+    :param ticks_per_bar: tick 数据每多少个 tick 合为一根 K 线，见 read_price_chunk。
+    :return: {列名: 统计量}
+    """
+    if resolution is None:
+        from QuantWorkshopTq.database import reference_cache
+        resolution = reference_cache.get_price_tick(os.path.basename(csv_path))
+    result: Dict[str, RunningStatistics] = {
+        'range_max': RunningStatistics(resolution),
+        'range_up': RunningStatistics(resolution),
+        'range_down': RunningStatistics(resolution),
+    }
+    for chunk in read_price_chunk(os.path.join(f'{get_application_path()}', csv_path), chunk_size, ticks_per_bar):
+        high = chunk['high'].to_numpy()
+        low = chunk['low'].to_numpy()
+        open_ = chunk['open'].to_numpy()
+        result['range_max'].update(high - low)
+        result['range_up'].update(high - open_)
+        result['range_down'].update(low - open_)
+    return result
+
+
 def do_analysis_on_daily():
     pass
 
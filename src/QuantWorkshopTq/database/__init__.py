@@ -3,29 +3,59 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from sqlalchemy import create_engine, event, MetaData, inspect
+from typing import Iterator
+from contextlib import contextmanager
+
+from sqlalchemy import MetaData, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
 
 from QuantWorkshopTq.utility import get_application_path
 
-
-@event.listens_for(Engine, 'connect')
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute('PRAGMA foreign_keys=ON')
-    cursor.close()
+from .engine import (
+    SQLITE_PROFILE,
+    get_sqlite_profile,
+    set_sqlite_profile,
+    get_database_url,
+    create_db_engine
+)
 
 
 ModelBase = declarative_base()
 
-db_engine = create_engine(f'sqlite:///{get_application_path()}/QuantWorkshop.sqlite', echo=False)
-db_session = sessionmaker(bind=db_engine)()
+db_engine = create_db_engine(get_database_url(), 'reference', echo=False)
+# 回测记录、委托单、成交记录每个事件都要提交，SQLite 同一数据库文件另用一个 backtest 连接参数的 engine，
+# 由 session 按表选择（见导入模型后的 binds）；其他数据库不区分连接参数，共用 db_engine
+db_backtest_engine = (create_db_engine(get_database_url(), 'backtest', echo=False)
+                      if db_engine.dialect.name == 'sqlite' else db_engine)
+# 提交后不使对象过期，session 关闭后仍可读取已加载的属性
+db_session_factory = sessionmaker(bind=db_engine, expire_on_commit=False)
+# 每个线程一个 session，兼容旧代码；新代码使用 session_scope
+db_session = scoped_session(db_session_factory)
 db_metadata = MetaData(bind=db_engine)
 db_inspect = inspect(db_engine)
 
 
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    一个工作单元：新建 session，正常退出时提交，发生异常时回滚，最后关闭。
+    每次调用都是独立的 session，可以在任意线程中使用。
+
+        with session_scope() as session:
+            session.add(...)
+    """
+    session: Session = db_session_factory()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 from .model import (
     Exchange,
     Holiday,
@@ -37,6 +67,12 @@ from .model import (
     BacktestTrade
 )
 
+db_session_factory.configure(binds={
+    BacktestRecord: db_backtest_engine,
+    BacktestOrder: db_backtest_engine,
+    BacktestTrade: db_backtest_engine
+})
+
 from .utility import (
     get_table_instance,
     get_table_name,
@@ -45,7 +81,8 @@ from .utility import (
     is_table_empty,
     create_table,
     create_all_tables,
-    drop_all_tables
+    drop_all_tables,
+    bulk_insert
 )
 
 from .initialize import (
@@ -55,9 +92,31 @@ from .initialize import (
     initialize_table
 )
 
+from .backtest import (
+    create_backtest_record,
+    get_run_record,
+    get_backtest_order,
+    get_backtest_order_list,
+    get_backtest_trade_list,
+    bulk_insert_backtest_order,
+    bulk_insert_backtest_trade,
+    fill_rate_by_parameter
+)
+
+from .migration import need_migration, migrate_backtest_tables
+
+from .cache import ReferenceCache, reference_cache, get_product, get_contract_spec
+
 print('Checking database:')
+# 旧版回测表的迁移会改名、删表，不在导入时执行，由 migrate.py 手动执行；迁移前不检查回测表
+legacy: bool = need_migration()
+if legacy:
+    print('Legacy backtest tables found, back up the database and run `python migrate.py`.')
 for table_name in ModelBase.metadata.tables.keys():
     print(f'Table <{table_name}> ... ', end='')
+    if legacy and table_name.startswith('backtest_'):
+        print('migration required.')
+        continue
     if db_engine.dialect.has_table(db_engine, table_name):
         print('existed. ', end='')
     else:
@@ -72,3 +131,4 @@ for table_name in ModelBase.metadata.tables.keys():
     else:
         print('OK.')
 print('Checking finished.')
+reference_cache.refresh()
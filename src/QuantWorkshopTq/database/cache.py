@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块负责基础数据（交易所、节假日、期货品种、期权、期货合约）的进程内缓存。
+
+基础数据一天最多变化一次，启动时一次读入，之后的查询都不访问数据库；数据库更新后调用 refresh()。
+策略使用的合约规格（QWContractSpec）也由这里生成并缓存。
+缓存中的对象已脱离 session，只能读取列属性，不能访问 relationship。
+"""
+
+
+from typing import Dict, List, Optional, Union
+from datetime import date
+import re
+
+from QuantWorkshopTq.define import QWContractSpec
+
+from . import session_scope
+from .model import Exchange, Holiday, Futures, Option, FuturesContract
+
+
+# 'rb'、'rb2010'、'SHFE.rb2010'、'KQ.m@SHFE.rb'、'KQ.m@SHFE.rb_minute.csv' 都取出品种代码 rb
+PATTERN_PRODUCT: re.Pattern = re.compile(r'^(?:.*@)?(?:[A-Z]+\.)?([A-Za-z]+)')
+
+
+# 期权合约，如 'DCE.c2101-C-2400'、'SHFE.cu2012C46000'、'CZCE.SR101P5000'，标的期货代码之后为看涨/看跌和行权价
+PATTERN_OPTION: re.Pattern = re.compile(r'^(?:[A-Z]+\.)?[A-Za-z]+\d+-?[CP]-?\d+')
+
+
+def is_option(symbol: str) -> bool:
+    return PATTERN_OPTION.match(symbol) is not None
+
+
+def get_product(symbol: str) -> str:
+    """
+    从合约代码中取出品种代码（小写）。
+    """
+    matched = PATTERN_PRODUCT.match(symbol)
+    if not matched:
+        raise ValueError(f'Can not get product from symbol <{symbol}>.')
+    return matched.group(1).lower()
+
+
+class ReferenceCache(object):
+    """
+    基础数据缓存。
+    """
+    _loaded: bool
+    _exchange_by_id: Dict[int, Exchange]
+    _exchange_by_symbol: Dict[str, Exchange]
+    _holiday_by_exchange_id: Dict[int, List[Holiday]]
+    _futures_by_id: Dict[int, Futures]
+    _futures_by_symbol: Dict[str, Futures]
+    _option_by_symbol: Dict[str, Option]
+    _contract_by_id: Dict[int, FuturesContract]
+    _contract_by_futures_id: Dict[int, List[FuturesContract]]     # 按上市日期排序
+    _spec_by_symbol: Dict[str, QWContractSpec]                    # 合约代码 -> 合约规格，首次查询时生成
+
+    def __init__(self):
+        self._loaded = False
+        self._exchange_by_id = {}
+        self._exchange_by_symbol = {}
+        self._holiday_by_exchange_id = {}
+        self._futures_by_id = {}
+        self._futures_by_symbol = {}
+        self._option_by_symbol = {}
+        self._contract_by_id = {}
+        self._contract_by_futures_id = {}
+        self._spec_by_symbol = {}
+
+    def refresh(self) -> None:
+        """
+        从数据库重新读入全部基础数据。
+        """
+        with session_scope() as session:
+            exchange_list: List[Exchange] = session.query(Exchange).all()
+            holiday_list: List[Holiday] = session.query(Holiday).order_by(Holiday.begin).all()
+            futures_list: List[Futures] = session.query(Futures).all()
+            option_list: List[Option] = session.query(Option).all()
+            contract_list: List[FuturesContract] = session.query(FuturesContract) \
+                .order_by(FuturesContract.listed_date).all()
+
+        # 先建好新字典再替换，其他线程不会读到一半的数据
+        holiday_by_exchange_id: Dict[int, List[Holiday]] = {}
+        for holiday in holiday_list:
+            holiday_by_exchange_id.setdefault(holiday.exchange_id, []).append(holiday)
+        contract_by_futures_id: Dict[int, List[FuturesContract]] = {}
+        for contract in contract_list:
+            contract_by_futures_id.setdefault(contract.futures_id, []).append(contract)
+
+        self._exchange_by_id = {exchange.id: exchange for exchange in exchange_list}
+        self._exchange_by_symbol = {exchange.symbol: exchange for exchange in exchange_list}
+        self._holiday_by_exchange_id = holiday_by_exchange_id
+        self._futures_by_id = {futures.id: futures for futures in futures_list}
+        self._futures_by_symbol = {futures.symbol.lower(): futures for futures in futures_list}
+        self._option_by_symbol = {option.symbol.lower(): option for option in option_list}
+        self._contract_by_id = {contract.id: contract for contract in contract_list}
+        self._contract_by_futures_id = contract_by_futures_id
+        self._spec_by_symbol = {}
+        self._loaded = True
+
+    def _check_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh()
+
+    def get_exchange(self, exchange: Union[int, str]) -> Optional[Exchange]:
+        """
+        :param exchange: 交易所 id 或代码，如 SHFE。
+        """
+        self._check_loaded()
+        if isinstance(exchange, int):
+            return self._exchange_by_id.get(exchange)
+        return self._exchange_by_symbol.get(exchange)
+
+    def get_holiday_list(self, exchange_id: int) -> List[Holiday]:
+        self._check_loaded()
+        return self._holiday_by_exchange_id.get(exchange_id, [])
+
+    def get_futures(self, symbol: Union[int, str]) -> Optional[Futures]:
+        """
+        :param symbol: 品种 id，或品种、合约代码，如 rb、SHFE.rb2010、KQ.m@SHFE.rb。
+        """
+        self._check_loaded()
+        if isinstance(symbol, int):
+            return self._futures_by_id.get(symbol)
+        return self._futures_by_symbol.get(get_product(symbol))
+
+    def get_option(self, symbol: str) -> Optional[Option]:
+        self._check_loaded()
+        return self._option_by_symbol.get(get_product(symbol))
+
+    def get_contract(self, contract_id: int) -> Optional[FuturesContract]:
+        self._check_loaded()
+        return self._contract_by_id.get(contract_id)
+
+    def get_trading_contracts(self, futures_id: int, day: date) -> List[FuturesContract]:
+        """
+        某品种在 day 当日上市交易的合约。
+        """
+        self._check_loaded()
+        return [contract for contract in self._contract_by_futures_id.get(futures_id, [])
+                if contract.listed_date <= day <= contract.expiration_date]
+
+    def _get_futures_or_raise(self, symbol: str) -> Futures:
+        # 期权的品种代码与标的期货相同，但最小变动价位等不同，数据库中没有期权的合约规格
+        if is_option(symbol):
+            raise ValueError(f'Option <{symbol}> has no contract spec in database.')
+        futures: Optional[Futures] = self.get_futures(symbol)
+        if futures is None:
+            raise ValueError(f'Futures <{symbol}> is not in database.')
+        return futures
+
+    def get_price_tick(self, symbol: str) -> float:
+        """
+        最小变动价位。
+        """
+        return self._get_futures_or_raise(symbol).fluctuation
+
+    def get_margin_rate(self, symbol: str) -> float:
+        """
+        保证金比例。
+        """
+        return self._get_futures_or_raise(symbol).margin
+
+    def get_contract_size(self, symbol: str) -> int:
+        """
+        合约乘数（每手数量）。
+        """
+        return self._get_futures_or_raise(symbol).size
+
+    def get_contract_spec(self, symbol: str) -> QWContractSpec:
+        """
+        合约规格。同一品种的合约共用一个对象，之后按合约代码直接取出。
+        :param symbol: 品种、合约代码，如 c、DCE.c2101、KQ.m@DCE.c。期权、不在期货品种表中的（如 SSE.600000）抛出 ValueError。
+        """
+        spec: Optional[QWContractSpec] = self._spec_by_symbol.get(symbol)
+        if spec is None:
+            futures: Futures = self._get_futures_or_raise(symbol)
+            product: str = futures.symbol.lower()
+            spec = self._spec_by_symbol.get(product)
+            if spec is None:
+                spec = QWContractSpec(product=product,
+                                      exchange=self.get_exchange(futures.exchange_id).symbol,
+                                      price_tick=futures.fluctuation,
+                                      multiplier=futures.size,
+                                      margin_rate=futures.margin
+                                      )
+                self._spec_by_symbol[product] = spec
+            self._spec_by_symbol[symbol] = spec
+        return spec
+
+
+reference_cache: ReferenceCache = ReferenceCache()
+
+
+def get_contract_spec(symbol: str) -> QWContractSpec:
+    return reference_cache.get_contract_spec(symbol)
@@ -8,7 +8,7 @@ from datetime import date
 
 from sqlalchemy.orm.exc import NoResultFound
 
-from . import (db_session, get_application_path)
+from . import (session_scope, get_application_path)
 from . import (
     Exchange,
     Holiday,
@@ -21,31 +21,32 @@ def initialize_exchange():
     csv_path: str = os.path.join(get_application_path(), 'database', 'csv', 'exchange.csv')
     with open(csv_path, newline='', encoding='utf-8') as csv_file:
         reader = csv.DictReader(csv_file)
-        for row in reader:
-            db_session.add(Exchange(name=row['name'], fullname=row['fullname'], symbol=row['symbol']))
-    db_session.commit()
+        with session_scope() as session:
+            for row in reader:
+                session.add(Exchange(name=row['name'], fullname=row['fullname'], symbol=row['symbol']))
 
 
 def get_exchange_id(exchange: str) -> int:
-    return db_session.query(Exchange).filter_by(symbol=exchange).one().id
+    with session_scope() as session:
+        return session.query(Exchange).filter_by(symbol=exchange).one().id
 
 
 def initialize_holiday():
     try:
-        exchange_list = db_session.query(Exchange).all()
-        csv_path: str = os.path.join(get_application_path(), 'database', 'csv', 'holiday.csv')
-        with open(csv_path, newline='', encoding='utf-8') as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                for exchange in exchange_list:
-                    db_session.add(
-                        Holiday(begin=date.fromisoformat(row['begin']),
-                                end=date.fromisoformat(row['end']),
-                                reason=row['reason'],
-                                exchange_id=exchange.id
-                                )
-                    )
-        db_session.commit()
+        with session_scope() as session:
+            exchange_list = session.query(Exchange).all()
+            csv_path: str = os.path.join(get_application_path(), 'database', 'csv', 'holiday.csv')
+            with open(csv_path, newline='', encoding='utf-8') as csv_file:
+                reader = csv.DictReader(csv_file)
+                for row in reader:
+                    for exchange in exchange_list:
+                        session.add(
+                            Holiday(begin=date.fromisoformat(row['begin']),
+                                    end=date.fromisoformat(row['end']),
+                                    reason=row['reason'],
+                                    exchange_id=exchange.id
+                                    )
+                        )
     except NoResultFound:
         print('no')
         exit(-1)
@@ -66,13 +67,13 @@ def initialize_option():
     csv_path = os.path.join(get_application_path(), 'database', 'csv', 'options.csv')
     with open(csv_path, newline='', encoding='utf-8') as csv_file:
         reader = csv.DictReader(csv_file)
-        for row in reader:
-            db_session.add(Option(name=row['name'],
-                                  symbol=row['symbol'],
-                                  exchange_id=get_exchange_id(row['exchange'])
-                                  )
-                           )
-    db_session.commit()
+        with session_scope() as session:
+            for row in reader:
+                session.add(Option(name=row['name'],
+                                   symbol=row['symbol'],
+                                   exchange_id=get_exchange_id(row['exchange'])
+                                   )
+                            )
 
 
 def initialize_futures():
@@ -80,18 +81,18 @@ def initialize_futures():
     csv_path = os.path.join(get_application_path(), 'database', 'csv', 'futures.csv')
     with open(csv_path, newline='', encoding='utf-8') as csv_file:
         reader = csv.DictReader(csv_file)
-        for row in reader:
-            db_session.add(Futures(name=row['name'],
-                                   symbol=row['symbol'],
-                                   exchange_id=get_exchange_id(row['exchange']),
-                                   contract_url=row['contract_url'],
-                                   size=row['size'],
-                                   unit=row['unit'],
-                                   margin=row['margin'],
-                                   fluctuation=row['fluctuation'],
-                                   )
-                           )
-    db_session.commit()
+        with session_scope() as session:
+            for row in reader:
+                session.add(Futures(name=row['name'],
+                                    symbol=row['symbol'],
+                                    exchange_id=get_exchange_id(row['exchange']),
+                                    contract_url=row['contract_url'],
+                                    size=row['size'],
+                                    unit=row['unit'],
+                                    margin=row['margin'],
+                                    fluctuation=row['fluctuation'],
+                                    )
+                            )
 
 
 initializer_list: dict = {
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+"""
+本模块负责数据库结构升级。
+
+旧版本为每次回测新建 backtest_record_<YYYY-MM-DD_HH-MM-SS>_order / _trade 两张表，
+现在统一保存在 backtest_order / backtest_trade 中，以 backtest_id 区分。
+
+迁移会改名、删除旧表，不在导入时自动执行，需手动运行（先备份数据库）：
+
+    python migrate.py
+"""
+
+
+from typing import Dict, List, Set
+from datetime import datetime
+import re
+
+from sqlalchemy import inspect, select, func, Table, MetaData
+from sqlalchemy.engine import Connection, Engine
+
+from . import db_engine
+from .model import BacktestRecord, BacktestOrder, BacktestTrade
+
+
+LEGACY_TABLE_PATTERN: re.Pattern = re.compile(r'^backtest_record_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})_(order|trade)$')
+LEGACY_PROTOTYPE_TABLE_LIST: List[str] = ['backtest_order_base', 'backtest_trade_base']
+LEGACY_INDEX_LIST: List[str] = ['ix_backtest_order_backtest_id_order_id']   # 已由唯一索引取代
+
+
+def _migrate_backtest_record(connection: Connection) -> None:
+    """
+    旧版 backtest_record 的列为 (id, datetime, strategy, exchange, instrument)，转为新结构，id 不变。
+    """
+    table_name_list: List[str] = inspect(connection).get_table_names()
+    if 'backtest_record' not in table_name_list:
+        BacktestRecord.__table__.create(connection)
+        return
+
+    column_set: Set[str] = {column['name'] for column in inspect(connection).get_columns('backtest_record')}
+    if 'datetime' in column_set and 'backtest_start' not in column_set:
+        connection.execute('ALTER TABLE backtest_record RENAME TO backtest_record_legacy')
+        BacktestRecord.__table__.create(connection)
+        connection.execute(
+            "INSERT INTO backtest_record (id, strategy, symbol, backtest_start, backtest_end, real_start) "
+            "SELECT id, strategy, exchange || '.' || instrument, datetime, datetime, datetime "
+            "FROM backtest_record_legacy"
+        )
+        connection.execute('DROP TABLE backtest_record_legacy')
+    elif 'parameter' not in column_set:
+        connection.execute('ALTER TABLE backtest_record ADD COLUMN parameter VARCHAR')
+
+
+def _drop_unique_index(connection: Connection, table: Table) -> None:
+    """
+    合并旧数据前删除唯一索引，去重后由 _create_missing_index() 重建。
+    """
+    index_name_set: Set[str] = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.unique and index.name in index_name_set:
+            index.drop(connection)
+
+
+def _remove_duplicates(connection: Connection) -> None:
+    """
+    同一回测中重复的 order_id / trade_id 只保留 id 最小的一行，成交记录改为指向保留的委托单。
+    """
+    connection.execute(
+        'UPDATE backtest_trade SET backtest_order_id = ('
+        'SELECT MIN(o2.id) FROM backtest_order AS o1 JOIN backtest_order AS o2 '
+        'ON o2.backtest_id = o1.backtest_id AND o2.order_id = o1.order_id '
+        'WHERE o1.id = backtest_trade.backtest_order_id) '
+        'WHERE backtest_order_id IN (SELECT id FROM backtest_order) '
+        'AND backtest_order_id NOT IN (SELECT MIN(id) FROM backtest_order GROUP BY backtest_id, order_id)'
+    )
+    for table_name, column_name in [('backtest_order', 'order_id'), ('backtest_trade', 'trade_id')]:
+        removed: int = connection.execute(
+            f'DELETE FROM {table_name} WHERE id NOT IN '
+            f'(SELECT MIN(id) FROM {table_name} GROUP BY backtest_id, {column_name})'
+        ).rowcount
+        if removed:
+            print(f'Table <{table_name}>: {removed} duplicated row(s) removed.')
+
+
+def _create_missing_index(connection: Connection, table: Table) -> None:
+    index_name_set: Set[str] = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in index_name_set:
+            continue
+        if index.unique:
+            # 去重后仍有重复数据时无法建立唯一索引，保留旧数据，提示手动处理。
+            column_list = list(index.columns)
+            duplicated = connection.execute(
+                select(column_list).group_by(*column_list).having(func.count() > 1).limit(1)
+            ).first()
+            if duplicated is not None:
+                print(f'Table <{table.name}> has duplicated {tuple(c.name for c in column_list)}: '
+                      f'{tuple(duplicated)}, unique index <{index.name}> not created.')
+                continue
+        index.create(connection)
+
+
+def _drop_legacy_index(connection: Connection, table: Table) -> None:
+    index_name_set: Set[str] = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    # 唯一索引未能建立时，保留旧索引
+    if not all(index.name in index_name_set for index in table.indexes if index.unique):
+        return
+    for index_name in LEGACY_INDEX_LIST:
+        if index_name in index_name_set:
+            connection.execute(f'DROP INDEX {index_name}')
+
+
+def _get_backtest_id(connection: Connection, dt: datetime) -> int:
+    record_table: Table = BacktestRecord.__table__
+    backtest_id = connection.execute(
+        select([record_table.c.id]).where(record_table.c.real_start == dt)
+    ).scalar()
+    if backtest_id is None:
+        backtest_id = connection.execute(
+            record_table.insert().values(strategy='unknown',
+                                         symbol='unknown',
+                                         backtest_start=dt,
+                                         backtest_end=dt,
+                                         real_start=dt)
+        ).inserted_primary_key[0]
+    return backtest_id
+
+
+def _migrate_legacy_backtest(connection: Connection, dt: datetime, order_table: Table, trade_table: Table) -> None:
+    backtest_id: int = _get_backtest_id(connection, dt)
+    order_column_list: List[str] = [c.name for c in BacktestOrder.__table__.columns
+                                    if c.name in order_table.c and c.name != 'id']
+    trade_column_list: List[str] = [c.name for c in BacktestTrade.__table__.columns
+                                    if c.name in trade_table.c and c.name != 'id']
+
+    order_row_list: List[dict] = [
+        dict({name: row[name] for name in order_column_list}, backtest_id=backtest_id)
+        for row in connection.execute(select([order_table]))
+    ]
+    if order_row_list:
+        connection.execute(BacktestOrder.__table__.insert(), order_row_list)
+
+    # 旧成交记录表没有 backtest_order_id，通过 order_id 找回；order_id 重复时取 id 最小的，与去重时保留的一致
+    order_id_map: Dict[str, int] = {
+        row.order_id: row.id for row in connection.execute(
+            select([BacktestOrder.__table__.c.id, BacktestOrder.__table__.c.order_id])
+            .where(BacktestOrder.__table__.c.backtest_id == backtest_id)
+            .order_by(BacktestOrder.__table__.c.id.desc())
+        )
+    }
+    trade_row_list: List[dict] = []
+    for row in connection.execute(select([trade_table])):
+        if row['order_id'] not in order_id_map:
+            print(f'成交记录 <{row["trade_id"]}> 找不到委托单 <{row["order_id"]}>，未迁移。')
+            continue
+        trade_row_list.append(dict({name: row[name] for name in trade_column_list},
+                                   backtest_id=backtest_id,
+                                   backtest_order_id=order_id_map[row['order_id']]))
+    if trade_row_list:
+        connection.execute(BacktestTrade.__table__.insert(), trade_row_list)
+
+    order_table.drop(connection)
+    trade_table.drop(connection)
+
+
+def _find_legacy_tables(connection: Connection) -> Dict[str, Dict[str, str]]:
+    """
+    :return: {回测时间戳: {'order' / 'trade': 表名}}
+    """
+    legacy_dict: Dict[str, Dict[str, str]] = {}
+    for table_name in inspect(connection).get_table_names():
+        matched = LEGACY_TABLE_PATTERN.match(table_name)
+        if matched:
+            legacy_dict.setdefault(matched.group(1), {})[matched.group(2)] = table_name
+    return legacy_dict
+
+
+def need_migration(engine: Engine = db_engine) -> bool:
+    """
+    是否还有旧版的回测表或旧结构的 backtest_record。
+    """
+    with engine.connect() as connection:
+        if _find_legacy_tables(connection):
+            return True
+        if 'backtest_record' not in inspect(connection).get_table_names():
+            return False
+        column_set: Set[str] = {column['name'] for column in inspect(connection).get_columns('backtest_record')}
+        return 'parameter' not in column_set
+
+
+def migrate_backtest_tables(engine: Engine = db_engine) -> int:
+    """
+    把旧版每次回测单独建立的委托单、成交记录表并入 backtest_order / backtest_trade，并删除旧表。
+    同时补齐 backtest_record.parameter 列和各索引（包括按回测唯一的 order_id / trade_id）。可以重复执行。
+    旧数据中同一回测的 order_id / trade_id 可能重复，先合并、去重，再建立唯一索引。
+    :return: 迁移的回测次数。
+    """
+    count: int = 0
+    with engine.begin() as connection:
+        _migrate_backtest_record(connection)
+        BacktestOrder.__table__.create(connection, checkfirst=True)
+        BacktestTrade.__table__.create(connection, checkfirst=True)
+
+        table_name_list: List[str] = inspect(connection).get_table_names()
+        legacy_dict: Dict[str, Dict[str, str]] = _find_legacy_tables(connection)
+        if legacy_dict:
+            _drop_unique_index(connection, BacktestOrder.__table__)
+            _drop_unique_index(connection, BacktestTrade.__table__)
+
+        metadata: MetaData = MetaData()
+        for stamp, table_dict in sorted(legacy_dict.items()):
+            if 'order' not in table_dict or 'trade' not in table_dict:
+                print(f'回测 <{stamp}> 的委托单表或成交记录表缺失，未迁移。')
+                continue
+            _migrate_legacy_backtest(connection,
+                                     datetime.strptime(stamp, '%Y-%m-%d_%H-%M-%S'),
+                                     Table(table_dict['order'], metadata, autoload_with=connection),
+                                     Table(table_dict['trade'], metadata, autoload_with=connection))
+            count += 1
+
+        # 旧版的原型表，为空时删除
+        for table_name in LEGACY_PROTOTYPE_TABLE_LIST:
+            if table_name in table_name_list:
+                table = Table(table_name, metadata, autoload_with=connection)
+                if connection.execute(select([table]).limit(1)).first() is None:
+                    table.drop(connection)
+
+        _remove_duplicates(connection)
+        _create_missing_index(connection, BacktestOrder.__table__)
+        _create_missing_index(connection, BacktestTrade.__table__)
+        _drop_legacy_index(connection, BacktestOrder.__table__)
+    return count
@@ -7,9 +7,14 @@ from typing import Dict, List
 from datetime import date
 
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, ForeignKey, String, Integer, Float, Date, DateTime
+from sqlalchemy import Column, ForeignKey, Index, String, Integer, Float, Date, DateTime
 
-from . import ModelBase, db_session
+from . import ModelBase
+
+
+def get_exchange_symbol(exchange_id: int) -> str:
+    from .cache import reference_cache
+    return reference_cache.get_exchange(exchange_id).symbol
 
 
 class Exchange(ModelBase):
@@ -36,10 +41,9 @@ class Exchange(ModelBase):
     def get_holiday_by_year(self, year: int) -> list:
         if year <= 2000 or year > date.today().year:
             raise ValueError('Parameter <year> should be in [2001, Current Year]')
-        return db_session.query(Holiday).filter(Holiday.exchange_id == self.id,
-                                                Holiday.begin >= date(year, 1, 1),
-                                                Holiday.begin <= date(year+1, 1, 1)
-                                                ).all()
+        from .cache import reference_cache
+        return [holiday for holiday in reference_cache.get_holiday_list(self.id)
+                if date(year, 1, 1) <= holiday.begin <= date(year+1, 1, 1)]
 
     def __repr__(self):
         return f'<Exchange(name={self.name}, fullname={self.fullname}, abbr={self.symbol})>'
@@ -58,7 +62,7 @@ class Holiday(ModelBase):
     exchange = relationship('Exchange', back_populates='holiday_list')
 
     def __repr__(self):
-        return f'<Holiday(name={self.name}, fullname={self.fullname}, abbr={self.symbol})>'
+        return f'<Holiday(begin={self.begin}, end={self.end}, reason={self.reason})>'
 
 
 class Stock(ModelBase):
@@ -71,7 +75,7 @@ class Stock(ModelBase):
 
     def __repr__(self):
         return f'<Stock(name={self.name},' \
-               f'exchange={db_session.query(Exchange).filter_by(id=self.exchange_id).one().symbol},' \
+               f'exchange={get_exchange_symbol(self.exchange_id)},' \
                f'symbol={self.symbol})>'
 
 
@@ -93,14 +97,12 @@ class Futures(ModelBase):
     main_contract_list = relationship('FuturesMainContract', back_populates='futures')
 
     @property
-    def trading_contracts(self) -> List[str]:
+    def trading_contracts(self) -> List['FuturesContract']:
         return self.trading_contracts_at(date.today())
 
-    def trading_contracts_at(self, day: date) -> List[str]:
-        return db_session.query(FuturesContract).filter(FuturesContract.futures_id == self.id,
-                                                        FuturesContract.listed_date >= day,
-                                                        FuturesContract.expiration_date <= day
-                                                        ).all()
+    def trading_contracts_at(self, day: date) -> List['FuturesContract']:
+        from .cache import reference_cache
+        return reference_cache.get_trading_contracts(self.id, day)
 
     @property
     def contract_size(self) -> str:
@@ -108,7 +110,7 @@ class Futures(ModelBase):
 
     def __repr__(self):
         return f'<Futures(name={self.name},' \
-               f'exchange={db_session.query(Exchange).filter_by(id=self.exchange_id).one().symbol},' \
+               f'exchange={get_exchange_symbol(self.exchange_id)},' \
                f'symbol={self.symbol})>'
 
 
@@ -132,7 +134,7 @@ class Option(ModelBase):
 
     def __repr__(self):
         return f'<Option(name={self.name},' \
-               f'exchange={db_session.query(Exchange).filter_by(id=self.exchange_id).one().symbol},' \
+               f'exchange={get_exchange_symbol(self.exchange_id)},' \
                f'symbol={self.symbol})>'
 
 
@@ -176,13 +178,14 @@ class FuturesMainContract(ModelBase):
 
     id = Column(Integer, primary_key=True)
     datetime = Column(DateTime, nullable=False)
-    futures_id = Column(Integer, ForeignKey='futures.id', nullable=False)
-    contract_id = Column(Integer, ForeignKey='futures_contract.id', nullable=False)
+    futures_id = Column(Integer, ForeignKey('futures.id'), nullable=False)
+    contract_id = Column(Integer, ForeignKey('futures_contract.id'), nullable=False)
 
     futures = relationship('Futures', back_populates='main_contract_list')
 
     def get_contract(self) -> FuturesContract:
-        return db_session.query(FuturesContract).filter_by(id=self.contract_id).one()
+        from .cache import reference_cache
+        return reference_cache.get_contract(self.contract_id)
 
 
 class BacktestRecord(ModelBase):
@@ -198,20 +201,26 @@ class BacktestRecord(ModelBase):
     backtest_end = Column(DateTime, nullable=False)
     real_start = Column(DateTime, nullable=False)
     real_end = Column(DateTime)
+    parameter = Column(String)      # 策略参数，JSON
 
     order_list = relationship('BacktestOrder', back_populates='backtest')
     trade_list = relationship('BacktestTrade', back_populates='backtest')
 
-    @property
-    def backtest_id(self) -> str:
-        return f'backtest_record_{self.datetime.strftime("%Y-%m-%d_%H-%M-%S")}'
-
     def __repr__(self):
-        return f'<Backtest({self.strategy} on: {self.symbol}, at: {self.datetime}, record: {self.backtest_id})>'
+        return f'<Backtest({self.strategy} on: {self.symbol}, at: {self.real_start}, record: {self.id})>'
 
 
 class BacktestOrder(ModelBase):
+    """
+    回测委托单，所有回测共用一张表，以 backtest_id 区分。
+    """
     __tablename__ = 'backtest_order'
+    __table_args__ = (
+        Index('uq_backtest_order_backtest_id_order_id', 'backtest_id', 'order_id', unique=True),
+        Index('ix_backtest_order_backtest_id_status', 'backtest_id', 'status'),
+        Index('ix_backtest_order_backtest_id_insert_datetime',
+              'backtest_id', 'insert_datetime', 'volume_orign', 'volume_left'),
+    )
 
     id = Column(Integer, primary_key=True)
     insert_datetime = Column(DateTime, nullable=False)
@@ -235,7 +244,15 @@ class BacktestOrder(ModelBase):
 
 
 class BacktestTrade(ModelBase):
+    """
+    回测成交记录，所有回测共用一张表，以 backtest_id 区分。
+    """
     __tablename__ = 'backtest_trade'
+    __table_args__ = (
+        Index('uq_backtest_trade_backtest_id_trade_id', 'backtest_id', 'trade_id', unique=True),
+        Index('ix_backtest_trade_backtest_id_order_id', 'backtest_id', 'order_id'),
+        Index('ix_backtest_trade_backtest_id_datetime', 'backtest_id', 'datetime', 'price', 'volume'),
+    )
 
     id = Column(Integer, primary_key=True)
     order_id = Column(String, nullable=False)   # 委托单ID
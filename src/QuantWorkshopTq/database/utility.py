@@ -3,12 +3,15 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from typing import Union
-import csv
+from typing import Any, List, Union
+import io
 import os.path
 
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+
 from QuantWorkshopTq.utility import get_application_path
-from . import (ModelBase, db_engine, db_session, db_metadata, db_inspect)
+from . import (ModelBase, db_engine, db_metadata, db_inspect, session_scope)
 
 
 def get_table_instance(table_name: str) -> ModelBase:
@@ -39,7 +42,8 @@ def is_table_empty(table: Union[ModelBase, str]) -> bool:
         table_instance = ModelBase.metadata.tables.get(table)
     else:
         table_instance = table
-    return False if db_session.query(table_instance).first() else True
+    with session_scope() as session:
+        return False if session.query(table_instance).first() else True
     # table_name: str
     # if isinstance(table, str):
     #     table_name = table
@@ -62,3 +66,55 @@ def create_all_tables(drop: bool = False):
 def drop_all_tables():
     ModelBase.metadata.drop_all(db_engine)
     db_metadata.reflect(db_engine)
+
+
+# COPY 中表示 NULL 的字段，不加引号；字符串一律加引号，不会与之混淆
+COPY_NULL: str = r'\N'
+
+
+def _copy_field(value: Any) -> str:
+    """
+    一个值在 COPY (FORMAT csv) 中的写法。
+    """
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, (bool, int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def bulk_insert(table: Union[ModelBase, Table], row_list: List[dict], engine: Engine = db_engine) -> int:
+    """
+    批量写入，用于回测结束后一次写入全部委托单、成交记录。
+    PostgreSQL 使用 COPY，其他数据库使用 executemany。
+    :param table: 模型类或 Table。
+    :param row_list: [{列名: 值}]，各行的列须一致。
+    :return: 写入行数。
+    """
+    if not row_list:
+        return 0
+    if not isinstance(table, Table):
+        table = table.__table__
+    column_list: List[str] = list(row_list[0].keys())
+
+    if engine.dialect.name == 'postgresql':
+        # None 写为不加引号的 \N，以 NULL '\N' 读为 NULL；空字符串写为 ""，仍是空字符串
+        buffer: io.StringIO = io.StringIO()
+        for row in row_list:
+            buffer.write(','.join([_copy_field(row[column]) for column in column_list]))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(f'COPY {table.name} ({", ".join(column_list)}) FROM STDIN '
+                               f"WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+            cursor.close()
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        with engine.begin() as connection:
+            connection.execute(table.insert(), row_list)
+    return len(row_list)
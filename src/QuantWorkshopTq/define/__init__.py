@@ -16,9 +16,13 @@ from .types import (
     evening, morning, afternoon
 )
 from .types import (
-    tz_beijing, tz_settlement
+    tz_beijing, tz_settlement, get_trading_day
 )
 
-from .order import QWOrder, QWOrderManager
+from .order import QWOrder, QWOrderRecord, QWOrderManager
+
+from .contract import QWContractSpec
+
+from .ladder import QWPriceLadder, QWSparsePriceLadder, create_price_ladder
 
 from .position import QWPosition, QWPositionManager
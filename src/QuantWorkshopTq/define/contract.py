@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+from decimal import Decimal
+import math
+
+
+# 没有合约规格时（如未知品种）换算整数价格用的最小变动价位，不小于 0.001 的最小变动价位都能精确比较
+FALLBACK_PRICE_TICK: float = 0.001
+
+
+class QWContractSpec(object):
+    """
+    合约规格（品种级别）：最小变动价位、合约乘数、保证金比例。
+    构造时预先算好每跳盈亏、价格精度，之后只做四则运算。
+    """
+    product: str                # 品种代码，小写
+    exchange: str               # 交易所代码
+    price_tick: float           # 最小变动价位
+    multiplier: int             # 合约乘数（每手数量）
+    margin_rate: float          # 保证金比例
+    pnl_per_tick: float         # 每手每跳盈亏 = 最小变动价位 × 合约乘数
+    _decimals: int              # 价格小数位数
+
+    def __init__(self, product: str, exchange: str, price_tick: float, multiplier: int, margin_rate: float):
+        if price_tick <= 0:
+            raise ValueError(f'Parameter <price_tick> of <{product}> should be positive.')
+        self.product = product
+        self.exchange = exchange
+        self.price_tick = price_tick
+        self.multiplier = multiplier
+        self.margin_rate = margin_rate
+        self.pnl_per_tick = price_tick * multiplier
+        self._decimals = max(-Decimal(str(price_tick)).normalize().as_tuple().exponent, 0)
+
+    def round_price(self, price: float) -> float:
+        """
+        取最接近的有效价格（最小变动价位的整数倍）。
+        """
+        return round(round(price / self.price_tick) * self.price_tick, self._decimals)
+
+    def floor_price(self, price: float) -> float:
+        """
+        向下取有效价格，用于买价。
+        """
+        return round(math.floor(price / self.price_tick + 1e-9) * self.price_tick, self._decimals)
+
+    def ceil_price(self, price: float) -> float:
+        """
+        向上取有效价格，用于卖价。
+        """
+        return round(math.ceil(price / self.price_tick - 1e-9) * self.price_tick, self._decimals)
+
+    def add_ticks(self, price: float, ticks: int) -> float:
+        """
+        price 加（减）ticks 跳后的价格。
+        """
+        return round(price + ticks * self.price_tick, self._decimals)
+
+    def to_tick(self, price: float) -> int:
+        """
+        整数价格：价格折合为最小变动价位的倍数。策略内部按整数价格索引、比较，只在与天勤交互时换回 float。
+        """
+        return round(price / self.price_tick)
+
+    def from_tick(self, tick: int) -> float:
+        """
+        整数价格换回价格。
+        """
+        return round(tick * self.price_tick, self._decimals)
+
+    def to_ticks(self, spread: float) -> int:
+        """
+        价差折合跳数。
+        """
+        return round(spread / self.price_tick)
+
+    def margin_per_lot(self, price: float) -> float:
+        """
+        每手保证金 = 价格 × 合约乘数 × 保证金比例。
+        """
+        return price * self.multiplier * self.margin_rate
+
+    def max_lots(self, capital: float, price: float) -> int:
+        """
+        capital 最多可开的手数。
+        """
+        margin: float = self.margin_per_lot(price)
+        return math.floor(capital / margin) if margin > 0 else 0
+
+    def pnl(self, open_price: float, close_price: float, lots: int, is_long: bool = True) -> float:
+        """
+        平仓盈亏。
+        """
+        ticks: int = self.to_ticks(close_price - open_price)
+        return (ticks if is_long else -ticks) * lots * self.pnl_per_tick
+
+    def __repr__(self):
+        return f'<QWContractSpec({self.exchange}.{self.product}, tick={self.price_tick}, ' \
+               f'multiplier={self.multiplier}, margin_rate={self.margin_rate})>'
+
+
+_fallback_spec: QWContractSpec = QWContractSpec('', '', FALLBACK_PRICE_TICK, 1, 0.0)
+
+
+def get_fallback_spec() -> QWContractSpec:
+    """
+    没有合约规格时用于换算整数价格。
+    """
+    return _fallback_spec
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+from typing import Dict, List, Optional, Tuple, Union
+
+
+class QWPriceLadder(object):
+    """价位数组
+    以整数价格（跳，见 QWContractSpec.to_tick）为下标记录各价位的手数，增减、查询都是数组下标操作。
+    同时维护手数不为零的最高、最低价位，只有最高（最低）价位清零时才向内逐个查找。
+    下标范围不够时自动扩大（加倍）。
+    """
+    _base: Optional[int]        # 下标 0 对应的整数价格，第一次 add 时以该价格为中心确定
+    _lots: List[int]            # 各价位手数
+    _low: int                   # 手数不为零的最低下标，没有时 _low > _high
+    _high: int                  # 手数不为零的最高下标
+
+    def __init__(self, size: int = 256) -> None:
+        self._base = None
+        self._lots = [0] * size
+        self._low = size
+        self._high = -1
+
+    def _grow(self, tick: int) -> None:
+        size: int = len(self._lots)
+        if self._base is None:
+            self._base = tick - size // 2
+            return
+        low: int = min(self._base, tick)
+        high: int = max(self._base + size, tick + 1)
+        new_size: int = size
+        while new_size < high - low:
+            new_size *= 2
+        # 新范围两侧留出余量
+        new_base: int = low - (new_size - (high - low)) // 2
+        offset: int = self._base - new_base
+        self._lots = [0] * offset + self._lots + [0] * (new_size - size - offset)
+        self._base = new_base
+        if self._low <= self._high:
+            self._low += offset
+            self._high += offset
+        else:
+            self._low = new_size
+            self._high = -1
+
+    def add(self, tick: int, lots: int) -> int:
+        """
+        :return: 该价位增减后的手数。
+        """
+        if self._base is None or not 0 <= tick - self._base < len(self._lots):
+            self._grow(tick)
+        i: int = tick - self._base
+        value: int = self._lots[i] + lots
+        self._lots[i] = value
+        if value:
+            if i < self._low:
+                self._low = i
+            if i > self._high:
+                self._high = i
+        else:
+            if i == self._low:
+                while self._low <= self._high and not self._lots[self._low]:
+                    self._low += 1
+            if i == self._high:
+                while self._high >= self._low and not self._lots[self._high]:
+                    self._high -= 1
+            if self._low > self._high:
+                self._low = len(self._lots)
+                self._high = -1
+        return value
+
+    def at(self, tick: int) -> int:
+        if self._base is None:
+            return 0
+        i: int = tick - self._base
+        if 0 <= i < len(self._lots):
+            return self._lots[i]
+        return 0
+
+    def highest(self) -> Optional[int]:
+        """
+        手数不为零的最高价位，没有时为 None。
+        """
+        return self._base + self._high if self._high >= 0 else None
+
+    def lowest(self) -> Optional[int]:
+        """
+        手数不为零的最低价位，没有时为 None。
+        """
+        return self._base + self._low if self._high >= 0 else None
+
+    def items(self) -> List[Tuple[int, int]]:
+        """
+        手数不为零的价位，[(整数价格, 手数), ...]，由低到高。
+        """
+        if self._high < 0:
+            return []
+        return [(self._base + i, self._lots[i]) for i in range(self._low, self._high + 1) if self._lots[i]]
+
+    def total(self) -> int:
+        return sum(self._lots[self._low:self._high + 1]) if self._high >= 0 else 0
+
+    def clear(self) -> None:
+        self._lots = [0] * len(self._lots)
+        self._low = len(self._lots)
+        self._high = -1
+
+
+class QWSparsePriceLadder(object):
+    """稀疏价位表
+    接口与 QWPriceLadder 相同，以字典记录手数不为零的价位，用于没有合约规格（按 get_fallback_spec 的最小跳换算）时：
+    整数价格很大、价位之间相隔很多跳，数组下标范围会过大。
+    最高（最低）价位清零时在剩余价位中重新查找。
+    """
+    _lots: Dict[int, int]       # 整数价格 -> 手数，只保存不为零的价位
+    _low: Optional[int]         # 手数不为零的最低价位
+    _high: Optional[int]        # 手数不为零的最高价位
+
+    def __init__(self) -> None:
+        self._lots = {}
+        self._low = None
+        self._high = None
+
+    def add(self, tick: int, lots: int) -> int:
+        """
+        :return: 该价位增减后的手数。
+        """
+        value: int = self._lots.get(tick, 0) + lots
+        if value:
+            self._lots[tick] = value
+            if self._low is None or tick < self._low:
+                self._low = tick
+            if self._high is None or tick > self._high:
+                self._high = tick
+        else:
+            self._lots.pop(tick, None)
+            if tick == self._low:
+                self._low = min(self._lots) if self._lots else None
+            if tick == self._high:
+                self._high = max(self._lots) if self._lots else None
+        return value
+
+    def at(self, tick: int) -> int:
+        return self._lots.get(tick, 0)
+
+    def highest(self) -> Optional[int]:
+        """
+        手数不为零的最高价位，没有时为 None。
+        """
+        return self._high
+
+    def lowest(self) -> Optional[int]:
+        """
+        手数不为零的最低价位，没有时为 None。
+        """
+        return self._low
+
+    def items(self) -> List[Tuple[int, int]]:
+        """
+        手数不为零的价位，[(整数价格, 手数), ...]，由低到高。
+        """
+        return sorted(self._lots.items())
+
+    def total(self) -> int:
+        return sum(self._lots.values())
+
+    def clear(self) -> None:
+        self._lots = {}
+        self._low = None
+        self._high = None
+
+
+def create_price_ladder(exact_tick: bool = True) -> Union[QWPriceLadder, QWSparsePriceLadder]:
+    """
+    :param exact_tick: 是否按合约的最小变动价位换算整数价格；否（没有合约规格）时用稀疏价位表。
+    """
+    return QWPriceLadder() if exact_tick else QWSparsePriceLadder()
@@ -3,12 +3,14 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from typing import Dict, List, Tuple, NewType
+from typing import Dict, List, Optional, Tuple, NewType, Union
 from datetime import datetime, date
 
 from tqsdk.objs import Order
 
 from . import QWDirection, QWOffset, QWOrderStatus
+from .contract import QWContractSpec, get_fallback_spec
+from .ladder import QWPriceLadder, QWSparsePriceLadder, create_price_ladder
 
 
 class QWOrder(object):
@@ -74,6 +76,42 @@ class QWOrder(object):
         self._lots = tq_order.volume_orign
 
 
+class QWOrderRecord(object):
+    """委托单记录
+    tqsdk.objs.Order 中策略用到的字段，用于状态保存和恢复；恢复后可以代替 Order 交给 QWOrderManager、RiskGate。
+    """
+    __slots__ = ('order_id', 'exchange_id', 'direction', 'offset',
+                 'limit_price', 'volume_orign', 'volume_left', 'status')
+    order_id: str
+    exchange_id: str
+    direction: str
+    offset: str
+    limit_price: float
+    volume_orign: int
+    volume_left: int
+    status: str
+
+    def __init__(self, order_id: str, exchange_id: str, direction: str, offset: str,
+                 limit_price: float, volume_orign: int, volume_left: int, status: str):
+        self.order_id = order_id
+        self.exchange_id = exchange_id
+        self.direction = direction
+        self.offset = offset
+        self.limit_price = limit_price
+        self.volume_orign = volume_orign
+        self.volume_left = volume_left
+        self.status = status
+
+    @classmethod
+    def from_order(cls, order: Order) -> 'QWOrderRecord':
+        return cls(order.order_id, order.exchange_id, order.direction, order.offset,
+                   order.limit_price, order.volume_orign, order.volume_left, order.status)
+
+    def to_list(self) -> list:
+        return [self.order_id, self.exchange_id, self.direction, self.offset,
+                self.limit_price, self.volume_orign, self.volume_left, self.status]
+
+
 class QWOrderManager(object):
     """委托单管理器
     所谓盈亏，即已完成平仓的委托单，其开平点差。
@@ -83,38 +121,60 @@ class QWOrderManager(object):
     对委托单进行分类：
         交易流程——开仓单、平仓单、完结单（已平仓的委托单）
         交易状态——未成交、部分成交、完全成交、已撤销
+
+    价格按整数价格（跳）索引，只在返回价格时换回 float。
     """
+    _contract_spec: QWContractSpec      # 用于换算整数价格，没有合约规格时见 get_fallback_spec
+    _has_spec: bool                     # 是否给出了合约规格，否则价位表为稀疏价位表
     _order_dict: Dict[str, Order]
     _unfilled_order_list: List[str]     # 未成交委托单，包括开仓单和平仓单
     _position_order_list: List[str]     # 未平仓委托单（所以持仓）
     _finished_order_list: List[str]     # 完结委托单
     _canceled_order_list: List[str]     # 已撤销委托单
     _paired_order_dict: Dict[str, str]  # 配对委托单
-    _unfilled_order_price_dict: Dict[float, List[str]]      # 未成交委托单的价格索引
+    _unfilled_order_price_dict: Dict[int, List[str]]        # 未成交委托单的价格索引，整数价格 -> unique_id
+    _buy_ladder: Union[QWPriceLadder, QWSparsePriceLadder]      # 未成交买单各价位手数
+    _sell_ladder: Union[QWPriceLadder, QWSparsePriceLadder]     # 未成交卖单各价位手数
 
-    def __init__(self) -> None:
+    def __init__(self, contract_spec: Optional[QWContractSpec] = None) -> None:
+        self._contract_spec = contract_spec if contract_spec is not None else get_fallback_spec()
+        self._has_spec = contract_spec is not None
         self._order_dict = {}
         self._finished_order_list = []
         self._position_order_list = []
         self._unfilled_order_list = []
         self._canceled_order_list = []
         self._unfilled_order_price_dict = {}
+        self._buy_ladder = create_price_ladder(self._has_spec)
+        self._sell_ladder = create_price_ladder(self._has_spec)
 
     @staticmethod
     def _make_unique_id(order: Order) -> str:
         """生成唯一的委托单编号
-        日期 + 交易所 + 交易所编号，即 YYYY-MM-DD_{e}_{order_id}
-        其中 e 代表:
-            S, 上期所
-            D, 大商所
-            Z, 郑商所
-            C, 中金所
-            E, 能源所
+        日期 + 交易所 + 委托单编号，即 YYYY-MM-DD_{exchange_id}_{order_id}
+        order_id 在 insert_order 时即已生成，exchange_order_id 要等交易所回报后才有，
+        不能用作编号，否则同一委托单在回报前后的编号不同。
         """
-        if len(order.exchange_order_id) > 0:
-            return date.today().isoformat() + '_' + order.exchange_id + '_' + order.exchange_order_id
+        return date.today().isoformat() + '_' + order.exchange_id + '_' + order.order_id
+
+    def _add_unfilled(self, unique_id: str, order: Order) -> None:
+        tick: int = self._contract_spec.to_tick(order.limit_price)
+        self._unfilled_order_price_dict.setdefault(tick, []).append(unique_id)
+        (self._buy_ladder if order.direction == 'BUY' else self._sell_ladder).add(tick, order.volume_orign)
+
+    def _remove_unfilled(self, unique_id: str, order: Order) -> None:
+        tick: int = self._contract_spec.to_tick(order.limit_price)
+        id_list: List[str] = self._unfilled_order_price_dict[tick]
+        if len(id_list) > 1:
+            id_list.remove(unique_id)
         else:
-            return date.today().isoformat() + '_' + order.exchange_id + '_' + order.order_id
+            del self._unfilled_order_price_dict[tick]
+        (self._buy_ladder if order.direction == 'BUY' else self._sell_ladder).add(tick, -order.volume_orign)
+
+    def is_unfilled(self, order: Order) -> bool:
+        """是否为本管理器中的未成交委托单
+        """
+        return self._make_unique_id(order) in self._unfilled_order_list
 
     def add(self, order: Order) -> None:
         """增加一张委托单
@@ -129,10 +189,7 @@ class QWOrderManager(object):
         self._unfilled_order_list.append(unique_id)
 
         # 在 order_price_dict 中增加记录
-        if order.limit_price in self._unfilled_order_price_dict.keys():
-            self._unfilled_order_price_dict[order.limit_price].append(unique_id)
-        else:
-            self._unfilled_order_price_dict[order.limit_price] = [unique_id]
+        self._add_unfilled(unique_id, order)
 
     def fill(self, order: Order) -> None:
         """成交一张委托单
@@ -150,10 +207,7 @@ class QWOrderManager(object):
                 print(item)
 
         # 在 order_price_dict 中去除记录
-        if len(self._unfilled_order_price_dict[order.limit_price]) > 1:
-            self._unfilled_order_price_dict[order.limit_price].remove(unique_id)
-        else:
-            del self._unfilled_order_price_dict[order.limit_price]
+        self._remove_unfilled(unique_id, order)
 
         # 如果 order 是平仓单，在 finished_order_list 中增加记录；否则在 position_order_list 中增加记录。
         if order.offset == 'CLOSE' or order.offset == 'CLOSETODAY':
@@ -171,10 +225,7 @@ class QWOrderManager(object):
         self._unfilled_order_list.remove(unique_id)
 
         # 在 order_price_dict 中去除记录
-        if len(self._unfilled_order_price_dict[order.limit_price]) > 1:
-            self._unfilled_order_price_dict[order.limit_price].remove(unique_id)
-        else:
-            del self._unfilled_order_price_dict[order.limit_price]
+        self._remove_unfilled(unique_id, order)
 
         # 在 canceled_order_list 中增加记录
         self._canceled_order_list.append(unique_id)
@@ -247,57 +298,46 @@ class QWOrderManager(object):
                 lots += order.volume_orign
         return lots
 
+    def _to_price(self, tick: Optional[int]) -> Optional[float]:
+        return self._contract_spec.from_tick(tick) if tick is not None else None
+
     @property
-    def highest_price(self) -> float:
+    def highest_price(self) -> Optional[float]:
         """最高价
         """
-        return max(self._unfilled_order_price_dict.keys())
+        tick_list: List[int] = [tick for tick in (self._buy_ladder.highest(), self._sell_ladder.highest())
+                                if tick is not None]
+        return self._to_price(max(tick_list)) if tick_list else None
 
     @property
-    def lowest_price(self) -> float:
+    def lowest_price(self) -> Optional[float]:
         """最低价
         """
-        return min(self._unfilled_order_price_dict.keys())
+        tick_list: List[int] = [tick for tick in (self._buy_ladder.lowest(), self._sell_ladder.lowest())
+                                if tick is not None]
+        return self._to_price(min(tick_list)) if tick_list else None
 
     @property
-    def lowest_bid_price(self) -> float:
+    def lowest_bid_price(self) -> Optional[float]:
         """最低买价
         """
-        unique_id: str
-        price_list: list = list(self._unfilled_order_price_dict.keys())
-        price_list.sort(reverse=False)
-        for price in price_list:
-            for unique_id in self._unfilled_order_price_dict[price]:
-                if self._order_dict[unique_id].direction == 'BUY':
-                    return price
+        return self._to_price(self._buy_ladder.lowest())
 
     @property
-    def highest_ask_price(self) -> float:
+    def highest_ask_price(self) -> Optional[float]:
         """最高卖价
         """
-        unique_id: str
-        price_list: list = list(self._unfilled_order_price_dict.keys())
-        price_list.sort(reverse=True)
-        for price in price_list:
-            for unique_id in self._unfilled_order_price_dict[price]:
-                if self._order_dict[unique_id].direction == 'SELL':
-                    return price
+        return self._to_price(self._sell_ladder.highest())
 
     @property
     def lowest_bid_order(self) -> List[str]:
         """最低买开委托单
         """
-        result: List[str] = []
-        unique_id: str
-        price_list: list = list(self._unfilled_order_price_dict.keys())
-        price_list.sort(reverse=False)
-        for price in price_list:
-            for unique_id in self._unfilled_order_price_dict[price]:
-                if self._order_dict[unique_id].direction == 'BUY':
-                    result.append(unique_id)
-            if len(result) > 0:
-                break
-        return result
+        tick: Optional[int] = self._buy_ladder.lowest()
+        if tick is None:
+            return []
+        return [unique_id for unique_id in self._unfilled_order_price_dict[tick]
+                if self._order_dict[unique_id].direction == 'BUY']
 
     @property
     def highest_ask_order(self) -> List[str]:
@@ -305,29 +345,52 @@ class QWOrderManager(object):
         最高价卖单（包括卖开、卖平）。
         :return:
         """
-        result: List[str] = []
-        unique_id: str
-        price_list: list = list(self._unfilled_order_price_dict.keys())
-        price_list.sort(reverse=True)
-        for price in price_list:
-            for unique_id in self._unfilled_order_price_dict[price]:
-                if self._order_dict[unique_id].direction == 'SELL':
-                    result.append(unique_id)
-            if len(result) > 0:
-                break
-        return result
+        tick: Optional[int] = self._sell_ladder.highest()
+        if tick is None:
+            return []
+        return [unique_id for unique_id in self._unfilled_order_price_dict[tick]
+                if self._order_dict[unique_id].direction == 'SELL']
 
     def unfilled_lots_at_price(self, p: float) -> int:
-        if p not in self._unfilled_order_price_dict.keys():
-            return 0
-        lots: int = 0
-        unique_id: str
-        for unique_id in self._unfilled_order_price_dict[p]:
-            lots += self._order_dict[unique_id].volume_orign
-        return lots
-
-    def save(self) -> None:
-        pass
+        tick: int = self._contract_spec.to_tick(p)
+        return self._buy_ladder.at(tick) + self._sell_ladder.at(tick)
 
-    def load(self) -> None:
-        pass
+    def save(self) -> List[list]:
+        """保存状态
+        :return: [[unique_id, 分类, 委托单字段...], ...]，分类为 U（未成交）、P（持仓）、F（完结）、C（已撤销）。
+        """
+        category_dict: Dict[str, str] = {}
+        for category, id_list in (('U', self._unfilled_order_list),
+                                  ('P', self._position_order_list),
+                                  ('F', self._finished_order_list),
+                                  ('C', self._canceled_order_list)):
+            for unique_id in id_list:
+                category_dict[unique_id] = category
+        return [[unique_id, category_dict.get(unique_id, 'U')] + QWOrderRecord.from_order(order).to_list()
+                for unique_id, order in self._order_dict.items()]
+
+    def load(self, record_list: List[list]) -> None:
+        """恢复 save() 保存的状态
+        委托单恢复为 QWOrderRecord，可以用 rebind() 换回天勤的 Order。
+        """
+        self.__init__(self._contract_spec if self._has_spec else None)
+        for unique_id, category, *field_list in record_list:
+            order = QWOrderRecord(*field_list)
+            self._order_dict[unique_id] = order
+            if category == 'U':
+                self._unfilled_order_list.append(unique_id)
+                self._add_unfilled(unique_id, order)
+            elif category == 'P':
+                self._position_order_list.append(unique_id)
+            elif category == 'F':
+                self._finished_order_list.append(unique_id)
+            else:
+                self._canceled_order_list.append(unique_id)
+
+    def rebind(self, order_dict: Dict[str, Order]) -> None:
+        """恢复状态后，把 QWOrderRecord 换成天勤的 Order
+        :param order_dict: api.get_order()，order_id -> Order。
+        """
+        for unique_id, order in self._order_dict.items():
+            if isinstance(order, QWOrderRecord) and order.order_id in order_dict:
+                self._order_dict[unique_id] = order_dict[order.order_id]
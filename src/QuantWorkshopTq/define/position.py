@@ -3,44 +3,79 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
 from datetime import datetime
 import math
 
 from . import QWDirection, QWOffset, QWOrderStatus
+from .contract import QWContractSpec, get_fallback_spec
+from .ladder import QWPriceLadder, QWSparsePriceLadder, create_price_ladder
 
 
 class QWPosition(object):
     order_id: str
     fill_datetime: datetime
     price: float
+    tick: int                   # 整数价格，由 QWPositionManager.add 设置
     lots: int
     direction: QWDirection
 
 
 class QWPositionManager(object):
+    """
+    持仓管理器。价格按整数价格（跳）索引。
+    """
     _capital_available: float
     _price_per_lot: float
+    _contract_spec: QWContractSpec
     _position_list: List[QWPosition]
+    _lots_ladder: Union[QWPriceLadder, QWSparsePriceLadder]     # 各价位持仓手数
 
-    def __init__(self, capital_available: float, price_per_lot: float) -> None:
+    def __init__(self, capital_available: float, price_per_lot: float,
+                 contract_spec: Optional[QWContractSpec] = None) -> None:
         self._capital_available = capital_available
         self._price_per_lot = price_per_lot
+        self._contract_spec = contract_spec if contract_spec is not None else get_fallback_spec()
         self._position_list = []
+        self._lots_ladder = create_price_ladder(contract_spec is not None)
 
     def add(self, position: QWPosition) -> None:
+        position.tick = self._contract_spec.to_tick(position.price)
         self._position_list.append(position)
+        self._lots_ladder.add(position.tick, position.lots)
 
     def remove(self, position: QWPosition) -> None:
         self._position_list.remove(position)
+        self._lots_ladder.add(position.tick, -position.lots)
 
     def remove_by_order_id(self, order_id: str) -> None:
         position: QWPosition
         for position in self._position_list:
             if position.order_id == order_id:
-                self._position_list.remove(position)
+                self.remove(position)
                 break
 
+    def save(self) -> List[list]:
+        """保存状态
+        :return: [[order_id, 成交时间戳, 价格, 手数, 方向], ...]
+        """
+        return [[position.order_id, position.fill_datetime.timestamp(), position.price, position.lots,
+                 position.direction.value] for position in self._position_list]
+
+    def load(self, record_list: List[list]) -> None:
+        """恢复 save() 保存的状态
+        """
+        self._position_list = []
+        self._lots_ladder.clear()
+        for order_id, timestamp, price, lots, direction in record_list:
+            position = QWPosition()
+            position.order_id = order_id
+            position.fill_datetime = datetime.fromtimestamp(timestamp)
+            position.price = price
+            position.lots = lots
+            position.direction = QWDirection(direction)
+            self.add(position)
+
     @property
     def max_lots(self) -> int:
         return math.floor(self._capital_available / self._price_per_lot)
@@ -72,33 +107,16 @@ class QWPositionManager(object):
         return lots
 
     def lots_at_price(self, price: float) -> int:
-        lots: int = 0
-        position: QWPosition
-        for position in self._position_list:
-            if position.price == price:
-                lots += position.lots
-        return lots
+        return self._lots_ladder.at(self._contract_spec.to_tick(price))
 
     def position_at_price(self, price: float) -> List[QWPosition]:
-        result: List[QWPosition] = []
-        position: QWPosition
-        for position in self._position_list:
-            if position.price == price:
-                result.append(position)
-        return result
+        tick: int = self._contract_spec.to_tick(price)
+        if not self._lots_ladder.at(tick):
+            return []
+        return [position for position in self._position_list if position.tick == tick]
 
     def position_at_price_for_buy(self, price: float) -> List[QWPosition]:
-        result: List[QWPosition] = []
-        position: QWPosition
-        for position in self._position_list:
-            if position.price == price and position.direction == QWDirection.Long:
-                result.append(position)
-        return result
+        return [position for position in self.position_at_price(price) if position.direction == QWDirection.Long]
 
     def position_at_price_for_sell(self, price: float) -> List[QWPosition]:
-        result: List[QWPosition] = []
-        position: QWPosition
-        for position in self._position_list:
-            if position.price == price and position.direction == QWDirection.Short:
-                result.append(position)
-        return result
+        return [position for position in self.position_at_price(price) if position.direction == QWDirection.Short]
@@ -3,7 +3,7 @@
 __author__ = 'Bruce Frank Wong'
 
 from enum import Enum
-from datetime import datetime, timezone, timedelta, time
+from datetime import date, datetime, timezone, timedelta, time
 
 
 # 北京时间，GMT+8
@@ -13,6 +13,19 @@ tz_beijing: timezone = timezone(timedelta(hours=8))
 tz_settlement: timezone = timezone(timedelta(hours=12))
 
 
+def get_trading_day(dt: datetime) -> date:
+    """
+    行情时间（北京时间）所属的交易日：18 点之后为夜盘，归下一个工作日；
+    周五夜盘跨过零点后（周六凌晨）同样归下周一，即周六、周日的时间都顺延到下一个工作日。
+    """
+    day: date = dt.date()
+    if dt.hour >= 18:
+        day += timedelta(days=1)
+    while day.isoweekday() > 5:
+        day += timedelta(days=1)
+    return day
+
+
 class QWTradingStage(Enum):
     Evening = 0
     Morning = 1
@@ -20,7 +20,7 @@ import pandas as pd
 from tqsdk import TqApi, TqAuth
 from tqsdk.tools import DataDownloader
 
-from QuantWorkshopTq.utility import get_application_path
+from QuantWorkshopTq.utility import get_application_path, profile
 
 
 tick: int = 0
@@ -82,7 +82,7 @@ if __name__ == '__main__':
                                    'bid_price1', 'bid_volume1', 'ask_price1', 'ask_volume1',
                                    'volume', 'amount', 'open_interest']
     column_list: List[str]
-    with closing(tq_api):
+    with closing(tq_api), profile('download'):
         for request in download_request_list:
             task_name = request['symbol']
             file_name = os.path.join(application_path,
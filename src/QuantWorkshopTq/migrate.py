@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块把旧版每次回测单独建立的委托单、成交记录表并入 backtest_order / backtest_trade（会删除旧表，请先备份数据库）。
+
+    python migrate.py
+"""
+
+from dotenv import find_dotenv, load_dotenv
+
+# 数据库 URL 等环境变量在导入 QuantWorkshopTq.database 时读取，须在导入之前加载 .env
+load_dotenv(find_dotenv())
+
+from QuantWorkshopTq.database import migrate_backtest_tables
+
+
+if __name__ == '__main__':
+    migrated: int = migrate_backtest_tables()
+    print(f'{migrated} backtest(s) migrated to table <backtest_order> and <backtest_trade>.')
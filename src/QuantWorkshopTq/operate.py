@@ -6,15 +6,20 @@ __author__ = 'Bruce Frank Wong'
 本模块负责记录操作，核算收益。
 """
 
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Optional
 from datetime import date, time, datetime, timedelta
+from array import array
 import platform
 import os
 import re
+import csv
 from pathlib import Path
 import os.path
 import json
 
+import numpy as np
+import pandas as pd
+
 
 data_trade = [
     'TradeDate',
@@ -74,9 +79,11 @@ def str_to_time(source: str) -> time:
     return time(int(source[0:2]), int(source[3:5]), int(source[6:]))
 
 
+PATTERN_PRODUCT_AND_CONTRACT: re.Pattern = re.compile(r'^([a-zA-Z]+)(\d+)$')
+
+
 def str_to_product_and_contract(source: str) -> Tuple[str, str]:
-    pattern: re.Pattern = re.compile(r'^([a-zA-Z]+)(\d+)$')
-    result = pattern.match(source)
+    result = PATTERN_PRODUCT_AND_CONTRACT.match(source)
     return result.group(1), result.group(2)
 
 
@@ -149,5 +156,438 @@ def read_trade(f_trade: str) -> list:
     return content
 
 
+# 成交记录中，第 107 列之前为成交信息，之后为手续费、合同号、账号等。
+TRADE_FEE_COLUMN: int = 107
+
+
+def _split_product_and_contract(source: pd.Series) -> pd.DataFrame:
+    result: pd.DataFrame = source.str.extract(PATTERN_PRODUCT_AND_CONTRACT)
+    result.columns = ['Product', 'Contract']
+    return result
+
+
+def _last_column(raw: pd.DataFrame) -> pd.Series:
+    """
+    每行最后一个非空的值（各行列数不同，账号在最后一列）。
+    """
+    is_valid: np.ndarray = raw.notna().to_numpy()
+    last: np.ndarray = is_valid.shape[1] - 1 - is_valid[:, ::-1].argmax(axis=1)
+    return pd.Series(raw.to_numpy()[np.arange(len(raw.index)), last], index=raw.index)
+
+
+def read_order_frame(f_order: str, encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    read_order 的列式版本，返回 DataFrame，列与 data_order 相同，并且已经转换好类型。
+    委托记录各列以空白分隔，用 C 解析器整体读入，不再逐行 split。
+    """
+    raw: pd.DataFrame = pd.read_csv(f_order, sep=r'\s+', header=None, skiprows=1, dtype=str, encoding=encoding)
+    product_and_contract: pd.DataFrame = _split_product_and_contract(raw[2])
+    return pd.DataFrame({
+        'OrderDate': pd.to_datetime(raw[0], format='%Y%m%d'),
+        'OrderTime': pd.to_timedelta(raw[1]),
+        'Product': product_and_contract['Product'].astype('category'),
+        'Contract': product_and_contract['Contract'],
+        'Direction': raw[4].astype('category'),
+        'OC': raw[5].astype('category'),
+        'Price': raw[6].astype('float64'),
+        'Lots': raw[7].astype('int64'),
+        'OrderNo': raw[11],
+        'Status': raw[3].astype('category'),
+        'Account': _last_column(raw).astype('category'),
+    })
+
+
+def read_trade_frame(f_trade: str, encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    read_trade 的列式版本，返回 DataFrame，列与 data_trade 相同，并且已经转换好类型。
+    成交记录按固定宽度切为两段（见 TRADE_FEE_COLUMN），每段再整体 split，去掉首行表头和末行汇总。
+    """
+    raw: pd.DataFrame = pd.read_fwf(f_trade,
+                                    colspecs=[(0, TRADE_FEE_COLUMN), (TRADE_FEE_COLUMN, None)],
+                                    header=None,
+                                    skiprows=1,
+                                    skipfooter=1,
+                                    dtype=str,
+                                    encoding=encoding)
+    trade: pd.DataFrame = raw[0].str.split(expand=True)
+    fee: pd.DataFrame = raw[1].str.split(expand=True)
+    product_and_contract: pd.DataFrame = _split_product_and_contract(trade[2])
+    return pd.DataFrame({
+        'TradeDate': pd.to_datetime(trade[0], format='%Y%m%d'),
+        'TradeTime': pd.to_timedelta(trade[1]),
+        'Product': product_and_contract['Product'].astype('category'),
+        'Contract': product_and_contract['Contract'],
+        'Direction': trade[3].astype('category'),
+        'OC': trade[4].astype('category'),
+        'Price': trade[5].astype('float64'),
+        'Lots': trade[6].astype('int64'),
+        'Fee': fee[0].astype('float64'),
+        'OrderNo': fee[1],
+        'Account': _last_column(fee).astype('category'),
+    })
+
+
+def iter_trade_frame(f_trade_list: Iterable[str], encoding: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    逐个读取成交记录文件，每次只有一个文件在内存中。
+    """
+    for f_trade in f_trade_list:
+        yield read_trade_frame(f_trade, encoding=encoding)
+
+
+class TradeLedger(object):
+    """
+    成交台账。
+
+    多个结算单文件可能有重叠的日期（比如每天导出最近一周），
+    add 以整行内容的哈希值去重，并返回本次新增的记录。
+    同一文件中内容完全相同的多笔成交（同一委托单同一秒、同价同手数）是不同的成交，都保留：
+    按哈希值记录已入账的笔数，文件中第 k 次出现的记录只有在已入账不足 k 笔时才是新记录。
+    """
+    _seen: Dict[int, int]           # 已入账记录的哈希值 -> 笔数
+    _frame_list: List[pd.DataFrame]
+
+    def __init__(self):
+        self._seen = {}
+        self._frame_list = []
+
+    def add(self, frame: pd.DataFrame) -> pd.DataFrame:
+        key: pd.Series = pd.util.hash_pandas_object(frame[data_trade], index=False)
+        occurrence: pd.Series = key.groupby(key, sort=False).cumcount()
+        booked: pd.Series = key.map(self._seen).fillna(0)
+        is_new: pd.Series = occurrence >= booked
+        new_frame: pd.DataFrame = frame[is_new.to_numpy()]
+        if len(new_frame.index) > 0:
+            for k, count in key[is_new].value_counts(sort=False).items():
+                self._seen[k] = self._seen.get(k, 0) + count
+            self._frame_list.append(new_frame)
+        return new_frame
+
+    def add_file(self, f_trade: str, encoding: Optional[str] = None) -> pd.DataFrame:
+        return self.add(read_trade_frame(f_trade, encoding=encoding))
+
+    def add_files(self, f_trade_list: Iterable[str], encoding: Optional[str] = None) -> int:
+        """
+        :return: 新增记录数。
+        """
+        count: int = 0
+        for frame in iter_trade_frame(f_trade_list, encoding=encoding):
+            count += len(self.add(frame).index)
+        return count
+
+    def __len__(self) -> int:
+        return sum(self._seen.values())
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        全部成交记录，按成交日期、时间排序。
+        """
+        if not self._frame_list:
+            return pd.DataFrame(columns=data_trade)
+        if len(self._frame_list) > 1:
+            self._frame_list = [pd.concat(self._frame_list, ignore_index=True)]
+        return self._frame_list[0].sort_values(['TradeDate', 'TradeTime'], kind='stable', ignore_index=True)
+
+
+# 结算单中买卖、开平的写法
+DIRECTION_BUY: Set[str] = {'买', 'BUY'}
+OFFSET_OPEN: Set[str] = {'开', '开仓', 'OPEN'}
+OFFSET_CLOSE_TODAY: Set[str] = {'平今', 'CLOSETODAY'}
+
+
+def load_contract_multiplier() -> Dict[str, float]:
+    """
+    从 database/csv/futures.csv 读取各品种的合约乘数，{品种代码(小写): 每手数量}。
+    """
+    csv_path: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'csv', 'futures.csv')
+    result: Dict[str, float] = {}
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            result[row['symbol'].lower()] = float(row['size'])
+    return result
+
+
+class LotQueue(object):
+    """
+    持仓队列，先开先出。
+    以 array 保存每笔开仓的价格、手数、开仓时间（纳秒），出队只移动队首指针，队首过半时才压缩。
+    同时维护总手数和总金额（价格 × 手数），持仓均价和浮动盈亏都是 O(1)。
+    """
+    _price: array
+    _lots: array
+    _open_ns: array
+    _head: int
+    lots: int           # 总手数
+    value: float        # 总金额，价格 × 手数
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._price = array('d')
+        self._lots = array('q')
+        self._open_ns = array('q')
+        self._head = 0
+        self.lots = 0
+        self.value = 0.0
+
+    def push(self, price: float, lots: int, open_ns: int) -> None:
+        self._price.append(price)
+        self._lots.append(lots)
+        self._open_ns.append(open_ns)
+        self.lots += lots
+        self.value += price * lots
+
+    def pop(self, lots: int) -> List[Tuple[float, int, int]]:
+        """
+        从队首取出 lots 手，可能跨越多笔开仓。
+        :return: [(开仓价, 手数, 开仓时间), ...]，队列不足时返回的总手数小于 lots。
+        """
+        result: List[Tuple[float, int, int]] = []
+        while lots > 0 and self._head < len(self._lots):
+            price = self._price[self._head]
+            n = min(lots, self._lots[self._head])
+            result.append((price, n, self._open_ns[self._head]))
+            self._lots[self._head] -= n
+            self.lots -= n
+            self.value -= price * n
+            lots -= n
+            if self._lots[self._head] == 0:
+                self._head += 1
+        if self._head > 1024 and self._head * 2 > len(self._lots):
+            del self._price[:self._head]
+            del self._lots[:self._head]
+            del self._open_ns[:self._head]
+            self._head = 0
+        return result
+
+    def extend(self, other: 'LotQueue') -> None:
+        """
+        把 other 的全部持仓接到队尾，并清空 other。用于日终把今仓转为昨仓。
+        """
+        self._price.extend(other._price[other._head:])
+        self._lots.extend(other._lots[other._head:])
+        self._open_ns.extend(other._open_ns[other._head:])
+        self.lots += other.lots
+        self.value += other.value
+        other.clear()
+
+    @property
+    def average_price(self) -> float:
+        return self.value / self.lots if self.lots else float('nan')
+
+
+class ContractLedger(object):
+    """
+    单个账户、单个合约的台账。
+    多、空各有昨仓和今仓两个队列：
+        平今（CLOSETODAY），只从今仓队列出队；
+        平仓（CLOSE），先从昨仓队列出队，不足再从今仓队列出队，即整体先开先平。
+    """
+    multiplier: float
+    long_history: LotQueue
+    long_today: LotQueue
+    short_history: LotQueue
+    short_today: LotQueue
+
+    realized: float             # 累计平仓盈亏
+    fee: float                  # 累计手续费
+    realized_today: float
+    fee_today: float
+    closed_lots: int            # 累计平仓手数
+    holding_ns: int             # 累计持仓时间（纳秒 × 手数）
+    unmatched_lots: int         # 找不到开仓记录的平仓手数
+    last_price: float           # 最新成交价
+    lots_today: int             # 当日成交手数
+
+    def __init__(self, multiplier: float):
+        self.multiplier = multiplier
+        self.long_history = LotQueue()
+        self.long_today = LotQueue()
+        self.short_history = LotQueue()
+        self.short_today = LotQueue()
+        self.realized = 0.0
+        self.fee = 0.0
+        self.realized_today = 0.0
+        self.fee_today = 0.0
+        self.closed_lots = 0
+        self.holding_ns = 0
+        self.unmatched_lots = 0
+        self.last_price = float('nan')
+        self.lots_today = 0
+
+    def roll(self) -> None:
+        """
+        新交易日：今仓转为昨仓，当日统计清零。
+        """
+        self.long_history.extend(self.long_today)
+        self.short_history.extend(self.short_today)
+        self.realized_today = 0.0
+        self.fee_today = 0.0
+        self.lots_today = 0
+
+    def trade(self, is_buy: bool, offset: str, price: float, lots: int, fee: float, trade_ns: int) -> None:
+        self.fee += fee
+        self.fee_today += fee
+        self.last_price = price
+        self.lots_today += lots
+
+        if offset in OFFSET_OPEN:
+            (self.long_today if is_buy else self.short_today).push(price, lots, trade_ns)
+            return
+
+        # 买平的是空仓，卖平的是多仓
+        if is_buy:
+            history, today, sign = self.short_history, self.short_today, -1.0
+        else:
+            history, today, sign = self.long_history, self.long_today, 1.0
+        if offset in OFFSET_CLOSE_TODAY:
+            matched = today.pop(lots)
+        else:
+            matched = history.pop(lots)
+            matched_lots = sum(n for _, n, _ in matched)
+            if matched_lots < lots:
+                matched += today.pop(lots - matched_lots)
+
+        pnl: float = 0.0
+        for open_price, n, open_ns in matched:
+            pnl += (price - open_price) * n
+            self.holding_ns += (trade_ns - open_ns) * n
+            self.closed_lots += n
+            lots -= n
+        pnl *= sign * self.multiplier
+        self.realized += pnl
+        self.realized_today += pnl
+        self.unmatched_lots += lots
+
+    @property
+    def long_lots(self) -> int:
+        return self.long_history.lots + self.long_today.lots
+
+    @property
+    def short_lots(self) -> int:
+        return self.short_history.lots + self.short_today.lots
+
+    def unrealized(self, mark_price: float) -> float:
+        long_value: float = self.long_history.value + self.long_today.value
+        short_value: float = self.short_history.value + self.short_today.value
+        return ((mark_price * self.long_lots - long_value) -
+                (mark_price * self.short_lots - short_value)) * self.multiplier
+
+    def snapshot(self, mark_price: Optional[float] = None) -> dict:
+        if mark_price is None:
+            mark_price = self.last_price
+        long_value: float = self.long_history.value + self.long_today.value
+        short_value: float = self.short_history.value + self.short_today.value
+        unrealized: float = self.unrealized(mark_price)
+        return {
+            'Realized': self.realized,
+            'RealizedToday': self.realized_today,
+            'Fee': self.fee,
+            'FeeToday': self.fee_today,
+            'LongLots': self.long_lots,
+            'LongAvgPrice': long_value / self.long_lots if self.long_lots else float('nan'),
+            'ShortLots': self.short_lots,
+            'ShortAvgPrice': short_value / self.short_lots if self.short_lots else float('nan'),
+            'MarkPrice': mark_price,
+            'Unrealized': unrealized,
+            'Net': self.realized + unrealized - self.fee,
+            'ClosedLots': self.closed_lots,
+            'AvgHoldingSeconds': self.holding_ns / self.closed_lots / 1e9 if self.closed_lots else float('nan'),
+            'UnmatchedLots': self.unmatched_lots,
+        }
+
+
+class LedgerEngine(object):
+    """
+    盈亏核算。
+
+    按交易日逐日输入成交记录（read_trade_frame 或 TradeLedger.add 的结果），
+    开平配对见 ContractLedger，每个交易日结束时生成当日快照。
+    各合约的状态是累计量，追加一天的成交只需处理当天的成交记录，不必从头重算。
+    """
+    _multiplier: Dict[str, float]
+    _ledger_dict: Dict[Tuple[str, str], ContractLedger]     # (账号, 合约) -> 台账
+    _active_set: Set[Tuple[str, str]]                       # 有持仓或当日有成交的台账
+    _roll_date: Dict[Tuple[str, str], pd.Timestamp]         # 各台账最近一次 roll() 的交易日
+    _last_date: Optional[pd.Timestamp]
+    _snapshot_list: List[pd.DataFrame]
+
+    def __init__(self, multiplier: Optional[Dict[str, float]] = None):
+        self._multiplier = multiplier if multiplier is not None else load_contract_multiplier()
+        self._ledger_dict = {}
+        self._active_set = set()
+        self._roll_date = {}
+        self._last_date = None
+        self._snapshot_list = []
+
+    def get_ledger(self, account: str, product: str, contract: str) -> ContractLedger:
+        key: Tuple[str, str] = (account, f'{product}{contract}')
+        if key not in self._ledger_dict:
+            if product.lower() not in self._multiplier:
+                raise ValueError(f'Contract multiplier of product <{product}> is unknown.')
+            self._ledger_dict[key] = ContractLedger(self._multiplier[product.lower()])
+        elif self._last_date is not None and self._roll_date.get(key) != self._last_date:
+            # 之前已平仓、不在 _active_set 中的台账，隔几天再有成交时才 roll()
+            self._ledger_dict[key].roll()
+        if self._last_date is not None:
+            self._roll_date[key] = self._last_date
+        self._active_set.add(key)
+        return self._ledger_dict[key]
+
+    def append_day(self, trade: pd.DataFrame, mark_price: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+        """
+        输入一个或多个交易日的成交记录，交易日必须晚于已输入的交易日。
+        :param trade: 成交记录，列与 data_trade 相同。
+        :param mark_price: 计算浮动盈亏的价格（一般为结算价），{合约: 价格}，缺省为该合约最新成交价。
+        :return: 最后一个交易日的快照。
+        """
+        if mark_price is None:
+            mark_price = {}
+        snapshot: pd.DataFrame = pd.DataFrame()
+        trade = trade.sort_values(['TradeDate', 'TradeTime'], kind='stable')
+        for trade_date, day in trade.groupby('TradeDate', sort=True):
+            if self._last_date is not None and trade_date <= self._last_date:
+                raise ValueError(f'Trade date <{trade_date:%Y-%m-%d}> has been processed.')
+            self._last_date = trade_date
+            for key in self._active_set:
+                self._ledger_dict[key].roll()
+                self._roll_date[key] = trade_date
+
+            trade_ns = (day['TradeDate'] + day['TradeTime']).to_numpy(dtype='datetime64[ns]').astype('int64')
+            for row, ns in zip(day.itertuples(index=False), trade_ns.tolist()):
+                ledger = self.get_ledger(row.Account, row.Product, row.Contract)
+                ledger.trade(row.Direction in DIRECTION_BUY, row.OC, row.Price, row.Lots, row.Fee, ns)
+
+            snapshot = self._snapshot(trade_date, mark_price)
+            self._snapshot_list.append(snapshot)
+        return snapshot
+
+    def _snapshot(self, trade_date: pd.Timestamp, mark_price: Dict[str, float]) -> pd.DataFrame:
+        row_list: List[dict] = []
+        flat_list: List[Tuple[str, str]] = []
+        for key in sorted(self._active_set):
+            account, symbol = key
+            ledger = self._ledger_dict[key]
+            row: dict = {'TradeDate': trade_date, 'Account': account, 'Symbol': symbol}
+            row.update(ledger.snapshot(mark_price.get(symbol)))
+            row_list.append(row)
+            # 已全部平仓的合约，之后无成交时不再出现在快照中
+            if ledger.long_lots == 0 and ledger.short_lots == 0:
+                flat_list.append(key)
+        self._active_set.difference_update(flat_list)
+        return pd.DataFrame(row_list)
+
+    @property
+    def snapshot(self) -> pd.DataFrame:
+        """
+        全部日快照。
+        """
+        if not self._snapshot_list:
+            return pd.DataFrame()
+        return pd.concat(self._snapshot_list, ignore_index=True)
+
+
 if __name__ == '__main__':
     pass
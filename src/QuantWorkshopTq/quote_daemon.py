@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块是本机行情进程：一个天勤连接订阅全部合约，经共享内存发布给各策略进程（QuoteRing.attach）。
+
+    python quote_daemon.py DCE.c2101 SHFE.rb2101
+"""
+
+import os
+import sys
+
+from dotenv import find_dotenv, load_dotenv
+from tqsdk import TqApi, TqKq
+
+from QuantWorkshopTq.utility import QuoteBus
+
+
+if __name__ == '__main__':
+    # 加载 .env 变量
+    load_dotenv(find_dotenv())
+
+    # 天勤账号
+    TQ_SIM_ACCOUNT: str = os.environ.get('TQ_SIM_ACCOUNT')
+    TQ_SIM_PASSWORD: str = os.environ.get('TQ_SIM_PASSWORD')
+
+    # 发布的合约，命令行参数或环境变量 QW_BUS_SYMBOLS（逗号分隔）
+    symbol_list: list = sys.argv[1:] or os.environ.get('QW_BUS_SYMBOLS', '').split(',')
+    symbol_list = [symbol.strip() for symbol in symbol_list if symbol.strip()]
+    if not symbol_list:
+        sys.exit('No symbol to publish.')
+
+    tq_api: TqApi = TqApi(TqKq(), auth='%s,%s' % (TQ_SIM_ACCOUNT, TQ_SIM_PASSWORD))
+    QuoteBus(tq_api, symbol_list).run()
@@ -14,6 +14,9 @@ from datetime import date
 from dotenv import find_dotenv, load_dotenv
 from tqsdk import TqApi, TqReplay, TqSim
 
+# 数据库 URL 等环境变量在导入 QuantWorkshopTq.database 时读取，须在导入策略之前加载 .env
+load_dotenv(find_dotenv())
+
 from QuantWorkshopTq.strategy import StrategyBase, StrategyParameter
 from QuantWorkshopTq.strategy.scalping import Scalping, strategy_parameter
 
@@ -23,9 +26,6 @@ if __name__ == '__main__':
     backtest_capital: float = 100000.0
     replay_date: date = date(2020, 9, 24)
 
-    # 加载 .env 变量
-    load_dotenv(find_dotenv())
-
     # 天勤账号
     TQ_ACCOUNT: str = os.environ.get('TQ_ACCOUNT')
     TQ_PASSWORD: str = os.environ.get('TQ_PASSWORD')
@@ -41,7 +41,7 @@ if __name__ == '__main__':
     parameter.set_parameters(
         {
             'max_position': 30,     # 最大持仓手数
-            'close_spread': 1,      # 平仓价差
+            'close_spread': 1,      # 平仓价差（跳）
             'order_range': 3,       # 挂单范围
             'closeout_long': 5,     # 多单强平点差
             'closeout_short': 5,    # 空单强平点差
@@ -14,7 +14,11 @@ from datetime import date
 from dotenv import find_dotenv, load_dotenv
 from tqsdk import TqApi, TqAccount, TqKq
 
+# 数据库 URL 等环境变量在导入 QuantWorkshopTq.database 时读取，须在导入策略之前加载 .env
+load_dotenv(find_dotenv())
+
 from QuantWorkshopTq.strategy import StrategyBase, PopcornStrategy
+from QuantWorkshopTq.utility import TickRecorder
 
 
 if __name__ == '__main__':
@@ -23,9 +27,6 @@ if __name__ == '__main__':
     backtest_start_date: date = date(2020, 8, 1)
     backtest_end_date: date = date(2020, 9, 15)
 
-    # 加载 .env 变量
-    load_dotenv(find_dotenv())
-
     # 天勤账号
     TQ_SIM_ACCOUNT: str = os.environ.get('TQ_SIM_ACCOUNT')
     TQ_SIM_PASSWORD: str = os.environ.get('TQ_SIM_PASSWORD')
@@ -51,5 +52,12 @@ if __name__ == '__main__':
                                    safety_rate=0.8
                                    )
 
+    # 记录实时行情，供离线复盘
+    recorder: TickRecorder = TickRecorder(tq_api_kq, [sim_strategy.symbol])
+    recorder.start()
+
     # 运行回测
-    sim_strategy.run()
+    try:
+        sim_strategy.run()
+    finally:
+        recorder.close()
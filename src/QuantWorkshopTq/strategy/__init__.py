@@ -3,6 +3,8 @@
 __author__ = 'Bruce Frank Wong'
 
 from .base import StrategyBase, StrategyParameter
+from .runtime import StrategyRuntime
+from .serial import SerialView
 from .utility import get_logger, get_application_path
 # from .database import db_session, BacktestOrder, BacktestTrade
 
@@ -3,20 +3,30 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from typing import Any, Union, Optional, Dict, List
+from typing import Any, Union, Optional, Dict, List, Set
 import abc
+import contextlib
+import glob
 import logging
 import os.path
+import time as time_module
 from datetime import datetime, date, time, timezone, timedelta
 
-from tqsdk import TqApi
-from tqsdk.objs import Account, Position, Quote, Order
+from tqsdk import TqApi, TqBacktest, BacktestFinished
+from tqsdk.objs import Account, Position, Quote, Order, Trade
 from tqsdk.entity import Entity
 from tqsdk.tafunc import time_to_datetime
 from pandas import DataFrame
 
-from QuantWorkshopTq.define import tz_beijing, tz_settlement
-from QuantWorkshopTq.database import db_session, BacktestRecord
+from QuantWorkshopTq.define import tz_beijing, tz_settlement, get_trading_day, QWContractSpec, QWOrderRecord
+from QuantWorkshopTq.define.contract import get_fallback_spec
+from QuantWorkshopTq.database import create_backtest_record, get_run_record, get_contract_spec
+
+from .risk import RiskLimit, RiskGate
+from .latency import LatencyRecorder
+from .checkpoint import StrategyCheckpoint
+from .closeout import CloseoutEngine, CloseoutOrder
+from .serial import SerialView
 
 
 class StrategyParameter(object):
@@ -56,11 +66,33 @@ class StrategyParameter(object):
 
 
 class StrategyBase(metaclass=abc.ABCMeta):
+    """
+    策略基类。
+
+    run() 循环调用 wait_update()，每次更新后由 dispatch() 逐个检查订阅的对象，只检查一次，有变化时回调：
+        on_order(order):    本合约的委托单有变化（只对变化的委托单调用，risk_gate 已先更新）；
+        on_trade(trade):    本合约的新成交；
+        on_quote(quote):    盘口变化（quote_field_list 中的字段），price_ask、price_bid、remote_datetime 已更新；
+        on_bar(kline):      subscribe_bar() 订阅的K线产生新K线；
+        on_timeout():       timeout 秒内没有收到数据；
+        on_finish():        回测结束。
+    子类实现需要的回调即可。
+    启用强平（enable_closeout）时，新成交先登记到 closeout，盘口变化时先检查强平再回调 on_quote。
+
+    多个策略共用一个 api 时，由 StrategyRuntime 以 run_async() 协程方式运行，见 runtime 模块。
+    """
     strategy_name: str = 'Unnamed Strategy'
     api: TqApi
     logger: logging.Logger
 
     symbol: Union[str, List[str]]
+    contract_spec: Optional[QWContractSpec]     # 合约规格（最小变动价位、合约乘数、保证金比例）
+    risk_gate: RiskGate                         # 下单前风控，见 insert_order
+    latency: Optional[LatencyRecorder]          # 反应时间统计，未启用时为 None，见 latency 模块
+    log_file_path: str                          # 日志文件
+    checkpoint: Optional[StrategyCheckpoint]    # 状态快照和日志，未启用时为 None，见 enable_checkpoint
+    snapshot_every: int = 10000                 # 日志达到该条数时自动写快照
+    closeout: Optional[CloseoutEngine]          # 强平价差止损，未启用时为 None，见 enable_closeout
     settings: dict
     timeout: int = 5
 
@@ -75,15 +107,36 @@ class StrategyBase(metaclass=abc.ABCMeta):
 
     tq_account: Account
     tq_position: Position
-    tq_tick: DataFrame
     tq_quote: Quote
     tq_order: Entity
-
-    def __init__(self, api: TqApi, symbol: Union[str, List[str]], settings: Optional[StrategyParameter] = None):
+    tq_trade: Entity
+
+    quote_field_list: List[str] = ['ask_price1', 'bid_price1']     # on_quote 关注的字段
+    _bar_serial_list: List[SerialView]      # subscribe_bar 订阅的K线
+    _serial_view_dict: Dict[tuple, SerialView]      # bar_view、tick_view 已订阅的序列
+    _trade_id_set: Set[str]                 # 已回调 on_trade 的成交编号
+    backtest_record_id: int                 # 本次运行的 backtest_record.id，实盘、复盘按交易日共用
+
+    def __init__(self,
+                 api: TqApi,
+                 symbol: Union[str, List[str]],
+                 settings: Optional[StrategyParameter] = None,
+                 risk_limit: Optional[RiskLimit] = None,
+                 latency: Optional[bool] = None):
+        """
+        :param latency: 是否统计反应时间，默认由环境变量 QW_LATENCY 决定。
+        """
         self._tz_settlement = tz_settlement
         self.api = api
         self.logger = self.get_logger()
         self.symbol = symbol
+        self.contract_spec = None
+        if isinstance(symbol, str):
+            try:
+                self.contract_spec = get_contract_spec(symbol)
+            except ValueError as e:
+                # 期权、股票等没有合约规格，风控、强平等按 get_fallback_spec() 的最小跳换算整数价格
+                self.logger.warning(f'{e} 使用缺省合约规格（最小变动价位 {get_fallback_spec().price_tick}）。')
 
         self.settings = {}
         if settings:
@@ -93,21 +146,46 @@ class StrategyBase(metaclass=abc.ABCMeta):
         # 天勤数据
         self.tq_account = self.api.get_account()
         self.tq_position = self.api.get_position(self.symbol)
-        self.tq_tick = self.api.get_tick_serial(self.symbol)
         self.tq_quote = self.api.get_quote(self.symbol)
         self.tq_order = self.api.get_order()
+        self.tq_trade = self.api.get_trade()
+        self.local_datetime = datetime.now()
+        self.remote_datetime = time_to_datetime(self.tq_quote.datetime) if self.tq_quote.datetime else self.local_datetime
+
+        # 事件
+        self._bar_serial_list = []
+        self._serial_view_dict = {}
+        self._trade_id_set = set()
+
+        # 风控
+        self.risk_gate = RiskGate(risk_limit if risk_limit else RiskLimit(), self.contract_spec)
+        self.risk_gate.sync_position(self.tq_position.pos_long, self.tq_position.pos_short)
+
+        # 反应时间
+        if latency is None:
+            latency = bool(os.environ.get('QW_LATENCY'))
+        self.latency = LatencyRecorder() if latency else None
+
+        # 状态快照
+        self.checkpoint = None
+
+        # 强平
+        self.closeout = None
 
-        # 数据库
-        if '_backtest' in self.api.__dict__:
-            backtest_record: BacktestRecord = BacktestRecord(strategy=self.strategy_name,
+        # 数据库：回测每次新建一条记录；实盘、复盘按交易日共用一条记录，委托单、成交记录都以其 id 保存
+        if self.is_backtest:
+            self.backtest_record_id = create_backtest_record(strategy=self.strategy_name,
                                                              symbol=self.symbol,
                                                              backtest_start=self.api._backtest._start_dt,
                                                              backtest_end=self.api._backtest._end_dt,
-                                                             real_start=datetime.now(),
-                                                             )
-            db_session.add(backtest_record)
-            db_session.commit()
-            self.backtest_record_id = backtest_record.id
+                                                             parameter=self.settings
+                                                             ).id
+        else:
+            self.backtest_record_id = get_run_record(strategy=self.strategy_name,
+                                                     symbol=self.symbol,
+                                                     trading_day=get_trading_day(self.remote_datetime),
+                                                     parameter=self.settings
+                                                     ).id
 
     def get_logger(self) -> logging.Logger:
         logger = logging.getLogger(f'Strategy-{self.strategy_name}')
@@ -125,7 +203,8 @@ class StrategyBase(metaclass=abc.ABCMeta):
         log_path: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log')
         if not os.path.exists(log_path):
             os.mkdir(log_path)
-        logger_file = logging.FileHandler(f'{log_path}/Strategy_{self.strategy_name}_{dt}.txt', encoding='utf-8')
+        self.log_file_path = f'{log_path}/Strategy_{self.strategy_name}_{dt}.txt'
+        logger_file = logging.FileHandler(self.log_file_path, encoding='utf-8')
         logger_file.setLevel(logging.DEBUG)
         logger_file.setFormatter(formatter)
 
@@ -182,6 +261,201 @@ class StrategyBase(metaclass=abc.ABCMeta):
     def log_no_data(self) -> None:
         self.logger.info(f'{self.remote_datetime}, 未在 timeout 时间内收到数据。')
 
+    def log_reject(self, direction: str, offset: str, volume: int, price: float, reason: str) -> None:
+        self.logger.info(f'{self.remote_datetime}, 【风控】, '
+                         f'{"买" if direction == "BUY" else "卖"}'
+                         f'{"开" if offset == "OPEN" else ("平" if offset == "CLOSE" else "平今")}, '
+                         f'{volume}手 @{price}, 拒绝: {reason}')
+
+    def insert_order(self, direction: str, offset: str, volume: int, limit_price: float) -> Optional[Order]:
+        """
+        经风控检查后下单。
+        :return: 委托单，被风控拒绝时为 None。
+        """
+        if self.latency is not None:
+            self.latency.mark_decision()
+        now: float = self.remote_datetime.timestamp()
+        reason: Optional[str] = self.risk_gate.check(direction, offset, limit_price, volume, now)
+        if reason:
+            self.log_reject(direction, offset, volume, limit_price, reason)
+            return None
+        order: Order = self.api.insert_order(symbol=self.symbol,
+                                             direction=direction,
+                                             offset=offset,
+                                             volume=volume,
+                                             limit_price=limit_price
+                                             )
+        if self.latency is not None:
+            self.latency.mark_submit()
+        self.risk_gate.on_insert(order.order_id, direction, offset, limit_price, volume, now)
+        if self.checkpoint is not None:
+            self.journal('insert', [order.order_id, direction, offset, limit_price, volume, now])
+        return order
+
+    @property
+    def is_backtest(self) -> bool:
+        # 复盘（TqReplay）同样存放在 api._backtest 中，不算回测
+        return isinstance(self.api.__dict__.get('_backtest'), TqBacktest)
+
+    def enable_checkpoint(self, path: Optional[str] = None) -> None:
+        """
+        启用状态快照。
+        :param path: 文件路径前缀，默认为日志目录下的 Checkpoint_{策略名}_{合约代码}_{交易日}，
+                     同一交易日内重启后按同一路径恢复；之前交易日的快照、日志删除。
+        """
+        if path is None:
+            prefix: str = os.path.join(os.path.dirname(self.log_file_path),
+                                       f'Checkpoint_{self.strategy_name}_{self.symbol}_')
+            trading_day: str = f'{get_trading_day(self.remote_datetime):%Y%m%d}'
+            path = f'{prefix}{trading_day}'
+            for old_path in glob.glob(f'{glob.escape(prefix)}*'):
+                if old_path[len(prefix):len(prefix) + 8] < trading_day:
+                    os.remove(old_path)
+        self.checkpoint = StrategyCheckpoint(path)
+
+    def journal(self, op: str, args: Any = None) -> None:
+        """
+        记录一次状态变化，恢复时由 apply_journal() 重放。日志达到 snapshot_every 条时，在 dispatch() 末尾写快照。
+        """
+        if self.checkpoint is None:
+            return
+        self.checkpoint.append(op, args)
+
+    def enable_closeout(self, closeout_long: Optional[int], closeout_short: Optional[int]) -> None:
+        """
+        启用强平：持仓亏损达到强平价差（跳）时，撤销其获利平仓单，按对手价平仓，见 closeout 模块。
+        :param closeout_long: 多头强平价差，None 为不检查多头。
+        :param closeout_short: 空头强平价差，None 为不检查空头。
+        """
+        for value in (closeout_long, closeout_short):
+            if value is not None and value <= 0:
+                raise ValueError('Parameter <closeout_long> and <closeout_short> should be positive.')
+        self.closeout = CloseoutEngine(self.contract_spec, closeout_long, closeout_short)
+
+    def link_closeout(self, close_order: Order, open_order_id: str) -> None:
+        """
+        登记开仓单的获利平仓单，强平时先撤销。
+        """
+        if self.closeout is None:
+            return
+        self.closeout.link(close_order.order_id, open_order_id)
+        self.journal('closeout_link', [close_order.order_id, open_order_id])
+
+    def check_closeout(self) -> None:
+        """
+        盘口变化时检查强平，撤销触发持仓的获利平仓单，待平手数由 flush_closeout() 发出。
+        """
+        closeout: CloseoutEngine = self.closeout
+        closeout_order_list: List[CloseoutOrder] = closeout.check(self.price_bid, self.price_ask)
+        if closeout_order_list:
+            # 触发与否只取决于当时的持仓和盘口，恢复时按同样的盘口重放
+            self.journal('closeout_check', [self.price_bid, self.price_ask])
+        for closeout_order in closeout_order_list:
+            self.logger.info(f'{self.remote_datetime}, 【强平】, '
+                             f'{"多头" if closeout_order.direction == "SELL" else "空头"}'
+                             f'{closeout_order.volume}手, 开仓单号：{closeout_order.key_list}')
+            for order_id in closeout_order.cancel_list:
+                order: Optional[Order] = self.tq_order.get(order_id)
+                if order is not None and order.status == 'ALIVE':
+                    self.api.cancel_order(order_id)
+
+    def flush_closeout(self) -> None:
+        """
+        在可平手数内发出待平手数；获利平仓单还未撤销、风控拒绝的部分留待下次更新。
+        """
+        closeout: CloseoutEngine = self.closeout
+        for direction in ('SELL', 'BUY'):
+            if not closeout.pending[direction]:
+                continue
+            if direction == 'SELL':
+                # 在 买一价 上 卖平
+                available: int = self.risk_gate.position_long - self.risk_gate.closing_long
+                price: float = self.price_bid
+            else:
+                # 在 卖一价 上 买平
+                available = self.risk_gate.position_short - self.risk_gate.closing_short
+                price = self.price_ask
+            volume: int = closeout.take_pending(direction, available)
+            if not volume:
+                continue
+            order: Optional[Order] = self.insert_order(direction, 'CLOSE', volume, price)
+            if order is None:
+                closeout.add_pending(direction, volume)
+                continue
+            closeout.mark_stop(order.order_id)
+            self.journal('closeout_stop', [order.order_id, direction, volume])
+            self.log_order(order)
+
+    def get_status(self) -> dict:
+        """
+        需要保存的状态。子类有其他状态时扩展。
+        """
+        status: dict = {
+            'risk_gate': self.risk_gate.save(),
+            'trade_id': list(self._trade_id_set),
+        }
+        if self.closeout is not None:
+            status['closeout'] = self.closeout.save()
+        return status
+
+    def set_status(self, status: dict) -> None:
+        self.risk_gate.load(status['risk_gate'])
+        self._trade_id_set = set(status['trade_id'])
+        if self.closeout is not None and 'closeout' in status:
+            self.closeout.load(status['closeout'])
+
+    def apply_journal(self, op: str, args: Any) -> None:
+        """
+        重放一条日志。子类有其他日志时扩展。
+        """
+        if op == 'insert':
+            self.risk_gate.on_insert(*args)
+        elif op == 'order':
+            self.risk_gate.on_order(QWOrderRecord(*args))
+        elif op == 'trade':
+            self._trade_id_set.add(args)
+        elif op == 'closeout_trade':
+            if self.closeout is not None:
+                self.closeout.on_trade(*args)
+        elif op == 'closeout_order':
+            if self.closeout is not None:
+                self.closeout.on_order(*args)
+        elif op == 'closeout_link':
+            if self.closeout is not None:
+                self.closeout.link(*args)
+        elif op == 'closeout_check':
+            if self.closeout is not None:
+                self.closeout.check(*args)
+        elif op == 'closeout_stop':
+            if self.closeout is not None:
+                self.closeout.take_pending(args[1], args[2])
+                self.closeout.mark_stop(args[0])
+
+    def save_checkpoint(self) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.get_status())
+
+    def load_checkpoint(self) -> bool:
+        """
+        从快照和日志恢复状态，之后以天勤的委托单和持仓校正风控计数器。
+        :return: 是否有保存的状态。
+        """
+        if self.checkpoint is None:
+            return False
+        status, journal_list = self.checkpoint.load()
+        if status is not None:
+            self.set_status(status)
+        for op, args in journal_list:
+            self.apply_journal(op, args)
+        # 停机期间成交、撤销的委托单不会再有变化回报，以天勤的委托单和持仓校正
+        self.risk_gate.reconcile(order for order in self.tq_order.values() if self.is_own(order))
+        self.risk_gate.sync_position(self.tq_position.pos_long, self.tq_position.pos_short)
+        if status is not None or journal_list:
+            self.logger.info(f'{self.remote_datetime}, 【恢复】, 快照: {status is not None}, '
+                             f'日志: {len(journal_list)} 条')
+            return True
+        return False
+
     @abc.abstractmethod
     def is_open_condition(self) -> bool:
         raise NotImplementedError()
@@ -198,6 +472,183 @@ class StrategyBase(metaclass=abc.ABCMeta):
     def save_status(self):
         raise NotImplementedError()
 
-    @abc.abstractmethod
+    def bar_view(self, duration_seconds: int, data_length: int = 200) -> SerialView:
+        """
+        K线的只读视图，第一次调用时订阅。
+        """
+        key: tuple = ('bar', duration_seconds, data_length)
+        view: Optional[SerialView] = self._serial_view_dict.get(key)
+        if view is None:
+            view = SerialView(self.api, self.api.get_kline_serial(self.symbol, duration_seconds=duration_seconds,
+                                                                  data_length=data_length))
+            self._serial_view_dict[key] = view
+        return view
+
+    def tick_view(self, data_length: int = 200) -> SerialView:
+        """
+        tick 序列的只读视图，第一次调用时订阅。
+        """
+        key: tuple = ('tick', data_length)
+        view: Optional[SerialView] = self._serial_view_dict.get(key)
+        if view is None:
+            view = SerialView(self.api, self.api.get_tick_serial(self.symbol, data_length=data_length))
+            self._serial_view_dict[key] = view
+        return view
+
+    @property
+    def tq_tick(self) -> DataFrame:
+        """
+        tick 序列，第一次访问时订阅。
+        """
+        return self.tick_view().df
+
+    def subscribe_bar(self, duration_seconds: int, data_length: int = 200) -> DataFrame:
+        """
+        订阅K线，产生新K线时回调 on_bar。
+        """
+        view: SerialView = self.bar_view(duration_seconds, data_length)
+        if view not in self._bar_serial_list:
+            self._bar_serial_list.append(view)
+        return view.df
+
+    def on_order(self, order: Order) -> None:
+        pass
+
+    def on_trade(self, trade: Trade) -> None:
+        pass
+
+    def on_quote(self, quote: Quote) -> None:
+        pass
+
+    def on_bar(self, kline: DataFrame) -> None:
+        pass
+
+    def on_timeout(self) -> None:
+        self.log_no_data()
+
+    def on_finish(self) -> None:
+        self.api.close()
+
+    def on_stop(self) -> None:
+        """
+        在 StrategyRuntime 中运行时，回测结束或停止运行时回调（api 由 runtime 统一关闭，不调用 on_finish）。
+        """
+        pass
+
+    def is_own(self, order_or_trade: Union[Order, Trade]) -> bool:
+        """
+        委托单、成交是否属于本策略的合约。get_order() / get_trade() 包含账户的全部委托单、成交，
+        手工下单或其他策略（共用一个账户时）的委托单不应计入本策略的风控和回调。
+        """
+        symbol: str = f'{order_or_trade.exchange_id}.{order_or_trade.instrument_id}'
+        return symbol == self.symbol if isinstance(self.symbol, str) else symbol in self.symbol
+
+    def dispatch(self) -> None:
+        """
+        一次 wait_update() 之后，把变化分发给各回调。委托单、成交在行情之前，开仓判断时持仓、挂单已是最新。
+        """
+        latency: Optional[LatencyRecorder] = self.latency
+        if latency is not None:
+            latency.mark_update()
+        order: Order
+        trade: Trade
+        if self.api.is_changing(self.tq_order):
+            for order in self.tq_order.values():
+                if self.api.is_changing(order) and self.is_own(order):
+                    self.risk_gate.on_order(order)
+                    if self.checkpoint is not None:
+                        self.journal('order', QWOrderRecord.from_order(order).to_list())
+                    if self.closeout is not None:
+                        args: list = [order.order_id, order.direction, order.status, order.volume_left]
+                        if self.closeout.on_order(*args):
+                            self.journal('closeout_order', args)
+                    self.on_order(order)
+
+        if self.api.is_changing(self.tq_trade):
+            for trade_id, trade in self.tq_trade.items():
+                if trade_id not in self._trade_id_set and self.is_own(trade):
+                    self._trade_id_set.add(trade_id)
+                    if self.checkpoint is not None:
+                        self.journal('trade', trade_id)
+                    if self.closeout is not None:
+                        args = [trade.order_id, trade.direction, trade.offset, trade.price, trade.volume]
+                        self.closeout.on_trade(*args)
+                        self.journal('closeout_trade', args)
+                    self.on_trade(trade)
+
+        if self.api.is_changing(self.tq_quote, self.quote_field_list):
+            self.price_ask = self.tq_quote.ask_price1
+            self.price_bid = self.tq_quote.bid_price1
+            self.remote_datetime = time_to_datetime(self.tq_quote.datetime)
+            self.local_datetime = datetime.now()
+            if self.closeout is not None:
+                self.check_closeout()
+            self.on_quote(self.tq_quote)
+
+        if self.closeout is not None and any(self.closeout.pending.values()):
+            # 待平手数在获利平仓单撤销后、风控允许时发出，成交已登记、盘口已更新
+            self.flush_closeout()
+
+        for view in self._bar_serial_list:
+            if view.is_new_row():
+                self.on_bar(view.df)
+
+        if latency is not None:
+            latency.mark_dispatched()
+            if latency.is_summary_due():
+                self.logger.info(f'{self.remote_datetime}, 【延迟】, {latency.summary()}')
+
+        # 本次更新的委托单已发出后再写快照，不计入反应时间
+        if self.checkpoint is not None and self.checkpoint.journal_count >= self.snapshot_every:
+            self.save_checkpoint()
+
+    def dump_latency(self) -> Optional[str]:
+        """
+        写出反应时间统计，与日志文件同名，后缀为 _latency.json。
+        :return: 文件路径，未启用时为 None。
+        """
+        if self.latency is None:
+            return None
+        path: str = os.path.splitext(self.log_file_path)[0] + '_latency.json'
+        self.latency.dump(path)
+        self.logger.info(f'{self.remote_datetime}, 【延迟】, {path}')
+        return path
+
     def run(self):
-        raise NotImplementedError()
+        """
+        策略运行。设置环境变量 QW_PROFILER 时做性能分析，结果与日志文件在同一目录，见 utility.profiling。
+        """
+        if os.environ.get('QW_PROFILER'):
+            # 只在分析时导入 utility 包
+            from QuantWorkshopTq.utility.profiling import profile
+            context = profile(self.strategy_name,
+                              run_id=self.backtest_record_id,
+                              output_dir=os.path.dirname(self.log_file_path))
+        else:
+            context = contextlib.nullcontext()
+        with context:
+            try:
+                while True:
+                    if not self.api.wait_update(deadline=time_module.time() + self.timeout):
+                        self.on_timeout()
+                        continue
+                    self.dispatch()
+            except BacktestFinished:
+                self.on_finish()
+            finally:
+                self.save_checkpoint()
+                self.dump_latency()
+
+    def notify_list(self) -> list:
+        """
+        dispatch() 检查的对象，run_async() 只在这些对象更新时唤醒。
+        """
+        return [self.tq_order, self.tq_trade, self.tq_quote] + [view.df for view in self._bar_serial_list]
+
+    async def run_async(self):
+        """
+        协程方式运行，由 StrategyRuntime 作为 api 上的任务运行，多个策略共用一个 api。
+        """
+        async with self.api.register_update_notify(self.notify_list()) as update_chan:
+            async for _ in update_chan:
+                self.dispatch()
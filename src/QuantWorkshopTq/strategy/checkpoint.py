@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块负责策略状态的快照和日志，用于中途重启后恢复。
+
+文件（path 为路径前缀）：
+    {path}.snapshot:    快照，MAGIC + 版本 + 最后一条日志序号 + 状态；先写临时文件再改名，不会读到写了一半的快照；
+    {path}.journal:     快照之后的变化，只追加，每条为 长度 + 内容 + CRC32。
+恢复：读快照，再依次应用序号大于快照的日志，耗时与 快照大小 + 日志条数 成正比。
+写快照后清空日志；若在改名和清空之间中断，重复的日志按序号跳过。
+断电时日志最后一条可能不完整，CRC 不符或长度不足的记录及其之后的内容丢弃。
+
+内容用 struct 编码，支持 None、bool、int、float、str、list/tuple、dict，不依赖第三方库。
+"""
+
+
+from typing import Any, BinaryIO, List, Optional, Tuple
+import os
+import os.path
+import struct
+import zlib
+
+
+MAGIC: bytes = b'QWCK'
+VERSION: int = 1
+
+_HEADER = struct.Struct('<4sHQ')        # MAGIC, 版本, 最后一条日志序号
+_LENGTH = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+
+def _encode(value: Any, buffer: bytearray) -> None:
+    if value is None:
+        buffer += b'N'
+    elif value is True:
+        buffer += b'T'
+    elif value is False:
+        buffer += b'F'
+    elif isinstance(value, int):
+        buffer += b'i'
+        buffer += _INT.pack(value)
+    elif isinstance(value, float):
+        buffer += b'f'
+        buffer += _FLOAT.pack(value)
+    elif isinstance(value, str):
+        data: bytes = value.encode('utf-8')
+        buffer += b's'
+        buffer += _LENGTH.pack(len(data))
+        buffer += data
+    elif isinstance(value, (list, tuple)):
+        buffer += b'l'
+        buffer += _LENGTH.pack(len(value))
+        for item in value:
+            _encode(item, buffer)
+    elif isinstance(value, dict):
+        buffer += b'd'
+        buffer += _LENGTH.pack(len(value))
+        for key, item in value.items():
+            _encode(key, buffer)
+            _encode(item, buffer)
+    else:
+        raise TypeError(f'Can not encode <{type(value).__name__}> in checkpoint.')
+
+
+def encode(value: Any) -> bytes:
+    buffer: bytearray = bytearray()
+    _encode(value, buffer)
+    return bytes(buffer)
+
+
+def _decode(data: memoryview, offset: int) -> Tuple[Any, int]:
+    tag: int = data[offset]
+    offset += 1
+    if tag == 0x4e:         # N
+        return None, offset
+    if tag == 0x54:         # T
+        return True, offset
+    if tag == 0x46:         # F
+        return False, offset
+    if tag == 0x69:         # i
+        return _INT.unpack_from(data, offset)[0], offset + 8
+    if tag == 0x66:         # f
+        return _FLOAT.unpack_from(data, offset)[0], offset + 8
+    length: int = _LENGTH.unpack_from(data, offset)[0]
+    offset += 4
+    if tag == 0x73:         # s
+        return str(data[offset:offset + length], 'utf-8'), offset + length
+    if tag == 0x6c:         # l
+        result: list = []
+        for _ in range(length):
+            item, offset = _decode(data, offset)
+            result.append(item)
+        return result, offset
+    if tag == 0x64:         # d
+        result_dict: dict = {}
+        for _ in range(length):
+            key, offset = _decode(data, offset)
+            result_dict[key], offset = _decode(data, offset)
+        return result_dict, offset
+    raise ValueError(f'Unknown tag <{chr(tag)}> in checkpoint.')
+
+
+def decode(data: bytes) -> Any:
+    return _decode(memoryview(data), 0)[0]
+
+
+class StrategyCheckpoint(object):
+    """
+    策略状态的快照和日志。
+
+        checkpoint = StrategyCheckpoint(path)
+        status, journal_list = checkpoint.load()      # 恢复
+        checkpoint.append('order', [...])             # 每次变化
+        checkpoint.save(status)                       # 定时或日志过长时
+    """
+    path: str
+    fsync: bool                 # 每条日志是否 fsync，默认只 flush（进程崩溃不丢，断电可能丢最后几条）
+    seq: int                    # 最后一条日志序号
+    journal_count: int          # 快照之后的日志条数
+    _journal: Optional[BinaryIO]
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.seq = 0
+        self.journal_count = 0
+        self._journal = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return f'{self.path}.snapshot'
+
+    @property
+    def journal_path(self) -> str:
+        return f'{self.path}.journal'
+
+    def _open_journal(self, mode: str = 'ab') -> BinaryIO:
+        if self._journal is None or self._journal.closed:
+            self._journal = open(self.journal_path, mode)
+        return self._journal
+
+    def append(self, op: str, args: Any = None) -> None:
+        """
+        追加一条日志。
+        """
+        self.seq += 1
+        payload: bytes = encode([self.seq, op, args])
+        journal: BinaryIO = self._open_journal()
+        journal.write(_LENGTH.pack(len(payload)) + payload + _LENGTH.pack(zlib.crc32(payload)))
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+        self.journal_count += 1
+
+    def save(self, status: Any) -> None:
+        """
+        写快照，清空日志。
+        """
+        temp_path: str = f'{self.snapshot_path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, self.seq))
+            f.write(encode(status))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = None
+        self._open_journal('wb')
+        self.journal_count = 0
+
+    def _read_journal(self, after_seq: int) -> List[Tuple[str, Any]]:
+        result: List[Tuple[str, Any]] = []
+        if not os.path.exists(self.journal_path):
+            return result
+        with open(self.journal_path, 'rb') as f:
+            data: bytes = f.read()
+        view: memoryview = memoryview(data)
+        offset: int = 0
+        while offset + 4 <= len(data):
+            length: int = _LENGTH.unpack_from(view, offset)[0]
+            end: int = offset + 4 + length + 4
+            if end > len(data):
+                break
+            payload: memoryview = view[offset + 4:offset + 4 + length]
+            if zlib.crc32(payload) != _LENGTH.unpack_from(view, end - 4)[0]:
+                break
+            seq, op, args = _decode(payload, 0)[0]
+            if seq > after_seq:
+                result.append((op, args))
+                self.seq = seq
+            offset = end
+        if offset < len(data):
+            # 截掉不完整的尾部，之后的日志接在有效记录后面
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(offset)
+        return result
+
+    def load(self) -> Tuple[Optional[Any], List[Tuple[str, Any]]]:
+        """
+        :return: (快照中的状态，没有快照时为 None, [(op, args), ...] 快照之后的日志)
+        """
+        status: Optional[Any] = None
+        self.seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data: bytes = f.read()
+            magic, version, seq = _HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'<{self.snapshot_path}> is not a checkpoint file of version {VERSION}.')
+            status = _decode(memoryview(data), _HEADER.size)[0]
+            self.seq = seq
+        journal_list: List[Tuple[str, Any]] = self._read_journal(self.seq)
+        self.journal_count = len(journal_list)
+        return status, journal_list
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def remove(self) -> None:
+        """
+        删除快照和日志，如当日交易结束后。
+        """
+        self.close()
+        for path in (self.snapshot_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
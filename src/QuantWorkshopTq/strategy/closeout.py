@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块是按强平价差止损的平仓引擎。
+
+每个开仓单成交后按 开仓价 ∓ 强平价差 算出触发价（整数价格），放入多、空两个堆：
+    多头:   买一价 <= 触发价 时强平，堆顶为最高的触发价；
+    空头:   卖一价 >= 触发价 时强平，堆顶为最低的触发价。
+每次盘口变化只比较堆顶，弹出被穿过的持仓，耗时 O(k log n)，k 为触发的笔数，没有触发时为 O(1)。
+触发的持仓合并为每个方向一个待平手数；其获利平仓单（link() 登记）先撤销，在可平手数内按对手价下平仓单。
+
+持仓由成交回报维护（on_trade）：
+    开仓成交:           登记或增加该开仓单的持仓；
+    获利平仓单成交:     扣减对应开仓单的持仓，已触发的从待平手数中扣除；
+    强平单成交:         已在触发时扣除，跳过；强平单被撤销时未成交的手数放回待平手数；
+    其他平仓成交:       如收盘前平仓、手工平仓，按登记顺序扣减同方向的持仓。
+完结的强平单、已触发的开仓单只保留最近 finished_window 个（其成交回报只在完结、触发后不久出现），
+快照大小不随交易日内的强平次数增长。
+"""
+
+
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+import heapq
+
+from QuantWorkshopTq.define import QWContractSpec
+from QuantWorkshopTq.define.contract import get_fallback_spec
+
+
+class CloseoutOrder(object):
+    """
+    一次触发的结果：撤销获利平仓单后，以 direction 平 volume 手。
+    """
+    __slots__ = ('direction', 'volume', 'cancel_list', 'key_list')
+    direction: str              # 平仓方向，SELL 平多头，BUY 平空头
+    volume: int
+    cancel_list: List[str]      # 需要撤销的获利平仓单
+    key_list: List[str]         # 触发的开仓单号
+
+    def __init__(self, direction: str, volume: int, cancel_list: List[str], key_list: List[str]):
+        self.direction = direction
+        self.volume = volume
+        self.cancel_list = cancel_list
+        self.key_list = key_list
+
+    def __repr__(self):
+        return f'<CloseoutOrder({self.direction} {self.volume}, cancel={self.cancel_list}, key={self.key_list})>'
+
+
+class CloseoutEngine(object):
+    """
+    强平引擎。开仓单号作为持仓的键。
+
+        closeout = CloseoutEngine(contract_spec, closeout_long=4, closeout_short=4)
+        closeout.on_trade(order_id, direction, offset, price, volume)     # 成交回报
+        closeout.link(close_order_id, open_order_id)                      # 下获利平仓单后
+        for order in closeout.check(bid, ask): ...                        # 盘口变化
+    """
+    closeout_long: Optional[int]        # 多头强平价差（跳），None 为不检查
+    closeout_short: Optional[int]       # 空头强平价差（跳），None 为不检查
+    pending: Dict[str, int]             # 平仓方向 -> 待平手数，由策略在可平手数内发出
+    _tick_spec: QWContractSpec
+    _long_heap: List[Tuple[int, str]]   # (-触发价, 开仓单号)
+    _short_heap: List[Tuple[int, str]]  # (触发价, 开仓单号)
+    _volume: Dict[str, List]            # 开仓单号 -> [方向, 触发价, 持仓手数]，按登记顺序
+    _link: Dict[str, str]               # 获利平仓单号 -> 开仓单号
+    _link_by_key: Dict[str, List[str]]  # 开仓单号 -> 获利平仓单号
+    _triggered: Dict[str, str]          # 已触发的开仓单号 -> 方向，按触发顺序
+    _stop_dict: Dict[str, bool]         # 强平单号 -> 是否已完结
+    _stop_finished: deque               # 已完结的强平单号，按完结顺序
+    finished_window: int = 1024         # 保留的已触发开仓单、已完结强平单数量
+
+    def __init__(self,
+                 contract_spec: Optional[QWContractSpec],
+                 closeout_long: Optional[int] = None,
+                 closeout_short: Optional[int] = None):
+        self.closeout_long = closeout_long
+        self.closeout_short = closeout_short
+        self.pending = {'SELL': 0, 'BUY': 0}
+        self._tick_spec = contract_spec if contract_spec is not None else get_fallback_spec()
+        self._long_heap = []
+        self._short_heap = []
+        self._volume = {}
+        self._link = {}
+        self._link_by_key = {}
+        self._triggered = {}
+        self._stop_dict = {}
+        self._stop_finished = deque()
+
+    def __len__(self) -> int:
+        return len(self._volume)
+
+    @property
+    def position_long(self) -> int:
+        return sum(item[2] for item in self._volume.values() if item[0] == 'BUY')
+
+    @property
+    def position_short(self) -> int:
+        return sum(item[2] for item in self._volume.values() if item[0] == 'SELL')
+
+    def _register(self, key: str, direction: str, price: float, volume: int) -> None:
+        item: Optional[list] = self._volume.get(key)
+        if item is not None:
+            item[2] += volume
+            return
+        tick: int = self._tick_spec.to_tick(price)
+        if direction == 'BUY':
+            if self.closeout_long is None:
+                return
+            trigger: int = tick - self.closeout_long
+            heapq.heappush(self._long_heap, (-trigger, key))
+        else:
+            if self.closeout_short is None:
+                return
+            trigger = tick + self.closeout_short
+            heapq.heappush(self._short_heap, (trigger, key))
+        self._volume[key] = [direction, trigger, volume]
+
+    def _reduce(self, key: str, volume: int) -> int:
+        """
+        :return: 未能扣减的手数。
+        """
+        item: Optional[list] = self._volume.get(key)
+        if item is None:
+            return volume
+        reduced: int = min(item[2], volume)
+        item[2] -= reduced
+        if item[2] == 0:
+            # 堆中的记录在弹出时跳过
+            del self._volume[key]
+            for order_id in self._link_by_key.pop(key, []):
+                del self._link[order_id]
+        return volume - reduced
+
+    def _reduce_side(self, direction: str, volume: int) -> None:
+        for key in [key for key, item in self._volume.items() if item[0] == direction]:
+            volume = self._reduce(key, volume)
+            if volume == 0:
+                return
+
+    def on_trade(self, order_id: str, direction: str, offset: str, price: float, volume: int) -> None:
+        """
+        成交回报。
+        """
+        if offset == 'OPEN':
+            self._register(order_id, direction, price, volume)
+        elif order_id in self._stop_dict:
+            return
+        elif order_id in self._link:
+            key: str = self._link[order_id]
+            if key in self._triggered:
+                # 获利平仓单在撤单前成交，待平手数相应减少
+                close_direction: str = direction
+                self.pending[close_direction] = max(self.pending[close_direction] - volume, 0)
+            else:
+                self._reduce(key, volume)
+        else:
+            # 卖平平多头，买平平空头
+            self._reduce_side('BUY' if direction == 'SELL' else 'SELL', volume)
+
+    def link(self, close_order_id: str, key: str) -> None:
+        """
+        登记开仓单 key 的获利平仓单。
+        """
+        self._link[close_order_id] = key
+        self._link_by_key.setdefault(key, []).append(close_order_id)
+
+    def mark_stop(self, order_id: str) -> None:
+        """
+        登记强平单，其成交不再扣减持仓。
+        """
+        self._stop_dict[order_id] = False
+
+    def on_order(self, order_id: str, direction: str, status: str, volume_left: int) -> bool:
+        """
+        委托单回报，强平单未成交部分被撤销（如收盘前撤单）时放回待平手数。
+        :return: 是否为刚完结的强平单。
+        """
+        if status != 'FINISHED' or self._stop_dict.get(order_id, True):
+            return False
+        self._stop_dict[order_id] = True
+        self._stop_finished.append(order_id)
+        if len(self._stop_finished) > self.finished_window:
+            del self._stop_dict[self._stop_finished.popleft()]
+        if volume_left:
+            self.pending[direction] += volume_left
+        return True
+
+    def _add_triggered(self, key: str, close_direction: str) -> None:
+        """
+        登记已触发的开仓单，超过 finished_window 个时去除最早触发的及其获利平仓单的登记。
+        """
+        self._triggered[key] = close_direction
+        if len(self._triggered) > self.finished_window:
+            oldest: str = next(iter(self._triggered))
+            del self._triggered[oldest]
+            for order_id in self._link_by_key.pop(oldest, []):
+                self._link.pop(order_id, None)
+
+    def _pop(self, heap: List[Tuple[int, str]], is_crossed, close_direction: str) -> Optional[CloseoutOrder]:
+        volume: int = 0
+        key_list: List[str] = []
+        cancel_list: List[str] = []
+        while heap and is_crossed(heap[0][0]):
+            _, key = heapq.heappop(heap)
+            item: Optional[list] = self._volume.pop(key, None)
+            if item is None:
+                continue
+            volume += item[2]
+            key_list.append(key)
+            cancel_list.extend(self._link_by_key.get(key, []))
+            self._add_triggered(key, close_direction)
+        if not key_list:
+            return None
+        self.pending[close_direction] += volume
+        return CloseoutOrder(close_direction, volume, cancel_list, key_list)
+
+    def check(self, bid_price: float, ask_price: float) -> List[CloseoutOrder]:
+        """
+        盘口变化时调用，返回本次触发的强平（每个方向至多一个），待平手数已计入 pending。
+        """
+        result: List[CloseoutOrder] = []
+        if self._long_heap and bid_price == bid_price:      # 没有买一价时为 NaN
+            bid_tick: int = self._tick_spec.to_tick(bid_price)
+            order: Optional[CloseoutOrder] = self._pop(self._long_heap, lambda top: -top >= bid_tick, 'SELL')
+            if order is not None:
+                result.append(order)
+        if self._short_heap and ask_price == ask_price:
+            ask_tick: int = self._tick_spec.to_tick(ask_price)
+            order = self._pop(self._short_heap, lambda top: top <= ask_tick, 'BUY')
+            if order is not None:
+                result.append(order)
+        return result
+
+    def take_pending(self, direction: str, available: int) -> int:
+        """
+        取出不超过 available 的待平手数，由策略下单；下单失败时用 add_pending() 放回。
+        """
+        volume: int = min(self.pending[direction], max(available, 0))
+        self.pending[direction] -= volume
+        return volume
+
+    def add_pending(self, direction: str, volume: int) -> None:
+        self.pending[direction] += volume
+
+    def save(self) -> dict:
+        return {
+            'position': [[key] + item for key, item in self._volume.items()],
+            'pending': [self.pending['SELL'], self.pending['BUY']],
+            'link': list(self._link.items()),
+            'triggered': list(self._triggered.items()),
+            'stop': list(self._stop_dict.items()),
+        }
+
+    def load(self, status: dict) -> None:
+        self._long_heap = []
+        self._short_heap = []
+        self._volume = {}
+        for key, direction, trigger, volume in status['position']:
+            self._volume[key] = [direction, trigger, volume]
+            if direction == 'BUY':
+                self._long_heap.append((-trigger, key))
+            else:
+                self._short_heap.append((trigger, key))
+        heapq.heapify(self._long_heap)
+        heapq.heapify(self._short_heap)
+        self.pending = {'SELL': status['pending'][0], 'BUY': status['pending'][1]}
+        self._link = {}
+        self._link_by_key = {}
+        for order_id, key in status['link']:
+            self.link(order_id, key)
+        self._triggered = {key: direction for key, direction in status['triggered']}
+        self._stop_dict = {order_id: finished for order_id, finished in status['stop']}
+        self._stop_finished = deque(order_id for order_id, finished in status['stop'] if finished)
@@ -7,26 +7,18 @@ from typing import List
 from datetime import datetime
 
 from sqlalchemy.ext.declarative import declarative_base, declared_attr, AbstractConcreteBase
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm import relationship
-from sqlalchemy import create_engine, event, MetaData, inspect
+from sqlalchemy import MetaData, inspect
 from sqlalchemy import Column, ForeignKey, String, Integer, Float, DateTime
 
-from . import get_application_path
-
-
-@event.listens_for(Engine, 'connect')
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute('PRAGMA foreign_keys=ON')
-    cursor.close()
+from ..database import get_database_url, create_db_engine
 
 
 ModelBase = declarative_base()
 
-db_engine = create_engine(f'sqlite:///{get_application_path()}/backtest.sqlite')
-db_session = sessionmaker(bind=db_engine)()
+db_engine = create_db_engine(get_database_url('QW_BACKTEST_DATABASE_URL', 'backtest.sqlite'), 'backtest')
+db_session = scoped_session(sessionmaker(bind=db_engine))
 db_metadata = MetaData(bind=db_engine)
 db_inspect = inspect(db_engine)
 
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块记录策略的反应时间。
+
+StrategyBase 在热路径上取单调时钟（time.perf_counter_ns）：
+    update:     wait_update() 返回、开始 dispatch()；
+    decision:   策略决定下单（调用 StrategyBase.insert_order）；
+    submit:     api.insert_order() 返回。
+各阶段耗时记入对数分桶直方图（与 HdrHistogram 相同的分桶方式，相对误差约 3%），记录一次只是几次整数运算；
+未启用时 StrategyBase.latency 为 None，热路径上只多一次 is None 判断。
+
+启用：StrategyBase(latency=True)，或设置环境变量 QW_LATENCY=1。
+每 summary_interval 秒把各阶段的 p50/p99 写入策略日志，运行结束时写出 JSON 文件（含全部非空分桶）。
+"""
+
+
+from typing import Dict, List, Optional, Tuple
+import json
+import time
+
+
+SUB_BUCKET_BITS: int = 5                    # 每个 2 的幂区间分 32 个桶
+SUB_BUCKET_COUNT: int = 1 << SUB_BUCKET_BITS
+MAX_VALUE_NS: int = 60 * 1_000_000_000      # 超过 60 秒的记入最后一个桶
+
+
+def bucket_index(value: int) -> int:
+    """
+    value < 64 时每个值一个桶；之后每个 [2^k, 2^(k+1)) 区间分 32 个桶。
+    """
+    if value < SUB_BUCKET_COUNT << 1:
+        return value
+    shift: int = value.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + (value >> shift) - SUB_BUCKET_COUNT
+
+
+def bucket_value(index: int) -> int:
+    """
+    桶的下界。
+    """
+    if index < SUB_BUCKET_COUNT << 1:
+        return index
+    shift: int = (index >> SUB_BUCKET_BITS) - 1
+    return ((index & (SUB_BUCKET_COUNT - 1)) + SUB_BUCKET_COUNT) << shift
+
+
+class LatencyHistogram(object):
+    """
+    耗时直方图，单位纳秒。
+    """
+    count: int
+    total: int
+    min: int
+    max: int
+    _bucket_list: List[int]
+
+    def __init__(self):
+        self._bucket_list = [0] * (bucket_index(MAX_VALUE_NS) + 1)
+        self.reset()
+
+    def reset(self) -> None:
+        for i in range(len(self._bucket_list)):
+            self._bucket_list[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        elif value > MAX_VALUE_NS:
+            value = MAX_VALUE_NS
+        self._bucket_list[bucket_index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if other.count == 0:
+            return
+        for i, n in enumerate(other._bucket_list):
+            if n:
+                self._bucket_list[i] += n
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> int:
+        """
+        :param q: 百分位，0 ~ 100。
+        :return: 该百分位所在桶的下界（不小于 min、不大于 max）。
+        """
+        if self.count == 0:
+            return 0
+        rank: int = max(1, int(round(q / 100 * self.count + 0.5 - 1e-9)))
+        seen: int = 0
+        for i, n in enumerate(self._bucket_list):
+            seen += n
+            if seen >= rank:
+                return min(max(bucket_value(i), self.min), self.max)
+        return self.max
+
+    def bucket_list(self) -> List[Tuple[int, int]]:
+        """
+        非空分桶，[(下界, 次数), ...]。
+        """
+        return [(bucket_value(i), n) for i, n in enumerate(self._bucket_list) if n]
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'min': self.min,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max,
+            'bucket': self.bucket_list(),
+        }
+
+
+class LatencyRecorder(object):
+    """
+    按阶段记录耗时：
+        dispatch:       一次 dispatch() 的耗时；
+        decide:         update -> decision，策略判断耗时；
+        submit:         decision -> submit，风控检查和 api.insert_order() 耗时；
+        tick_to_order:  update -> submit。
+    """
+    stage_list: Tuple[str, ...] = ('dispatch', 'decide', 'submit', 'tick_to_order')
+
+    histogram: Dict[str, LatencyHistogram]      # 运行开始以来
+    interval: Dict[str, LatencyHistogram]       # 上次 summary 以来
+    summary_interval: float
+
+    t_update: int
+    t_decision: int
+    _last_summary: float
+
+    def __init__(self, summary_interval: float = 60.0):
+        self.histogram = {stage: LatencyHistogram() for stage in self.stage_list}
+        self.interval = {stage: LatencyHistogram() for stage in self.stage_list}
+        self.summary_interval = summary_interval
+        self.t_update = 0
+        self.t_decision = 0
+        self._last_summary = time.monotonic()
+
+    def _record(self, stage: str, value: int) -> None:
+        self.interval[stage].record(value)
+
+    def mark_update(self) -> None:
+        self.t_update = time.perf_counter_ns()
+
+    def mark_dispatched(self) -> None:
+        self._record('dispatch', time.perf_counter_ns() - self.t_update)
+
+    def mark_decision(self) -> None:
+        self.t_decision = time.perf_counter_ns()
+        self._record('decide', self.t_decision - self.t_update)
+
+    def mark_submit(self) -> None:
+        t_submit: int = time.perf_counter_ns()
+        self._record('submit', t_submit - self.t_decision)
+        self._record('tick_to_order', t_submit - self.t_update)
+
+    def is_summary_due(self) -> bool:
+        return time.monotonic() - self._last_summary >= self.summary_interval
+
+    def summary(self) -> str:
+        """
+        上次 summary 以来各阶段的统计，并计入总直方图。
+        """
+        text_list: List[str] = []
+        for stage in self.stage_list:
+            histogram: LatencyHistogram = self.interval[stage]
+            if histogram.count:
+                text_list.append(f'{stage}: n={histogram.count}, p50={histogram.percentile(50) / 1000:.1f}us, '
+                                 f'p99={histogram.percentile(99) / 1000:.1f}us, max={histogram.max / 1000:.1f}us')
+            self.histogram[stage].merge(histogram)
+            histogram.reset()
+        self._last_summary = time.monotonic()
+        return '; '.join(text_list)
+
+    def to_dict(self) -> Dict[str, dict]:
+        for stage in self.stage_list:
+            self.histogram[stage].merge(self.interval[stage])
+            self.interval[stage].reset()
+        return {stage: self.histogram[stage].to_dict() for stage in self.stage_list}
+
+    def dump(self, path: str) -> None:
+        """
+        写出 JSON 文件，耗时单位为纳秒。
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'unit': 'ns', 'stage': self.to_dict()}, f, ensure_ascii=False, indent=2)
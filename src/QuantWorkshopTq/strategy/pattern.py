@@ -5,17 +5,16 @@ __author__ = 'Bruce Frank Wong'
 from typing import Dict, List, Union, Optional
 from enum import Enum
 import os
-import time
 import datetime
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import mplfinance as mpf
-from tqsdk import TqApi, BacktestFinished
+from tqsdk import TqApi
 from tqsdk.tafunc import time_to_datetime, time_to_s_timestamp
 
-from . import StrategyBase
+from . import StrategyBase, SerialView
 
 
 KeyPoint = Dict[datetime.datetime, float]
@@ -35,7 +34,8 @@ class CandlestickPattern(StrategyBase):
     strategy_name: str = 'Pattern'
 
     candlestick: pd.DataFrame
-    data: pd.DataFrame
+    bars: SerialView
+    data: Dict[str, np.ndarray]     # 最近 period 根K线的 datetime、high、low，为 bars 的视图
     h1: KeyPoint
     h2: KeyPoint
     h3: KeyPoint
@@ -49,13 +49,14 @@ class CandlestickPattern(StrategyBase):
         super().__init__(api=api, symbol=symbol)
         self.period = 30
         self.trend_turing_point = {}
-        self.candlestick = self.api.get_kline_serial(self.symbol, duration_seconds=60, data_length=600)
+        self.candlestick = self.subscribe_bar(60, 600)
+        self.bars = self.bar_view(60, 600)
+        self.data = {name: self.bars.tail(name, self.period) for name in ('datetime', 'high', 'low')}
 
     def draw(self):
         intraday: pd.DataFrame
 
-        intraday = self.candlestick.loc[:, ['open', 'high', 'low', 'close', 'volume']]
-        intraday.index = pd.to_datetime(self.candlestick['datetime'])
+        intraday = self.bars.to_frame(['open', 'high', 'low', 'close', 'volume'])
 
         color = mpf.make_marketcolors(up='red', down='cyan', inherit=True)
         style = mpf.make_mpf_style(marketcolors=color)
@@ -101,7 +102,7 @@ class CandlestickPattern(StrategyBase):
         candidate_i = None
         scan_i = 0
         peers = [0]
-        k = self.candlestick['close']
+        k = self.bars['close']
         z = np.zeros(len(k))
         state = ZIG_STATE_START
 
@@ -172,26 +173,23 @@ class CandlestickPattern(StrategyBase):
                 },
         }
 
-    def run(self):
-        try:
-            while True:
-                if not self.api.wait_update(deadline=time.time() + self.timeout):
-                    print('未在超时限制内接收到数据。')
-
-                if self.api.is_changing(self.candlestick.iloc[-1], 'datetime'):
-                    # candlestick columns
-                    # 'datetime', 'id', 'open', 'high', 'low', 'close', 'volume', 'open_oi', 'close_oi',
-                    #       'symbol', 'duration'
-                    self.logger.info(time_to_datetime(self.candlestick.iloc[-1]['datetime']))
-                    self.data = self.candlestick.loc[:, ['datetime', 'high', 'low']].iloc[-self.period:]
-                    # self.triangle(self.data)
-
-        except BacktestFinished:
-            print(self.candlestick)
-            print('='*20)
-            # print(self.keypoint)
-            print('=' * 20)
-            self.draw()
-
-            self.api.close()
-            exit()
+    def on_bar(self, kline: pd.DataFrame) -> None:
+        # candlestick columns
+        # 'datetime', 'id', 'open', 'high', 'low', 'close', 'volume', 'open_oi', 'close_oi',
+        #       'symbol', 'duration'
+        # self.data 随K线更新，不需要重新取
+        self.logger.info(time_to_datetime(self.bars.last('datetime')))
+        # self.triangle(self.data)
+
+    def on_timeout(self) -> None:
+        print('未在超时限制内接收到数据。')
+
+    def on_finish(self) -> None:
+        print(self.candlestick)
+        print('='*20)
+        # print(self.keypoint)
+        print('=' * 20)
+        self.draw()
+
+        self.api.close()
+        exit()
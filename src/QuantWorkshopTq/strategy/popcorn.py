@@ -8,7 +8,7 @@ __author__ = 'Bruce Frank Wong'
 根据MA判断方向。
 """
 
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Optional
 import os
 import logging
 import math
@@ -21,11 +21,13 @@ from tqsdk.objs import Account, Position, Quote, Order
 from tqsdk.entity import Entity
 
 from .base import StrategyBase
+from .risk import RiskLimit
 from ..define import (
     QWDirection,
     QWOffset,
     QWTradingTime,
     QWOrder,
+    QWOrderRecord,
     QWOrderManager,
     QWPosition,
     QWPositionManager
@@ -33,10 +35,10 @@ from ..define import (
 
 
 class PopcornStrategy(StrategyBase):
-    _name: str = 'Popcorn'
-
-    _margin_per_lot: float = 2000.0  # 每手保证金（大约）
+    strategy_name: str = 'Popcorn'
 
+    _capital: float             # 策略资金
+    _safety_rate: float         # 安全比例，保证金不超过 资金 × 安全比例
     _close_fluctuation: int
     _closeout: int
     _lots_per_order: int
@@ -48,22 +50,27 @@ class PopcornStrategy(StrategyBase):
                  api: TqApi,
                  capital: float,
                  safety_rate: float,
-                 close_fluctuation: int,  # 获利价差
+                 close_fluctuation: int,  # 获利价差（跳）
                  max_fluctuation: int,  # 报价范围
                  closeout: int,  # 强平价差
                  lots_per_order: int,  # 每笔委托手数
                  lots_per_price: int
                  ):
-        super().__init__(api=api, symbol='DCE.c2101', capital=capital, safety_rate=safety_rate)
+        super().__init__(api=api, symbol='DCE.c2101', risk_limit=RiskLimit(max_lots_per_price=lots_per_price))
+        self._capital = capital
+        self._safety_rate = safety_rate
+        # 保证金 = 合约价值 × 保证金比例 ≤ 资金 × 安全比例，折算成合约价值上限，由 risk_gate 检查
+        self.risk_gate.limit.max_notional = capital * safety_rate / self.contract_spec.margin_rate
         self._closeout = closeout
         self._close_fluctuation = close_fluctuation
         self._lots_per_order = lots_per_order
         self._lots_per_price = lots_per_price
         self._max_fluctuation = max_fluctuation
 
-        self._order_manager = QWOrderManager()
+        self._order_manager = QWOrderManager(self.contract_spec)
 
-        self._tq_position = self._api.get_position(self._symbol)
+        # 强平：多头亏损达到强平价差时，撤获利平仓单，在买一价卖平
+        self.enable_closeout(closeout, closeout)
 
         self._trading_time_list = [
             QWTradingTime(time(hour=21, minute=0, second=0), time(hour=23, minute=0, second=0)),
@@ -75,150 +82,112 @@ class PopcornStrategy(StrategyBase):
     def max_lots(self) -> int:
         """最大手数。
         最大手数 = (账户资金 × 安全比例 ) / 每手保证金
+        每手保证金 = 最新价 × 合约乘数 × 保证金比例，见 QWContractSpec。
         """
-        return math.floor(self._capital * self._safety_rate / self._margin_per_lot)
+        return self.contract_spec.max_lots(self._capital * self._safety_rate, self.tq_quote.last_price)
 
     @property
     def available_lots(self) -> int:
         """可用手数。
         可用手数 = 最大手数 - 持仓手数 - 挂单手数
         """
-        return self.max_lots - self._tq_position.pos_long - self._tq_position.pos_short
+        return self.max_lots - self.tq_position.pos_long - self.tq_position.pos_short
+
+    def is_valid_trading_time(self, t: time) -> bool:
+        return any(trading_time.open < t < trading_time.close for trading_time in self._trading_time_list)
 
     def is_open_condition_met(self, t: time, p: float) -> bool:
         """开仓条件是否满足
         开仓条件：
         1、在交易时间段内；
-        2、可用手数 > 0；
-        3、当前价位上手数 < 最大价位手数；
+        2、风控通过：保证金不超过 资金 × 安全比例，当前价位上手数不超过最大价位手数（见 RiskGate）。
         """
-        if (self.is_valid_trading_time(t) and
-                self.available_lots > 0 and
-                self._order_manager.unfilled_lots_at_price(p) < self._lots_per_price):
-            return True
+        return self.is_valid_trading_time(t) and self.risk_gate.is_allowed('BUY', 'OPEN', p, self._lots_per_order,
+                                                                          self.remote_datetime.timestamp())
+
+    def is_open_condition(self) -> bool:
+        return self.is_open_condition_met(self.remote_datetime.time(), self.price_ask)
+
+    def is_close_condition(self) -> bool:
+        # 平仓由成交后的获利平仓单和强平完成
+        return False
+
+    def load_status(self):
+        self.load_checkpoint()
+
+    def save_status(self):
+        self.save_checkpoint()
+
+    def get_status(self) -> dict:
+        status: dict = super().get_status()
+        status['order_manager'] = self._order_manager.save()
+        return status
+
+    def set_status(self, status: dict) -> None:
+        super().set_status(status)
+        self._order_manager.load(status['order_manager'])
+        self._order_manager.rebind(self.tq_order)
+
+    def apply_journal(self, op: str, args: list) -> None:
+        if op == 'manager_add':
+            self._order_manager.add(self.tq_order.get(args[0], QWOrderRecord(*args)))
+        elif op == 'manager_fill':
+            self._order_manager.fill(QWOrderRecord(*args))
         else:
-            return False
+            super().apply_journal(op, args)
 
     def run(self):
-        current_datetime: datetime
-        current_time: time
-        order_open: Order
-        order_close: Order
-        ordered_lots: int
-
-        self._logger.info(f'资金: {self._capital}, 最大持仓: {self.max_lots}')
-        while True:
-            self._api.wait_update()
-
-            # 当盘口行情发生变化
-            if self._api.is_changing(self._tq_quote, ['ask_price1', 'bid_price1']):
-
-                # tq_quote 中的信息
-                current_ask_price1 = self._tq_quote.ask_price1  # 当前卖一价
-                current_bid_price1 = self._tq_quote.bid_price1  # 当前买一价
-                current_datetime = datetime.fromisoformat(self._tq_quote.datetime)  # 当前 datetime
-                current_time = current_datetime.time()                              # 当前 time
-
-                if current_time not in self._trading_time_list():
-                    # log 当前状态
-                    self.log_status(datetime.fromisoformat(self._tq_quote.datetime))
-                    break
-
-                # 开仓条件满足时，开仓
-
-                ordered_lots: int = (self._order_manager.unfilled_lots_at_price(current_ask_price1) +
-                                     self._order_manager.unfilled_lots_at_price(current_bid_price1))
-                self._logger.info(f'计算已开仓手数: {ordered_lots}')
-                if (self.is_valid_trading_time(current_time) and
-                        (self._tq_position.pos_long + self._tq_position.pos_short) < self.max_lots and
-                        ordered_lots < self._lots_per_price):
-                    order_open = self._api.insert_order(symbol=self._symbol,
-                                                        direction='BUY',
-                                                        offset='OPEN',
-                                                        volume=self._lots_per_order,
-                                                        limit_price=current_ask_price1
-                                                        )
-                    self._api.wait_update()  # 等待生成 order_id
-                    self._order_manager.add(order_open)
-                    # print(self._tq_ticks.iloc[-1])
-                    self._logger.info(
-                        self._message_trade.format(datetime=self._tq_quote.datetime,
-                                                   capital=self._tq_account.available,
-                                                   lots=self._order_manager.unfilled_lots,
-                                                   D=order_open.direction,
-                                                   O=order_open.offset,
-                                                   volume=order_open.volume_orign,
-                                                   price=order_open.limit_price,
-                                                   order_id=order_open.exchange_order_id
-                                                   )
-                    )
-
-                # 尝试撤单
-                # if self.is_open_condition(self._ticks.iloc[-1]['ask_price1']):
-                #     order = self._api.insert_order(symbol=self._symbol,
-                #                                    direction='BUY',
-                #                                    offset='OPEN',
-                #                                    volume=self._lots_per_order,
-                #                                    limit_price=self._ticks.iloc[-1]['ask_price1']
-                #                                    )
-                #     self._order_manager.add(order)
-
-            # TODO: 为什么 tq_order 内部数据类型是 tqsdk.objs.Quote？ 不应该是 tqsdk.objs.Order 吗？
-            # if self._api.is_changing(self._tq_order):
-            #     tq_order_id: str
-            #
-            #     for tq_order_id in self._tq_order:
-            #         print('TQ order id :', tq_order_id, '; object type: ', type(self._tq_quote))
-            #         print(self._tq_quote.items())
-
-            # 尝试平仓
-            for order in self._order_manager.unfilled_order_list:
-                if order.status == 'FINISHED':
-                    self._logger.info(self._message_fill.format(datetime=self._tq_quote.datetime,
-                                                                volume=order.volume_orign,
-                                                                price=order.limit_price,
-                                                                order_id=order.exchange_order_id)
-                                      )
-                    self._order_manager.fill(order)
-                    if order.offset == 'OPEN':
-                        if order.direction == 'BUY':
-                            order_close = self._api.insert_order(symbol=self._symbol,
-                                                                 direction='SELL',
-                                                                 offset='CLOSE',
-                                                                 volume=order.volume_orign,
-                                                                 limit_price=order.limit_price + self._close_fluctuation
-                                                                 )
-                            self._api.wait_update()  # 等待生成 order_id
-                            self._order_manager.add(order_close)
-                            self._logger.info(self._message_close_buy.format(datetime=self._tq_quote.datetime,
-                                                                             volume=order_close.volume_orign,
-                                                                             price=order_close.limit_price,
-                                                                             order_id=order_close.exchange_order_id)
-                                              )
-                        else:
-                            order_close = self._api.insert_order(symbol=self._symbol,
-                                                                 direction='BUY',
-                                                                 offset='CLOSE',
-                                                                 volume=order.volume_orign,
-                                                                 limit_price=order.limit_price - self._close_fluctuation
-                                                                 )
-                            self._api.wait_update()  # 等待生成 order_id
-                            self._order_manager.add(order_close)
-                            self._logger.info(self._message_close_sell.format(datetime=self._tq_quote.datetime,
-                                                                              volume=order_close.volume_orign,
-                                                                              price=order_close.limit_price,
-                                                                              order_id=order_close.exchange_order_id)
-                                              )
-                    else:
-                        self._logger.info(self._message_close_buy.format(datetime=self._tq_quote.datetime,
-                                                                         volume=order.volume_orign,
-                                                                         price=order.limit_price,
-                                                                         order_id=order.exchange_order_id)
-                                          )
-
-            # self._api.wait_update()
-            # if self._api.is_changing(self._realtime_order):
-            #     self._logger.info('order变化', self._realtime_order.items())
+        self.logger.info(f'资金: {self._capital}, 最大持仓: {self.max_lots}')
+        super().run()
+
+    def on_quote(self, quote: Quote) -> None:
+        """
+        盘口变化时，开仓条件满足则开仓。
+        """
+        current_time: time = self.remote_datetime.time()
+        if not self.is_valid_trading_time(current_time):
+            # log 当前状态
+            self.log_status()
+            return
+
+        # 开仓条件满足时，开仓
+        ordered_lots: int = (self.risk_gate.lots_at_price(self.price_ask) +
+                             self.risk_gate.lots_at_price(self.price_bid))
+        self.logger.info(f'计算已开仓手数: {ordered_lots}')
+        if self.is_open_condition_met(current_time, self.price_ask):
+            order_open: Optional[Order] = self.insert_order('BUY', 'OPEN', self._lots_per_order, self.price_ask)
+            if order_open is None:
+                return
+            self._order_manager.add(order_open)
+            self.journal('manager_add', QWOrderRecord.from_order(order_open).to_list())
+            self.log_order(order_open)
+
+    def on_order(self, order: Order) -> None:
+        """
+        委托单成交后，开仓单按获利价差挂平仓单。
+        """
+        if order.status != 'FINISHED' or not self._order_manager.is_unfilled(order):
+            return
+        order_close: Optional[Order]
+
+        self.log_fill(order, ', '.join(order.trade_records.keys()))
+        self._order_manager.fill(order)
+        self.journal('manager_fill', QWOrderRecord.from_order(order).to_list())
+        if order.offset == 'OPEN':
+            if order.direction == 'BUY':
+                order_close = self.insert_order('SELL', 'CLOSE', order.volume_orign,
+                                                self.contract_spec.add_ticks(order.limit_price,
+                                                                             self._close_fluctuation))
+            else:
+                order_close = self.insert_order('BUY', 'CLOSE', order.volume_orign,
+                                                self.contract_spec.add_ticks(order.limit_price,
+                                                                             -self._close_fluctuation))
+            if order_close is None:
+                return
+            self.link_closeout(order_close, order.order_id)
+            self._order_manager.add(order_close)
+            self.journal('manager_add', QWOrderRecord.from_order(order_close).to_list())
+            self.log_order(order_close)
 
         # while self._status['position'] == 0:
         #     self._api.wait_update()
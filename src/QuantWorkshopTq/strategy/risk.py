@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块是下单前的风控检查。
+
+RiskGate 维护一组计数器（多空持仓、多空挂开仓、多空挂平仓、各价位挂单手数、最近的下单时间），
+在下单和委托单回报时增量更新，下单前的检查只读计数器，耗时与委托单数量无关。
+价格在入口处换算为整数价格（跳，见 QWContractSpec.to_tick），各价位挂单手数是以整数价格为下标的数组。
+"""
+
+
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+from collections import deque
+import time
+
+from tqsdk.objs import Order
+
+from QuantWorkshopTq.define import QWContractSpec, QWPriceLadder, QWSparsePriceLadder, create_price_ladder
+from QuantWorkshopTq.define.contract import get_fallback_spec
+
+
+class RiskLimit(object):
+    """
+    风控参数。为 None 的项不检查。
+    """
+    max_position: Optional[int]         # 最大持仓手数（多 + 空，含挂开仓单）
+    max_lots_per_side: Optional[int]    # 单边最大持仓手数（含挂开仓单）
+    max_lots_per_price: Optional[int]   # 每价位最大挂单手数（只检查开仓单）
+    max_order_volume: Optional[int]     # 每笔最大手数
+    max_notional: Optional[float]       # 最大持仓合约价值（含挂开仓单），需要合约规格
+    max_order_per_second: Optional[int]     # 每秒最多下单笔数
+
+    def __init__(self,
+                 max_position: Optional[int] = None,
+                 max_lots_per_side: Optional[int] = None,
+                 max_lots_per_price: Optional[int] = None,
+                 max_order_volume: Optional[int] = None,
+                 max_notional: Optional[float] = None,
+                 max_order_per_second: Optional[int] = None):
+        self.max_position = max_position
+        self.max_lots_per_side = max_lots_per_side
+        self.max_lots_per_price = max_lots_per_price
+        self.max_order_volume = max_order_volume
+        self.max_notional = max_notional
+        self.max_order_per_second = max_order_per_second
+
+
+class RiskGate(object):
+    """
+    下单前风控。
+
+    用法：
+        1, 下单前调用 check()，返回 None 表示通过，否则为拒绝原因；
+        2, 下单后调用 on_insert()；
+        3, 每次委托单回报调用 on_order()，按 volume_left、status 的变化更新成交和撤单。
+    """
+    limit: RiskLimit
+    contract_spec: Optional[QWContractSpec]
+    _tick_spec: QWContractSpec          # 换算整数价格，没有合约规格时见 get_fallback_spec
+
+    position_long: int          # 多头持仓
+    position_short: int         # 空头持仓
+    opening_long: int           # 挂单中的买开手数
+    opening_short: int          # 挂单中的卖开手数
+    closing_long: int           # 挂单中平多头的手数（卖平）
+    closing_short: int          # 挂单中平空头的手数（买平）
+
+    _lots_at_tick: Union[QWPriceLadder, QWSparsePriceLadder]    # 整数价格 -> 挂单手数，没有合约规格时为稀疏价位表
+    _order_state: Dict[str, Tuple[str, str, Optional[int], int]]    # 委托单号 -> (方向, 开平, 整数价格, 未成交手数)，市价单的整数价格为 None
+    _finished_set: Set[str]                             # 最近完结的委托单号，重复回报时跳过
+    _finished_queue: deque                              # 完结顺序，超过 finished_window 时去除最早的
+    finished_window: int = 4096                         # 保留的完结委托单号数量
+    _insert_time: deque                                 # 最近 max_order_per_second 笔下单时间
+
+    def __init__(self, limit: RiskLimit, contract_spec: Optional[QWContractSpec] = None):
+        self.limit = limit
+        self.contract_spec = contract_spec
+        self._tick_spec = contract_spec if contract_spec is not None else get_fallback_spec()
+        self.position_long = 0
+        self.position_short = 0
+        self.opening_long = 0
+        self.opening_short = 0
+        self.closing_long = 0
+        self.closing_short = 0
+        self._lots_at_tick = create_price_ladder(contract_spec is not None)
+        self._order_state = {}
+        self._finished_set = set()
+        self._finished_queue = deque()
+        self._insert_time = deque(maxlen=limit.max_order_per_second or 1)
+
+    def sync_position(self, position_long: int, position_short: int) -> None:
+        """
+        以实际持仓校正持仓计数器，启动时或断线重连后调用。
+        """
+        self.position_long = position_long
+        self.position_short = position_short
+
+    def lots_at_price(self, price: float) -> int:
+        return self._lots_at_tick.at(self._tick_spec.to_tick(price))
+
+    def save(self) -> dict:
+        """
+        保存计数器和委托单状态（不含下单时间）。
+        """
+        return {
+            'position': [self.position_long, self.position_short],
+            'opening': [self.opening_long, self.opening_short],
+            'closing': [self.closing_long, self.closing_short],
+            'lots_at_tick': self._lots_at_tick.items(),
+            'order_state': [[order_id] + list(state) for order_id, state in self._order_state.items()],
+            'finished': list(self._finished_queue),
+        }
+
+    def load(self, status: dict) -> None:
+        """
+        恢复 save() 保存的状态。之后应调用 sync_position() 以实际持仓校正。
+        """
+        self.position_long, self.position_short = status['position']
+        self.opening_long, self.opening_short = status['opening']
+        self.closing_long, self.closing_short = status['closing']
+        self._lots_at_tick.clear()
+        for tick, lots in status['lots_at_tick']:
+            self._lots_at_tick.add(tick, lots)
+        self._order_state = {order_id: tuple(state) for order_id, *state in status['order_state']}
+        self._finished_queue = deque(status['finished'])
+        self._finished_set = set(self._finished_queue)
+
+    def reconcile(self, order_list: Iterable[Order]) -> None:
+        """
+        恢复后以天勤的委托单校正挂单：停机期间成交、撤销的委托单重启后不会再有变化回报，在此逐个重放；
+        不在天勤委托单中的（如前一交易日的）去除。之后应调用 sync_position()。
+        """
+        order_dict: Dict[str, Order] = {order.order_id: order for order in order_list}
+        for order_id in [order_id for order_id in self._order_state if order_id not in order_dict]:
+            direction, offset, tick, volume_left = self._order_state.pop(order_id)
+            self._add_resting(direction, offset, tick, -volume_left)
+        for order in order_dict.values():
+            self.on_order(order)
+
+    @property
+    def total_position(self) -> int:
+        return self.position_long + self.position_short
+
+    @property
+    def resting_lots(self) -> int:
+        return self.opening_long + self.opening_short + self.closing_long + self.closing_short
+
+    def check(self,
+              direction: str,
+              offset: str,
+              price: float,
+              volume: int,
+              now: Optional[float] = None) -> Optional[str]:
+        """
+        :param direction: BUY / SELL
+        :param offset: OPEN / CLOSE / CLOSETODAY
+        :param now: 当前时间（秒），回测时传入行情时间，默认为 time.monotonic()。
+        :return: None 表示通过，否则为拒绝原因。
+        """
+        limit: RiskLimit = self.limit
+        if volume <= 0:
+            return f'委托手数 {volume} 无效'
+        if limit.max_order_volume is not None and volume > limit.max_order_volume:
+            return f'每笔手数 {volume} > {limit.max_order_volume}'
+
+        if limit.max_order_per_second is not None and len(self._insert_time) == limit.max_order_per_second:
+            if now is None:
+                now = time.monotonic()
+            if now - self._insert_time[0] < 1.0:
+                return f'每秒下单超过 {limit.max_order_per_second} 笔'
+
+        if offset == 'OPEN':
+            if limit.max_lots_per_price is not None:
+                lots: int = self.lots_at_price(price)
+                if lots + volume > limit.max_lots_per_price:
+                    return f'价位 {price} 挂单 {lots} + {volume} > {limit.max_lots_per_price}'
+            is_long: bool = direction == 'BUY'
+            side: int = (self.position_long + self.opening_long) if is_long \
+                else (self.position_short + self.opening_short)
+            total: int = self.total_position + self.opening_long + self.opening_short
+            if limit.max_lots_per_side is not None and side + volume > limit.max_lots_per_side:
+                return f'{"多" if is_long else "空"}头 {side} + {volume} > {limit.max_lots_per_side}'
+            if limit.max_position is not None and total + volume > limit.max_position:
+                return f'总持仓 {total} + {volume} > {limit.max_position}'
+            if limit.max_notional is not None and self.contract_spec is not None:
+                notional: float = (total + volume) * price * self.contract_spec.multiplier
+                if notional > limit.max_notional:
+                    return f'合约价值 {notional:,.0f} > {limit.max_notional:,.0f}'
+        else:
+            # 卖平平多头，买平平空头
+            if direction == 'SELL':
+                available: int = self.position_long - self.closing_long
+            else:
+                available = self.position_short - self.closing_short
+            if volume > available:
+                return f'可平手数 {available} < {volume}'
+        return None
+
+    def is_allowed(self, direction: str, offset: str, price: float, volume: int, now: Optional[float] = None) -> bool:
+        return self.check(direction, offset, price, volume, now) is None
+
+    def _add_resting(self, direction: str, offset: str, tick: Optional[int], volume: int) -> None:
+        if tick is not None:
+            self._lots_at_tick.add(tick, volume)
+        if offset == 'OPEN':
+            if direction == 'BUY':
+                self.opening_long += volume
+            else:
+                self.opening_short += volume
+        elif direction == 'SELL':
+            self.closing_long += volume
+        else:
+            self.closing_short += volume
+
+    def _add_fill(self, direction: str, offset: str, volume: int) -> None:
+        if offset == 'OPEN':
+            if direction == 'BUY':
+                self.position_long += volume
+            else:
+                self.position_short += volume
+        elif direction == 'SELL':
+            self.position_long -= volume
+        else:
+            self.position_short -= volume
+
+    def on_insert(self,
+                  order_id: str,
+                  direction: str,
+                  offset: str,
+                  price: float,
+                  volume: int,
+                  now: Optional[float] = None) -> None:
+        """
+        已发出委托单。
+        """
+        self._insert_time.append(time.monotonic() if now is None else now)
+        tick: int = self._tick_spec.to_tick(price)
+        self._order_state[order_id] = (direction, offset, tick, volume)
+        self._add_resting(direction, offset, tick, volume)
+
+    def _add_finished(self, order_id: str) -> None:
+        """
+        重复的完结回报只在完结后不久出现，只保留最近 finished_window 个，快照大小不随交易日内委托单数增长。
+        """
+        self._finished_set.add(order_id)
+        self._finished_queue.append(order_id)
+        if len(self._finished_queue) > self.finished_window:
+            self._finished_set.discard(self._finished_queue.popleft())
+
+    def on_order(self, order: Order) -> None:
+        """
+        委托单回报。成交部分计入持仓，撤销部分从挂单中扣除；不是经 on_insert 发出的委托单（如手工下单）也会计入。
+        """
+        if order.order_id in self._finished_set:
+            return
+        state: Optional[Tuple[str, str, Optional[int], int]] = self._order_state.get(order.order_id)
+        if state is None:
+            # 手工下的市价单没有限价（limit_price 为 NaN），不计入价位手数，手数仍计入挂单和持仓
+            price: float = order.limit_price
+            tick: Optional[int] = self._tick_spec.to_tick(price) if price == price else None
+            state = (order.direction, order.offset, tick, order.volume_orign)
+            self._add_resting(*state)
+        direction, offset, tick, volume_left = state
+
+        filled: int = volume_left - order.volume_left
+        if filled > 0:
+            self._add_resting(direction, offset, tick, -filled)
+            self._add_fill(direction, offset, filled)
+            volume_left = order.volume_left
+
+        if order.status == 'FINISHED':
+            if volume_left > 0:
+                self._add_resting(direction, offset, tick, -volume_left)
+            self._order_state.pop(order.order_id, None)
+            self._add_finished(order.order_id)
+        else:
+            self._order_state[order.order_id] = (direction, offset, tick, volume_left)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块是基于 asyncio 的策略运行环境。
+
+多个策略共用一个 TqApi 连接：每个策略的 run_async() 是 api 上的一个任务（api.create_task），
+只在自己订阅的对象更新时被唤醒（register_update_notify），某个策略出错只停止该策略，不影响其他策略。
+主线程只负责循环调用 wait_update()，驱动 api 的事件循环。
+账户的委托单、成交由各策略按合约过滤（StrategyBase.is_own），因此共用一个 api 的策略不能交易同一合约。
+
+同一个事件循环上的其他任务：
+    定时任务:   add_periodic()，阻塞的函数（写数据库、写文件）在单独的线程中按顺序执行，不阻塞行情；
+                保存状态（save_status / save_checkpoint）读取 dispatch() 正在修改的状态，须在事件循环中执行（blocking=False）；
+    日志:       各策略 logger 的 handler 改由 QueueListener 线程写出，策略中的 logger.info() 只是入队；
+    监控:       serve_health() 提供 HTTP 状态查询，GET 任意路径返回 JSON。
+
+    api = TqApi(...)
+    runtime = StrategyRuntime(api)
+    scalping = Scalping(api, settings)
+    runtime.add_strategy(scalping)
+    runtime.add_strategy(TestStrategy(api, settings))
+    runtime.add_periodic('save_status', scalping.save_status, 60)
+    runtime.serve_health(port=8900)
+    runtime.run()
+"""
+
+
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tqsdk import TqApi, BacktestFinished
+
+from .base import StrategyBase
+
+
+class StrategyState(object):
+    """
+    策略任务的运行状态，供监控查询。
+    """
+    name: str
+    strategy: StrategyBase
+    task: Optional[asyncio.Task]
+    update_count: int               # dispatch 次数
+    last_update: Optional[float]    # 最近一次 dispatch 的本机时间戳
+    error: Optional[str]            # 出错停止时的异常信息
+
+    def __init__(self, name: str, strategy: StrategyBase):
+        self.name = name
+        self.strategy = strategy
+        self.task = None
+        self.update_count = 0
+        self.last_update = None
+        self.error = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return 'failed'
+        if self.task is None:
+            return 'pending'
+        if self.task.done():
+            return 'stopped'
+        return 'running'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'status': self.status,
+            'update_count': self.update_count,
+            'last_update': self.last_update,
+            'error': self.error,
+        }
+
+
+class StrategyRuntime(object):
+    """
+    策略运行环境。
+    """
+    api: TqApi
+    timeout: int
+    logger: logging.Logger
+
+    _state_dict: Dict[str, StrategyState]
+    _task_list: List[asyncio.Task]                  # 定时任务、监控服务
+    _executor: ThreadPoolExecutor                   # 执行阻塞函数，单线程，保证写入顺序
+    _log_listener_list: List[logging.handlers.QueueListener]
+    _start_time: Optional[float]
+
+    def __init__(self, api: TqApi, timeout: int = 5):
+        self.api = api
+        self.timeout = timeout
+        self.logger = logging.getLogger('StrategyRuntime')
+        self._state_dict = {}
+        self._task_list = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='QWRuntime')
+        self._log_listener_list = []
+        self._start_time = None
+
+    def add_strategy(self, strategy: StrategyBase, name: Optional[str] = None) -> str:
+        """
+        :param strategy: 策略，应以 runtime 的 api 创建。
+        :param name: 策略名称，默认为 策略名@合约代码。
+        :return: 策略名称。
+        """
+        if strategy.api is not self.api:
+            raise ValueError(f'Strategy <{strategy.strategy_name}> should be created with the same api as runtime.')
+        if name is None:
+            name = f'{strategy.strategy_name}@{strategy.symbol}'
+        if name in self._state_dict:
+            raise ValueError(f'Strategy name <{name}> is already used.')
+        for state in self._state_dict.values():
+            if set(self._symbol_list(state.strategy)) & set(self._symbol_list(strategy)):
+                raise ValueError(f'Strategy <{state.name}> already trades <{strategy.symbol}>, '
+                                 f'orders of the same symbol can not be told apart.')
+        self._state_dict[name] = StrategyState(name, strategy)
+        return name
+
+    @staticmethod
+    def _symbol_list(strategy: StrategyBase) -> List[str]:
+        return [strategy.symbol] if isinstance(strategy.symbol, str) else list(strategy.symbol)
+
+    def run_blocking(self, func: Callable, *args) -> asyncio.Future:
+        """
+        在后台线程中执行阻塞函数，返回可 await 的 Future。
+        """
+        return asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def add_periodic(self, name: str, func: Callable[[], Any], interval: float, blocking: bool = False) -> None:
+        """
+        每 interval 秒执行一次 func。
+        :param blocking: func 是否阻塞（访问数据库、文件等），阻塞的函数在后台线程中执行，与 dispatch() 同时运行，
+                         不能读写策略状态。
+        """
+        async def periodic():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    if blocking:
+                        await self.run_blocking(func)
+                    else:
+                        func()
+                except Exception:
+                    self.logger.exception(f'Periodic task <{name}> failed.')
+
+        self._task_list.append(self.api.create_task(periodic()))
+
+    def serve_health(self, host: str = '127.0.0.1', port: int = 8900) -> None:
+        """
+        启动 HTTP 状态服务，返回 status() 的 JSON。全部策略都在运行时状态码为 200，否则为 503。
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                await reader.readline()
+                status: Dict[str, Any] = self.status()
+                body: bytes = json.dumps(status, ensure_ascii=False).encode('utf-8')
+                code: str = '200 OK' if status['healthy'] else '503 Service Unavailable'
+                writer.write(f'HTTP/1.0 {code}\r\n'
+                             f'Content-Type: application/json; charset=utf-8\r\n'
+                             f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        async def serve():
+            server = await asyncio.start_server(handle, host, port)
+            async with server:
+                await server.serve_forever()
+
+        self._task_list.append(self.api.create_task(serve()))
+
+    def status(self) -> Dict[str, Any]:
+        state_list: List[Dict[str, Any]] = [state.to_dict() for state in self._state_dict.values()]
+        return {
+            'healthy': all(state['status'] == 'running' for state in state_list),
+            'uptime': time.time() - self._start_time if self._start_time else 0.0,
+            'strategy': state_list,
+        }
+
+    def _attach_log_queue(self, logger: logging.Logger) -> None:
+        """
+        logger 的 handler 改由后台线程写出。
+        """
+        if not logger.handlers:
+            return
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        listener.start()
+        self._log_listener_list.append(listener)
+
+    async def _run_strategy(self, state: StrategyState):
+        strategy: StrategyBase = state.strategy
+        try:
+            async with self.api.register_update_notify(strategy.notify_list()) as update_chan:
+                async for _ in update_chan:
+                    strategy.dispatch()
+                    state.update_count += 1
+                    state.last_update = time.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            state.error = repr(e)
+            strategy.logger.exception(f'Strategy <{state.name}> stopped.')
+
+    def start(self) -> None:
+        """
+        为每个策略创建任务。run() 会调用，自行驱动 wait_update() 时手动调用。
+        """
+        self._start_time = time.time()
+        for logger in {state.strategy.logger for state in self._state_dict.values()} | {self.logger}:
+            self._attach_log_queue(logger)
+        for state in self._state_dict.values():
+            state.task = self.api.create_task(self._run_strategy(state))
+
+    def stop(self) -> None:
+        """
+        取消全部任务，等待后台写入完成，关闭 api。
+        """
+        for state in self._state_dict.values():
+            if state.task is not None:
+                state.task.cancel()
+            state.strategy.save_checkpoint()
+            state.strategy.dump_latency()
+            state.strategy.on_stop()
+        for task in self._task_list:
+            task.cancel()
+        self._executor.shutdown(wait=True)
+        self.api.close()
+        for listener in self._log_listener_list:
+            listener.stop()
+        self._log_listener_list = []
+
+    def run(self) -> None:
+        """
+        运行全部策略，直到回测结束或 KeyboardInterrupt。
+        """
+        self.start()
+        try:
+            while True:
+                if not self.api.wait_update(deadline=time.time() + self.timeout):
+                    for state in self._state_dict.values():
+                        state.strategy.on_timeout()
+        except (BacktestFinished, KeyboardInterrupt):
+            pass
+        finally:
+            self.stop()
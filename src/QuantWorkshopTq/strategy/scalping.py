@@ -29,10 +29,9 @@ __author__ = 'Bruce Frank Wong'
 
 
 from typing import Dict, List, Optional
-import time
 import datetime
 
-from tqsdk import TqApi, BacktestFinished
+from tqsdk import TqApi
 from tqsdk.objs import Account, Position, Quote, Order, Trade
 from tqsdk.entity import Entity
 from tqsdk.tafunc import time_to_datetime
@@ -41,8 +40,10 @@ from pandas import DataFrame
 from sqlalchemy.orm.exc import NoResultFound
 
 from . import StrategyBase, StrategyParameter
+from .risk import RiskLimit
+from .sweeper import OrderSweeper
 from ..database import (
-    db_session,
+    session_scope,
     BacktestRecord,
     BacktestOrder,
     BacktestTrade,
@@ -54,7 +55,7 @@ __all__ = 'strategy_parameter', 'Scalping'
 
 parameter: List[str] = [
     'max_position',         # 最大持仓手数
-    'close_spread',         # 平仓价差
+    'close_spread',         # 平仓价差（跳）
     'order_range',          # 挂单范围
     'closeout_long',        # 多单强平点差
     'closeout_short',       # 空单强平点差
@@ -71,21 +72,18 @@ def is_trading_time(t: datetime.time, tt_list: list) -> bool:
     return False
 
 
-def lots_at_price(order: Entity, p: float) -> int:
-    order_id: str
-    order: Order
-    lots: int = 0
-    for order_id, order in order.items():
-        if order.limit_price == p:
-            lots += order.volume_left
-    return lots
-
-
 class Scalping(StrategyBase):
     strategy_name: str = 'Scalping'
+    max_cancel_per_second: int = 10     # 每秒最多撤单笔数
+    sweeper: OrderSweeper
 
     def __init__(self, api: TqApi, settings: StrategyParameter):
-        super().__init__(api=api, symbol='DCE.c2101', settings=settings)
+        super().__init__(api=api,
+                         symbol='DCE.c2101',
+                         settings=settings,
+                         risk_limit=RiskLimit(max_position=settings.get_parameter('max_position'),
+                                              max_lots_per_price=settings.get_parameter('volume_per_price'))
+                         )
 
         self.trading_time: List[Dict[str, datetime.time]] = [
             {
@@ -111,6 +109,19 @@ class Scalping(StrategyBase):
         self.price_ask = 0.0
         self.price_bid = 0.0
 
+        # 撤单：距离买一价/卖一价达到 order_range 跳的开仓单
+        self.sweeper = OrderSweeper(self.api, self.contract_spec, settings.get_parameter('order_range'),
+                                    max_cancel_per_second=self.max_cancel_per_second)
+
+        # 强平：亏损达到 closeout_long / closeout_short 跳时，撤获利平仓单，按对手价平仓
+        self.enable_closeout(settings.get_parameter('closeout_long'), settings.get_parameter('closeout_short'))
+
+        # 实盘中途重启时，恢复挂单、持仓计数和已处理的成交
+        if not self.is_backtest:
+            self.enable_checkpoint()
+            self.load_status()
+            self.sweeper.sync(self.tq_order)
+
     def is_trading_time(self, t: datetime.datetime) -> bool:
         trading_time: Dict[str, datetime.time]
         for trading_time in self.trading_time:
@@ -134,35 +145,38 @@ class Scalping(StrategyBase):
         return False
 
     def db_add_order(self, order: Order, opponent_order_id: Optional[str] = None):
-        if opponent_order_id:
-            db_order = db_session.query(BacktestOrder).filter_by(order_id=opponent_order_id).one()
-            if db_order.opponent:
-                raise ValueError(f'Order with id <{opponent_order_id}> already has opponent order.')
-            else:
-                db_order.opponent = order.order_id
-        new_order = BacktestOrder(datetime=datetime.datetime.now(),
-                                  order_id=order.order_id,
-                                  direction=order.direction,
-                                  offset=order.offset,
-                                  price=order.limit_price,
-                                  volume=order.volume_orign,
-                                  status='ALIVE',
-                                  opponent=opponent_order_id,
-                                  backtest_record_id=self.backtest_record_id
-                                  )
-        db_session.add(new_order)
-        db_session.commit()
-
-    @staticmethod
-    def get_unfilled_order() -> List[Order]:
-        return db_session.query(BacktestOrder).filter_by(status='ALIVE').all()
-
-    @staticmethod
-    def get_trade(trade_id: str) -> Optional[BacktestTrade]:
-        try:
-            return db_session.query(BacktestTrade).filter_by(trade_id=trade_id).one()
-        except NoResultFound:
-            return None
+        with session_scope() as session:
+            if opponent_order_id:
+                db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                  order_id=opponent_order_id).one()
+                if db_order.opponent:
+                    raise ValueError(f'Order with id <{opponent_order_id}> already has opponent order.')
+                else:
+                    db_order.opponent = order.order_id
+            new_order = BacktestOrder(insert_datetime=self.remote_datetime,
+                                      order_id=order.order_id,
+                                      direction=order.direction,
+                                      offset=order.offset,
+                                      price=order.limit_price,
+                                      volume_orign=order.volume_orign,
+                                      volume_left=order.volume_orign,
+                                      status='ALIVE',
+                                      opponent=opponent_order_id,
+                                      backtest_id=self.backtest_record_id
+                                      )
+            session.add(new_order)
+
+    def get_unfilled_order(self) -> List[BacktestOrder]:
+        with session_scope() as session:
+            return session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id, status='ALIVE').all()
+
+    def get_trade(self, trade_id: str) -> Optional[BacktestTrade]:
+        with session_scope() as session:
+            try:
+                return session.query(BacktestTrade).filter_by(backtest_id=self.backtest_record_id,
+                                                              trade_id=trade_id).one()
+            except NoResultFound:
+                return None
 
     def close_before_market_close(self):
         """
@@ -174,25 +188,14 @@ class Scalping(StrategyBase):
         for order in self.get_unfilled_order():
             self.api.cancel_order(order.order_id)
 
+        # 未撤掉的平仓单仍占用可平手数，风控会拒绝多出的部分
         if self.tq_position.pos_long > 0:
             # 在 买一价 上 卖平。
-            self.api.insert_order(
-                symbol=self.symbol,
-                direction='SELL',
-                offset='CLOSE',
-                volume=self.tq_position.pos_long,
-                limit_price=self.price_bid
-            )
+            self.insert_order('SELL', 'CLOSE', self.tq_position.pos_long, self.price_bid)
 
         if self.tq_position.pos_short > 0:
             # 在 卖一价 上 买平。
-            self.api.insert_order(
-                symbol=self.symbol,
-                direction='BUY',
-                offset='CLOSE',
-                volume=self.tq_position.pos_short,
-                limit_price=self.price_ask
-            )
+            self.insert_order('BUY', 'CLOSE', self.tq_position.pos_short, self.price_ask)
 
     def is_open_condition(self) -> bool:
         """
@@ -203,30 +206,25 @@ class Scalping(StrategyBase):
         3、根据 均线？MACD？判断多空。
         :return:
         """
-        max_position = self.settings['max_position']
-        position_long = self.tq_position.pos_long
-        position_short = self.tq_position.pos_short
-        total_position = position_long + position_short
-
-        lots_at_bid = lots_at_price(self.tq_order, self.price_bid)
-        lots_at_ask = lots_at_price(self.tq_order, self.price_ask)
         volume_per_order = self.settings['volume_per_order']
         volume_per_price = self.settings['volume_per_price']
+        lots_at_bid = self.risk_gate.lots_at_price(self.price_bid)
+        lots_at_ask = self.risk_gate.lots_at_price(self.price_ask)
 
-        is_position_available = True if total_position < max_position else False
-        is_lots_available = True if lots_at_bid + lots_at_ask + volume_per_order < volume_per_price else False
-
-        return is_lots_available and is_position_available
+        # 最大持仓（含挂开仓单）、每价位挂单手数、下单频率由 risk_gate 检查
+        is_lots_available = lots_at_bid + lots_at_ask + volume_per_order < volume_per_price
+        return is_lots_available and self.risk_gate.is_allowed('BUY', 'OPEN', self.price_bid, volume_per_order,
+                                                               self.remote_datetime.timestamp())
 
     def is_close_condition(self) -> bool:
         print('NotImplemented')
         return False
 
     def load_status(self):
-        print('NotImplemented')
+        self.load_checkpoint()
 
     def save_status(self):
-        print('NotImplemented')
+        self.save_checkpoint()
 
     def handle_orders(self, order: Order):
         """
@@ -267,179 +265,162 @@ class Scalping(StrategyBase):
             else:
                 new_status = '报单'
 
-        if new_status == '报单':
-            try:
-                # 存在报单回报信息滞后的情况。所以还不能触发异常。
-                db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                # if db_order:
-                #     raise RuntimeError('新报单不应该在数据库中有记录，但是在数据库中查到了。')
-            except NoResultFound:
-                db_session.add(
-                    BacktestOrder(
-                        insert_datetime=time_to_datetime(order.insert_date_time),
-                        order_id=order.order_id,
-                        direction=order.direction,
-                        offset=order.offset,
-                        price=order.limit_price,
-                        volume_orign=order.volume_orign,
-                        volume_left=order.volume_orign,
-                        status='ALIVE',
-                        backtest_id=self.backtest_record_id
-                    )
-                )
-                db_session.commit()
-
-            self.log_accept(order)
-
-        if new_status == '全部成交' or new_status == '部分成交':
-            # 修正 order 状态
-            try:
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                db_order.status = new_status
-                db_order.last_datetime = self.remote_datetime
-                db_order.volume_left = order.volume_left
-                db_session.commit()
-
-            except NoResultFound:
-                # 有报单即成交的可能
-
-                db_session.add(
-                    BacktestOrder(
-                        insert_datetime=time_to_datetime(order.insert_date_time),
-                        order_id=order.order_id,
-                        direction=order.direction,
-                        offset=order.offset,
-                        price=order.limit_price,
-                        volume_orign=order.volume_orign,
-
-                        status=new_status,
-                        last_datetime=self.remote_datetime,
-                        volume_left=order.volume_left,
-                        backtest_id=self.backtest_record_id
+        with session_scope() as session:
+            if new_status == '报单':
+                try:
+                    # 存在报单回报信息滞后的情况。所以还不能触发异常。
+                    session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                           order_id=order.order_id).one()
+                    # if db_order:
+                    #     raise RuntimeError('新报单不应该在数据库中有记录，但是在数据库中查到了。')
+                except NoResultFound:
+                    session.add(
+                        BacktestOrder(
+                            insert_datetime=time_to_datetime(order.insert_date_time),
+                            order_id=order.order_id,
+                            direction=order.direction,
+                            offset=order.offset,
+                            price=order.limit_price,
+                            volume_orign=order.volume_orign,
+                            volume_left=order.volume_orign,
+                            status='ALIVE',
+                            backtest_id=self.backtest_record_id
+                        )
                     )
-                )
-                db_session.commit()
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
+                    session.commit()
 
                 self.log_accept(order)
 
-            # 查询 trade
-            for _, trade in order.trade_records.items():
-                # 新 trade
-                if not self.get_trade(trade.trade_id):
-                    try:
-                        db_trade = db_session.query(BacktestTrade).filter_by(trade_id=trade.trade_id).one()
-                        if db_trade:
-                            raise RuntimeError('新成交记录不应该在数据库中有记录，但是在数据库中查到了。')
-                    except NoResultFound:
-                        db_session.add(
-                            BacktestTrade(
-                                backtest_id=self.backtest_record_id,
-                                backtest_order_id=db_order.id,
-                                order_id=order.order_id,
-                                trade_id=trade.trade_id,
-                                datetime=time_to_datetime(trade.trade_date_time),
-                                exchange_trade_id=trade.exchange_trade_id,
-                                exchange_id=trade.exchange_id,
-                                instrument_id=trade.instrument_id,
-                                direction=trade.direction,
-                                offset=trade.offset,
-                                price=trade.price,
-                                volume=trade.volume
-                            )
+            if new_status == '全部成交' or new_status == '部分成交':
+                # 修正 order 状态
+                try:
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+                    db_order.status = new_status
+                    db_order.last_datetime = self.remote_datetime
+                    db_order.volume_left = order.volume_left
+                    session.commit()
+
+                except NoResultFound:
+                    # 有报单即成交的可能
+
+                    session.add(
+                        BacktestOrder(
+                            insert_datetime=time_to_datetime(order.insert_date_time),
+                            order_id=order.order_id,
+                            direction=order.direction,
+                            offset=order.offset,
+                            price=order.limit_price,
+                            volume_orign=order.volume_orign,
+
+                            status=new_status,
+                            last_datetime=self.remote_datetime,
+                            volume_left=order.volume_left,
+                            backtest_id=self.backtest_record_id
                         )
-                        db_session.commit()
-
-                        # 对已成交开仓单下平仓委托单。
-                        if db_order.offset == 'OPEN':
-                            if order.direction == 'BUY':
-                                # 卖平
-                                new_direction = 'SELL'
-                                new_price = order.limit_price + self.settings['close_spread']
-                            else:
-                                # 买平
-                                new_direction = 'BUY'
-                                new_price = order.limit_price - self.settings['close_spread']
-
-                            # 下平仓单
-                            self.api.insert_order(
-                                symbol=self.symbol,
-                                direction=new_direction,
-                                offset='CLOSE',
-                                volume=trade.volume,
-                                limit_price=new_price
+                    )
+                    session.commit()
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+
+                    self.log_accept(order)
+
+                # 查询 trade
+                for _, trade in order.trade_records.items():
+                    # 新 trade
+                    if not self.get_trade(trade.trade_id):
+                        try:
+                            db_trade = session.query(BacktestTrade).filter_by(backtest_id=self.backtest_record_id,
+                                                                              trade_id=trade.trade_id).one()
+                            if db_trade:
+                                raise RuntimeError('新成交记录不应该在数据库中有记录，但是在数据库中查到了。')
+                        except NoResultFound:
+                            session.add(
+                                BacktestTrade(
+                                    backtest_id=self.backtest_record_id,
+                                    backtest_order_id=db_order.id,
+                                    order_id=order.order_id,
+                                    trade_id=trade.trade_id,
+                                    datetime=time_to_datetime(trade.trade_date_time),
+                                    exchange_trade_id=trade.exchange_trade_id,
+                                    exchange_id=trade.exchange_id,
+                                    instrument_id=trade.instrument_id,
+                                    direction=trade.direction,
+                                    offset=trade.offset,
+                                    price=trade.price,
+                                    volume=trade.volume
+                                )
                             )
+                            session.commit()
+
+                            # 对已成交开仓单下平仓委托单。
+                            if db_order.offset == 'OPEN':
+                                if order.direction == 'BUY':
+                                    # 卖平
+                                    new_direction = 'SELL'
+                                    new_price = self.contract_spec.add_ticks(order.limit_price,
+                                                                             self.settings['close_spread'])
+                                else:
+                                    # 买平
+                                    new_direction = 'BUY'
+                                    new_price = self.contract_spec.add_ticks(order.limit_price,
+                                                                             -self.settings['close_spread'])
+
+                                # 下平仓单，强平时先撤销
+                                order_close = self.insert_order(new_direction, 'CLOSE', trade.volume, new_price)
+                                if order_close:
+                                    self.link_closeout(order_close, order.order_id)
+
+                        self.log_fill(order, trade.trade_id)
+
+            if new_status == '全部撤单' or new_status == '部分撤单':
+                try:
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+                    db_order.status = new_status
+                    db_order.last_datetime = self.remote_datetime
+                    db_order.volume_left = order.volume_left
+                    session.commit()
+                except NoResultFound:
+                    print('ERROR in 撤单', order.order_id, '未在数据库中找到')
+                    self.api.close()
+                    exit()
+
+                self.log_cancel(order)
+
+    def on_order(self, order: Order) -> None:
+        """
+        处理委托单回报。
+        """
+        self.sweeper.on_order(order)
+        self.handle_orders(order)
 
-                    self.log_fill(order, trade.trade_id)
-
-        if new_status == '全部撤单' or new_status == '部分撤单':
-            try:
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                db_order.status = new_status
-                db_order.last_datetime = self.remote_datetime
-                db_order.volume_left = order.volume_left
-                db_session.commit()
-            except NoResultFound:
-                print('ERROR in 撤单', order.order_id, '未在数据库中找到')
-                self.api.close()
-                exit()
-
-            self.log_cancel(order)
-
-    def run(self):
+    def on_quote(self, quote: Quote) -> None:
         """
-        策略运行。
-        :return:
+        盘口变化。
         """
-        # 局部变量
-        open_order: Order       # 开仓委托单
-        close_order: Order      # 平仓委托单
-        remote_order: Order     # 经天勤从服务器发来的委托单
-        remote_order_id: str
-        remote_trade: Trade     # 成交记录，来自远端
-        remote_trade_id: str
-
-        try:
-            while True:
-                if not self.api.wait_update(deadline=time.time() + self.timeout):
-                    self.log_no_data()
-
-                if self.api.is_changing(self.tq_quote, ['ask_price1', 'bid_price1']):
-                    # tq_quote 中的信息
-                    self.price_ask = self.tq_quote.ask_price1  # 当前卖一价
-                    self.price_bid = self.tq_quote.bid_price1  # 当前买一价
-                    self.remote_datetime = time_to_datetime(self.tq_quote.datetime)  # 当前 datetime
-
-                    # 非交易时间
-                    if not self.is_trading_time(self.remote_datetime):
-                        self.logger.info(f'{self.remote_datetime}, 【状态】, ——非交易时间')
-                        continue
-
-                    # log 当前状态
-                    self.log_status()
-
-                    # 临近收盘，平仓
-                    if self.is_about_to_close(self.remote_datetime):
-                        self.close_before_market_close()
-
-                    # 处理委托单回报
-                    if self.api.is_changing(self.tq_order):
-                        for remote_order_id, remote_order in self.tq_order.items():
-                            self.handle_orders(remote_order)
-
-                    # 开仓
-                    # 1、总持仓（多仓 + 空仓）手数 < 【策略】最大持仓手数；
-                    # 2、买一价挂单手数 ＋　卖一价挂单手数　＋　每笔委托手数　<　【策略】每价位手数
-                    # 3、根据 均线？MACD？判断多空。
-                    if self.is_open_condition():
-                        order_open = self.api.insert_order(symbol=self.symbol,
-                                                           direction='BUY',
-                                                           offset='OPEN',
-                                                           volume=self.settings['volume_per_order'],
-                                                           limit_price=self.price_bid
-                                                           )
-                        self.log_order(order_open)
-
-        except BacktestFinished:
-            self.api.close()
-            exit()
+        # 非交易时间
+        if not self.is_trading_time(self.remote_datetime):
+            self.logger.info(f'{self.remote_datetime}, 【状态】, ——非交易时间')
+            return
+
+        # log 当前状态
+        self.log_status()
+
+        # 临近收盘，平仓
+        if self.is_about_to_close(self.remote_datetime):
+            self.close_before_market_close()
+
+        # 撤远离盘口的开仓单
+        for order_id in self.sweeper.sweep(self.price_bid, self.price_ask, self.remote_datetime.timestamp()):
+            self.logger.info(f'{self.remote_datetime}, 【撤单】, 远离盘口, 委托单号：{order_id}')
+
+        # 开仓
+        # 1、总持仓（多仓 + 空仓）手数 < 【策略】最大持仓手数；
+        # 2、买一价挂单手数 ＋　卖一价挂单手数　＋　每笔委托手数　<　【策略】每价位手数
+        # 3、根据 均线？MACD？判断多空。
+        if self.is_open_condition():
+            order_open = self.insert_order('BUY', 'OPEN', self.settings['volume_per_order'], self.price_bid)
+            if order_open:
+                self.sweeper.add(order_open)
+                self.log_order(order_open)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块把天勤的K线、tick 序列以 NumPy 只读视图的方式提供给策略。
+
+天勤的序列（get_kline_serial / get_tick_serial 返回的 DataFrame）底层是一个按列存储的二维数组，
+每次更新时原地写入（新K线时整体前移），数组对象本身不变。SerialView 取各列在该数组上的视图，
+创建一次后一直有效，每次更新不需要 .loc / .iloc 生成新的 DataFrame、Series：
+    view['close']               全部收盘价，长度为 data_length；
+    view.tail('close', 30)      最近 30 根，同样是视图，之后的更新也会反映出来；
+    view.last('close')          最新值。
+视图只读，修改会抛出异常；需要修改时先 copy()。
+
+StrategyBase.bar_view() / tick_view() 在第一次调用时才订阅，不使用的序列不会订阅。
+"""
+
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from tqsdk import TqApi
+
+
+class SerialView(object):
+    """
+    一个天勤序列各列的只读视图。
+    """
+    df: pd.DataFrame                    # 天勤的序列，绘图等需要 DataFrame 时使用
+    _array: Optional[np.ndarray]        # 天勤更新的底层数组，取不到时为 None，退化为每次从 df 取列
+    _column_index: Dict[str, int]
+    _view_dict: Dict[str, np.ndarray]
+    _last_id: float
+
+    def __init__(self, api: TqApi, serial: pd.DataFrame):
+        self.df = serial
+        self._array = None
+        self._column_index = {}
+        self._view_dict = {}
+        serial_dict: Optional[dict] = getattr(api, '_serials', {}).get(id(serial))
+        if serial_dict is not None and isinstance(serial_dict.get('array'), np.ndarray):
+            self._array = serial_dict['array']
+            # 底层数组的列与 DataFrame 前几列一一对应，之后是 symbol、duration 等非数值列
+            self._column_index = {name: i for i, name in enumerate(serial.columns[:self._array.shape[1]])}
+        self._last_id = self.last('id')
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        view: Optional[np.ndarray] = self._view_dict.get(column)
+        if view is not None:
+            return view
+        if column not in self._column_index:
+            # 非数值列或取不到底层数组，只能每次从 DataFrame 取
+            return self.df[column].to_numpy()
+        view = self._array[:, self._column_index[column]]
+        view.flags.writeable = False
+        self._view_dict[column] = view
+        return view
+
+    def tail(self, column: str, n: int) -> np.ndarray:
+        """
+        最近 n 个值的视图。
+        """
+        return self[column][-n:]
+
+    def last(self, column: str) -> float:
+        if column in self._column_index:
+            return self._array[-1, self._column_index[column]]
+        return self.df[column].iloc[-1]
+
+    def is_new_row(self) -> bool:
+        """
+        与上次调用相比是否产生了新的K线（tick），代替 api.is_changing(serial.iloc[-1], 'datetime')，不生成 Series。
+        """
+        last_id: float = self.last('id')
+        if last_id != self._last_id and last_id == last_id:     # 还没有数据时为 NaN
+            self._last_id = last_id
+            return True
+        return False
+
+    def to_frame(self, column_list: List[str], n: Optional[int] = None) -> pd.DataFrame:
+        """
+        复制为以时间为索引的 DataFrame，如 mplfinance 绘图。
+        :param n: 最近 n 行，默认全部。
+        """
+        n = n or len(self.df)
+        frame = pd.DataFrame({column: self.tail(column, n) for column in column_list},
+                             index=pd.to_datetime(self.tail('datetime', n)))
+        frame.index.name = 'datetime'
+        return frame
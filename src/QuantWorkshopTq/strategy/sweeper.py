@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块按价格距离撤销远离盘口的挂单。
+
+OrderSweeper 为买、卖两边各维护一个按整数价格排序的挂单索引 [(整数价格, 委托单号), ...]：
+    买单:   价格 <= 买一价 - order_range 跳的撤单，即索引的前段；
+    卖单:   价格 >= 卖一价 + order_range 跳的撤单，即索引的后段。
+每次盘口变化二分查找分界点，只处理需要撤的挂单，耗时与挂单总数无关。
+撤单先进入队列，按每秒最多 max_cancel_per_second 笔发出，行情剧烈时不会集中发出大量撤单；
+同一次更新中发出的撤单由天勤在下一次 wait_update() 时一起发送。
+"""
+
+
+from typing import Dict, List, Optional, Set, Tuple
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+import time
+
+from tqsdk import TqApi
+from tqsdk.entity import Entity
+from tqsdk.objs import Order
+
+from QuantWorkshopTq.define import QWContractSpec
+from QuantWorkshopTq.define.contract import get_fallback_spec
+
+
+class OrderSweeper(object):
+    """
+    远离盘口的挂单撤单器。
+
+        sweeper = OrderSweeper(api, contract_spec, order_range=3, max_cancel_per_second=10)
+        sweeper.add(order)                      # 下单后
+        sweeper.on_order(order)                 # 委托单回报
+        sweeper.sweep(bid, ask, now)            # 盘口变化
+    """
+    api: TqApi
+    order_range: int                    # 距离买一价/卖一价达到该跳数时撤单
+    max_cancel_per_second: Optional[int]    # 每秒最多撤单笔数，None 为不限制
+    _tick_spec: QWContractSpec
+    _buy_index: List[Tuple[int, str]]   # 买单 (整数价格, 委托单号)，由低到高
+    _sell_index: List[Tuple[int, str]]  # 卖单 (整数价格, 委托单号)，由低到高
+    _order_tick: Dict[str, Tuple[str, int]]     # 委托单号 -> (方向, 整数价格)
+    _pending: deque                     # 等待发出的撤单
+    _cancelling: Set[str]               # 已进入队列或已发出的撤单，不重复撤
+    _cancel_time: deque                 # 最近 max_cancel_per_second 笔撤单时间
+
+    def __init__(self,
+                 api: TqApi,
+                 contract_spec: Optional[QWContractSpec],
+                 order_range: int,
+                 max_cancel_per_second: Optional[int] = None):
+        if order_range <= 0:
+            raise ValueError('Parameter <order_range> should be positive.')
+        self.api = api
+        self.order_range = order_range
+        self.max_cancel_per_second = max_cancel_per_second
+        self._tick_spec = contract_spec if contract_spec is not None else get_fallback_spec()
+        self._buy_index = []
+        self._sell_index = []
+        self._order_tick = {}
+        self._pending = deque()
+        self._cancelling = set()
+        self._cancel_time = deque(maxlen=max_cancel_per_second or 1)
+
+    def __len__(self) -> int:
+        return len(self._order_tick)
+
+    def add(self, order: Order) -> None:
+        """
+        登记一张挂单。
+        """
+        if order.order_id in self._order_tick:
+            return
+        tick: int = self._tick_spec.to_tick(order.limit_price)
+        self._order_tick[order.order_id] = (order.direction, tick)
+        insort(self._buy_index if order.direction == 'BUY' else self._sell_index, (tick, order.order_id))
+
+    def remove(self, order_id: str) -> None:
+        """
+        去除一张挂单（已成交或已撤销）。
+        """
+        direction, tick = self._order_tick.pop(order_id, (None, 0))
+        if direction is None:
+            return
+        index: List[Tuple[int, str]] = self._buy_index if direction == 'BUY' else self._sell_index
+        i: int = bisect_left(index, (tick, order_id))
+        if i < len(index) and index[i][1] == order_id:
+            del index[i]
+        self._cancelling.discard(order_id)
+
+    def on_order(self, order: Order) -> None:
+        """
+        委托单回报，完结的委托单从索引中去除。
+        """
+        if order.status == 'FINISHED':
+            self.remove(order.order_id)
+
+    def sync(self, order_entity: Entity, offset: Optional[str] = 'OPEN') -> None:
+        """
+        按天勤的委托单重建索引，如中途重启后。
+        :param offset: 只登记该开平方向的挂单，None 为全部。
+        """
+        self._buy_index = []
+        self._sell_index = []
+        self._order_tick = {}
+        self._pending.clear()
+        self._cancelling = set()
+        for order in order_entity.values():
+            if order.status == 'ALIVE' and (offset is None or order.offset == offset):
+                self.add(order)
+
+    def find_stale(self, bid_price: float, ask_price: float) -> List[str]:
+        """
+        远离盘口的挂单。
+        """
+        result: List[str] = []
+        if bid_price == bid_price:      # 没有买一价时为 NaN
+            bound: int = self._tick_spec.to_tick(bid_price) - self.order_range
+            # 价格 <= bound 的买单；委托单号不会大于 chr(0x10ffff)，以此取到 bound 价位上的全部
+            end: int = bisect_right(self._buy_index, (bound, chr(0x10ffff)))
+            result.extend(order_id for _, order_id in self._buy_index[:end])
+        if ask_price == ask_price:
+            bound = self._tick_spec.to_tick(ask_price) + self.order_range
+            start: int = bisect_left(self._sell_index, (bound, ''))
+            result.extend(order_id for _, order_id in self._sell_index[start:])
+        return result
+
+    def _is_allowed(self, now: float) -> bool:
+        if self.max_cancel_per_second is None or len(self._cancel_time) < self.max_cancel_per_second:
+            return True
+        return now - self._cancel_time[0] >= 1.0
+
+    def sweep(self, bid_price: float, ask_price: float, now: Optional[float] = None) -> List[str]:
+        """
+        盘口变化时调用：远离盘口的挂单进入撤单队列，在限速内发出。
+        :param now: 当前时间（秒），回测时传入行情时间，默认为 time.monotonic()。
+        :return: 本次发出撤单的委托单号。
+        """
+        for order_id in self.find_stale(bid_price, ask_price):
+            if order_id not in self._cancelling:
+                self._cancelling.add(order_id)
+                self._pending.append(order_id)
+        return self.flush(now)
+
+    def flush(self, now: Optional[float] = None) -> List[str]:
+        """
+        在限速内发出队列中的撤单，行情没有变化时也可以定时调用。
+        """
+        if now is None:
+            now = time.monotonic()
+        sent: List[str] = []
+        while self._pending and self._is_allowed(now):
+            order_id: str = self._pending.popleft()
+            if order_id not in self._order_tick:
+                # 排队期间已成交或已撤销
+                continue
+            self.api.cancel_order(order_id)
+            self._cancel_time.append(now)
+            sent.append(order_id)
+        return sent
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
@@ -9,22 +9,18 @@ __author__ = 'Bruce Frank Wong'
 
 
 from typing import Dict, List, Optional
-import time
 import datetime
 
-from tqsdk import TqApi, BacktestFinished
-from tqsdk.objs import Order, Trade
+from tqsdk import TqApi
+from tqsdk.objs import Quote, Order, Trade
 from tqsdk.entity import Entity
 from tqsdk.tafunc import time_to_datetime
 from sqlalchemy.orm.exc import NoResultFound
 
-from . import (
-    StrategyBase,
-    StrategyParameter,
-    db_session,
-    BacktestOrder,
-    BacktestTrade
-)
+from ..database import session_scope, BacktestOrder, BacktestTrade
+from ..define import QWContractSpec
+from ..define.contract import get_fallback_spec
+from . import StrategyBase, StrategyParameter
 
 
 __all__ = 'strategy_parameter', 'TestStrategy'
@@ -49,12 +45,17 @@ def is_trading_time(t: datetime.time, tt_list: list) -> bool:
     return False
 
 
-def lots_at_price(order: Entity, p: float) -> int:
+def lots_at_price(order: Entity, p: float, contract_spec: Optional[QWContractSpec] = None) -> int:
+    """
+    按整数价格（跳，见 QWContractSpec.to_tick）比较价位，避免 0.2、0.5 等最小变动价位的浮点误差。
+    """
+    tick_spec: QWContractSpec = contract_spec if contract_spec is not None else get_fallback_spec()
+    tick: int = tick_spec.to_tick(p)
     order_id: str
     order: Order
     lots: int = 0
     for order_id, order in order.items():
-        if order.limit_price == p:
+        if tick_spec.to_tick(order.limit_price) == tick:
             lots += order.volume_left
     return lots
 
@@ -108,36 +109,38 @@ class TestStrategy(StrategyBase):
                 return True
         return False
 
-    @staticmethod
-    def db_add_order(order: Order, opponent_order_id: Optional[str] = None):
-        if opponent_order_id:
-            db_order = db_session.query(BacktestOrder).filter_by(order_id=opponent_order_id).one()
-            if db_order.opponent:
-                raise ValueError(f'Order with id <{opponent_order_id}> already has opponent order.')
-            else:
-                db_order.opponent = order.order_id
-        new_order: BacktestOrder = BacktestOrder(insert_datetime=datetime.datetime.now(),
-                                                 order_id=order.order_id,
-                                                 direction=order.direction,
-                                                 offset=order.offset,
-                                                 price=order.limit_price,
-                                                 volume_orign=order.volume_orign,
-                                                 status='ALIVE',
-                                                 opponent=opponent_order_id
-                                                 )
-        db_session.add(new_order)
-        db_session.commit()
-
-    @staticmethod
-    def get_unfilled_order() -> List[Order]:
-        return db_session.query(BacktestOrder).filter_by(status='ALIVE').all()
-
-    @staticmethod
-    def get_trade(trade_id: str) -> Optional[BacktestTrade]:
-        try:
-            return db_session.query(BacktestTrade).filter_by(trade_id=trade_id).one()
-        except NoResultFound:
-            return None
+    def db_add_order(self, order: Order, opponent_order_id: Optional[str] = None):
+        with session_scope() as session:
+            if opponent_order_id:
+                db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                  order_id=opponent_order_id).one()
+                if db_order.opponent:
+                    raise ValueError(f'Order with id <{opponent_order_id}> already has opponent order.')
+                else:
+                    db_order.opponent = order.order_id
+            new_order: BacktestOrder = BacktestOrder(insert_datetime=datetime.datetime.now(),
+                                                     order_id=order.order_id,
+                                                     direction=order.direction,
+                                                     offset=order.offset,
+                                                     price=order.limit_price,
+                                                     volume_orign=order.volume_orign,
+                                                     status='ALIVE',
+                                                     opponent=opponent_order_id,
+                                                     backtest_id=self.backtest_record_id
+                                                     )
+            session.add(new_order)
+
+    def get_unfilled_order(self) -> List[BacktestOrder]:
+        with session_scope() as session:
+            return session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id, status='ALIVE').all()
+
+    def get_trade(self, trade_id: str) -> Optional[BacktestTrade]:
+        with session_scope() as session:
+            try:
+                return session.query(BacktestTrade).filter_by(backtest_id=self.backtest_record_id,
+                                                              trade_id=trade_id).one()
+            except NoResultFound:
+                return None
 
     def handle_orders(self, order: Order):
         """
@@ -178,99 +181,108 @@ class TestStrategy(StrategyBase):
             else:
                 new_status = '报单'
 
-        if new_status == '报单':
-            try:
-                # 存在报单回报信息滞后的情况。所以还不能触发异常。
-                db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                # if db_order:
-                #     raise RuntimeError('新报单不应该在数据库中有记录，但是在数据库中查到了。')
-            except NoResultFound:
-                db_session.add(
-                    BacktestOrder(
-                        insert_datetime=time_to_datetime(order.insert_date_time),
-                        order_id=order.order_id,
-                        direction=order.direction,
-                        offset=order.offset,
-                        price=order.limit_price,
-                        volume_orign=order.volume_orign,
-                        volume_left=order.volume_orign,
-                        status='ALIVE'
-                    )
-                )
-                db_session.commit()
-
-            self.log_accept(order)
-
-        if new_status == '全部成交' or new_status == '部分成交':
-            # 修正 order 状态
-            try:
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                db_order.status = new_status
-                db_order.last_datetime = self.remote_datetime
-                db_order.volume_left = order.volume_left
-                db_session.commit()
-            except NoResultFound:
-                # 有报单即成交的可能
-
-                db_session.add(
-                    BacktestOrder(
-                        insert_datetime=time_to_datetime(order.insert_date_time),
-                        last_datetime=self.remote_datetime,
-                        order_id=order.order_id,
-                        direction=order.direction,
-                        offset=order.offset,
-                        price=order.limit_price,
-                        volume_orign=order.volume_orign,
-                        volume_left=order.volume_left,
-                        status=new_status
+        with session_scope() as session:
+            if new_status == '报单':
+                try:
+                    # 存在报单回报信息滞后的情况。所以还不能触发异常。
+                    session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                           order_id=order.order_id).one()
+                    # if db_order:
+                    #     raise RuntimeError('新报单不应该在数据库中有记录，但是在数据库中查到了。')
+                except NoResultFound:
+                    session.add(
+                        BacktestOrder(
+                            insert_datetime=time_to_datetime(order.insert_date_time),
+                            order_id=order.order_id,
+                            direction=order.direction,
+                            offset=order.offset,
+                            price=order.limit_price,
+                            volume_orign=order.volume_orign,
+                            volume_left=order.volume_orign,
+                            status='ALIVE',
+                            backtest_id=self.backtest_record_id
+                        )
                     )
-                )
-                db_session.commit()
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
+                    session.commit()
 
                 self.log_accept(order)
 
-            # 查询 trade
-            for _, trade in order.trade_records.items():
-                # 新 trade
-                if not self.get_trade(trade.trade_id):
-                    try:
-                        db_trade = db_session.query(BacktestTrade).filter_by(trade_id=trade.trade_id).one()
-                        if db_trade:
-                            raise RuntimeError('新成交记录不应该在数据库中有记录，但是在数据库中查到了。')
-                    except NoResultFound:
-                        db_session.add(
-                            BacktestTrade(
-                                backtest_order_id=db_order.id,
-                                order_id=order.order_id,
-                                trade_id=trade.trade_id,
-                                datetime=time_to_datetime(trade.trade_date_time),
-                                exchange_trade_id=trade.exchange_trade_id,
-                                exchange_id=trade.exchange_id,
-                                instrument_id=trade.instrument_id,
-                                direction=trade.direction,
-                                offset=trade.offset,
-                                price=trade.price,
-                                volume=trade.volume
-                            )
+            if new_status == '全部成交' or new_status == '部分成交':
+                # 修正 order 状态
+                try:
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+                    db_order.status = new_status
+                    db_order.last_datetime = self.remote_datetime
+                    db_order.volume_left = order.volume_left
+                    session.commit()
+                except NoResultFound:
+                    # 有报单即成交的可能
+
+                    session.add(
+                        BacktestOrder(
+                            insert_datetime=time_to_datetime(order.insert_date_time),
+                            last_datetime=self.remote_datetime,
+                            order_id=order.order_id,
+                            direction=order.direction,
+                            offset=order.offset,
+                            price=order.limit_price,
+                            volume_orign=order.volume_orign,
+                            volume_left=order.volume_left,
+                            status=new_status,
+                            backtest_id=self.backtest_record_id
                         )
-                        db_session.commit()
+                    )
+                    session.commit()
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+
+                    self.log_accept(order)
+
+                # 查询 trade
+                for _, trade in order.trade_records.items():
+                    # 新 trade
+                    if not self.get_trade(trade.trade_id):
+                        try:
+                            db_trade = session.query(BacktestTrade).filter_by(backtest_id=self.backtest_record_id,
+                                                                              trade_id=trade.trade_id).one()
+                            if db_trade:
+                                raise RuntimeError('新成交记录不应该在数据库中有记录，但是在数据库中查到了。')
+                        except NoResultFound:
+                            session.add(
+                                BacktestTrade(
+                                    backtest_order_id=db_order.id,
+                                    order_id=order.order_id,
+                                    trade_id=trade.trade_id,
+                                    datetime=time_to_datetime(trade.trade_date_time),
+                                    exchange_trade_id=trade.exchange_trade_id,
+                                    exchange_id=trade.exchange_id,
+                                    instrument_id=trade.instrument_id,
+                                    direction=trade.direction,
+                                    offset=trade.offset,
+                                    price=trade.price,
+                                    volume=trade.volume,
+                                    backtest_id=self.backtest_record_id
+                                )
+                            )
+                            session.commit()
 
-                    self.log_fill(order, trade.trade_id)
+                        self.log_fill(order, trade.trade_id)
 
-        if new_status == '全部撤单' or new_status == '部分撤单':
-            try:
-                db_order = db_session.query(BacktestOrder).filter_by(order_id=order.order_id).one()
-                db_order.status = new_status
-                db_order.last_datetime = self.remote_datetime
-                db_order.volume_left = order.volume_left
-                db_session.commit()
-            except NoResultFound:
-                print('ERROR in 撤单', order.order_id, '未在数据库中找到')
-                self.api.close()
-                exit()
+            if new_status == '全部撤单' or new_status == '部分撤单':
+                try:
+                    db_order = session.query(BacktestOrder).filter_by(backtest_id=self.backtest_record_id,
+                                                                      order_id=order.order_id).one()
+                    db_order.status = new_status
+                    db_order.last_datetime = self.remote_datetime
+                    db_order.volume_left = order.volume_left
+                    session.commit()
+                except NoResultFound:
+                    print('ERROR in 撤单', order.order_id, '未在数据库中找到')
+                    self.api.close()
+                    exit()
 
-            self.log_cancel(order)
+                self.log_cancel(order)
 
     def is_open_condition(self) -> bool:
         """
@@ -286,8 +298,8 @@ class TestStrategy(StrategyBase):
         position_short = self.tq_position.pos_short
         total_position = position_long + position_short
 
-        lots_at_bid = lots_at_price(self.tq_order, self.price_bid)
-        lots_at_ask = lots_at_price(self.tq_order, self.price_ask)
+        lots_at_bid = lots_at_price(self.tq_order, self.price_bid, self.contract_spec)
+        lots_at_ask = lots_at_price(self.tq_order, self.price_ask, self.contract_spec)
         volume_per_order = self._settings['volume_per_order']
         volume_per_price = self._settings['volume_per_price']
 
@@ -296,50 +308,30 @@ class TestStrategy(StrategyBase):
 
         return is_lots_available and is_position_available
 
-    def run(self):
-        # 局部变量
-        open_order: Order       # 开仓委托单
-        close_order: Order      # 平仓委托单
-        remote_order: Order     # 经天勤从服务器发来的委托单
-        remote_order_id: str
-        remote_trade: Trade     # 成交记录，来自远端
-        remote_trade_id: str
-
-        try:
-            while True:
-                if not self.api.wait_update(deadline=time.time() + self.timeout):
-                    print('未在超时限制内接收到数据。')
-
-                if self.api.is_changing(self.tq_quote, ['ask_price1', 'bid_price1']):
-                    # tq_quote 中的信息
-                    self.price_ask = self.tq_quote.ask_price1  # 当前卖一价
-                    self.price_bid = self.tq_quote.bid_price1  # 当前买一价
-                    self.remote_datetime = time_to_datetime(self.tq_quote.datetime)  # 当前 datetime
-
-                    # 非交易时间
-                    if not self.is_trading_time(self.remote_datetime):
-                        self.logger.info(f'{self.remote_datetime}, 【状态】, ——非交易时间')
-                        continue
-
-                    # log 当前状态
-                    self.log_status()
-
-                    # 处理委托单回报
-                    if self.api.is_changing(self.tq_order):
-                        for remote_order_id, remote_order in self.tq_order.items():
-                            self.handle_orders(remote_order)
-
-                    # 开仓
-
-                    if self.is_open_condition():
-                        order_open = self.api.insert_order(symbol=self.symbol,
-                                                           direction='BUY',
-                                                           offset='OPEN',
-                                                           volume=self._settings['volume_per_order'],
-                                                           limit_price=self.price_bid
-                                                           )
-                        self.log_order(order_open)
-
-        except BacktestFinished:
-            self.api.close()
-            exit()
+    def on_order(self, order: Order) -> None:
+        """
+        处理委托单回报。
+        """
+        self.handle_orders(order)
+
+    def on_quote(self, quote: Quote) -> None:
+        """
+        盘口变化。
+        """
+        # 非交易时间
+        if not self.is_trading_time(self.remote_datetime):
+            self.logger.info(f'{self.remote_datetime}, 【状态】, ——非交易时间')
+            return
+
+        # log 当前状态
+        self.log_status()
+
+        # 开仓
+        if self.is_open_condition():
+            order_open = self.insert_order('BUY', 'OPEN', self._settings['volume_per_order'], self.price_bid)
+            if order_open:
+                self.log_order(order_open)
+
+    def on_finish(self) -> None:
+        self.api.close()
+        exit()
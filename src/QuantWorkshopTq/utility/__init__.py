@@ -4,7 +4,10 @@ __author__ = 'Bruce Frank Wong'
 
 
 from .tq_auth import get_tq_auth
-from .app_path import get_application_path
+from .app_path import get_application_path, get_chart_path, get_log_path, get_record_path
 from .load import load_csv, load_symbol
 from .download import download
-from .plot import plot
+from .plot import plot, render
+from .profiling import profile, profiled
+from .recorder import TickRecorder, TickFile
+from .quote_bus import QuoteBus, QuoteRing, QuoteLost
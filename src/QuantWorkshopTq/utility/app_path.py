@@ -8,3 +8,24 @@ import os.path
 
 def get_application_path() -> str:
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_chart_path() -> str:
+    """
+    图片输出目录，可以用环境变量 QW_CHART_PATH 指定。
+    """
+    return os.environ.get('QW_CHART_PATH', os.path.join(get_application_path(), 'chart'))
+
+
+def get_log_path() -> str:
+    """
+    日志、性能分析输出目录，可以用环境变量 QW_LOG_PATH 指定。
+    """
+    return os.environ.get('QW_LOG_PATH', os.path.join(get_application_path(), 'log'))
+
+
+def get_record_path() -> str:
+    """
+    实时行情记录目录，可以用环境变量 QW_RECORD_PATH 指定。
+    """
+    return os.environ.get('QW_RECORD_PATH', os.path.join(get_application_path(), 'data_recorded'))
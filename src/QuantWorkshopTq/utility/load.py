@@ -10,12 +10,14 @@ import pandas as pd
 
 from ..define import QWPeriodType
 from . import get_application_path
+from .profiling import profiled
 
 
 def load_csv(csv_file: str) -> pd.pandas:
+    # csv_file 为绝对路径时，os.path.join 直接返回 csv_file
     # 可能会有异常抛出
     df_temp: pd.DataFrame = pd.read_csv(os.path.join(get_application_path(), 'data_downloaded', csv_file))
-    prefix: str = csv_file.split('_')[0]
+    prefix: str = os.path.basename(csv_file).split('_')[0]
     column_list: List[str] = ['open', 'high', 'low', 'close', 'volume', 'open_oi', 'close_oi']
     for column in column_list:
         assert_column = ''.join([prefix, '.', column])
@@ -27,6 +29,7 @@ def load_csv(csv_file: str) -> pd.pandas:
     return df
 
 
+@profiled()
 def load_symbol(symbol: str, period: QWPeriodType, n: Optional[int] = 1, mc: Optional[bool] = False) -> pd.pandas:
     csv_file: str
     if n < 0:
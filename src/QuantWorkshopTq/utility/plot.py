@@ -3,16 +3,28 @@
 __author__ = 'Bruce Frank Wong'
 
 
-from typing import Optional, Tuple
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
+import os
+import os.path
 
+import numpy as np
 import pandas as pd
 import mplfinance as mpf
+from matplotlib.figure import Figure
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from .app_path import get_chart_path
+
+
+COLOR_UP: str = 'red'
+COLOR_DOWN: str = 'cyan'
 
 
 def plot(df: pd.DataFrame, title: Optional[str] = None, mav: Optional[Tuple[int]] = None,
-         alines: Optional[dict] = None):
-    color = mpf.make_marketcolors(up='red', down='cyan', inherit=True)
+         alines: Optional[dict] = None, save_path: Optional[str] = None, show: bool = True):
+    color = mpf.make_marketcolors(up=COLOR_UP, down=COLOR_DOWN, inherit=True)
     style = mpf.make_mpf_style(marketcolors=color)
 
     # # 设置外观效果
@@ -42,13 +54,17 @@ def plot(df: pd.DataFrame, title: Optional[str] = None, mav: Optional[Tuple[int]
     #                       width=0.5, colorup='r', colordown='green',
     #                       alpha=0.6)
 
+    if not save_path:
+        save_path = os.path.join(get_chart_path(), f'Test_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.png')
+    os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+
     kwargs: dict = {
         'type': 'candle',
         'style': style,
         'volume': True,
         'figratio': (3, 1),
         'figscale': 20,
-        'savefig': dict(fname=f'D:\\Test_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.png',
+        'savefig': dict(fname=save_path,
                         bbox_inches='tight'
                         )
     }
@@ -60,4 +76,113 @@ def plot(df: pd.DataFrame, title: Optional[str] = None, mav: Optional[Tuple[int]
         kwargs['alines'] = alines
 
     mpf.plot(df, **kwargs)
-    mpf.show()
+    if show:
+        mpf.show()
+
+
+# render 复用的画布，按尺寸缓存：(width, height, dpi) -> (Figure, 价格 Axes, 成交量 Axes)
+_canvas_cache: Dict[Tuple[int, int, int], Tuple[Figure, Axes, Axes]] = {}
+
+
+def _get_canvas(width: int, height: int, dpi: int) -> Tuple[Figure, Axes, Axes]:
+    key: Tuple[int, int, int] = (width, height, dpi)
+    if key not in _canvas_cache:
+        # 直接使用 Agg 画布，不经过 pyplot，不会创建窗口。
+        figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        FigureCanvasAgg(figure)
+        ax_price = figure.add_axes((0.05, 0.3, 0.93, 0.62))
+        ax_volume = figure.add_axes((0.05, 0.08, 0.93, 0.2), sharex=ax_price)
+        _canvas_cache[key] = (figure, ax_price, ax_volume)
+    figure, ax_price, ax_volume = _canvas_cache[key]
+    ax_price.clear()
+    ax_volume.clear()
+    return figure, ax_price, ax_volume
+
+
+def decimate(df: pd.DataFrame, column_count: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    把 K 线按像素列合并：每列 open 取第一根，close 取最后一根，high 取最大，low 取最小，volume 求和。
+    :return: (每列第一根K线在原数据中的位置, {字段: 合并后的数组})
+    """
+    n: int = len(df.index)
+    if n <= column_count:
+        start = np.arange(n)
+        return start, {column: df[column].to_numpy(dtype=np.float64)
+                       for column in ['open', 'high', 'low', 'close', 'volume']}
+
+    bucket = np.arange(n, dtype=np.int64) * column_count // n
+    start = np.flatnonzero(np.diff(bucket, prepend=-1))
+    end = np.append(start[1:], n) - 1
+    result: Dict[str, np.ndarray] = {
+        'open': df['open'].to_numpy(dtype=np.float64)[start],
+        'high': np.maximum.reduceat(df['high'].to_numpy(dtype=np.float64), start),
+        'low': np.minimum.reduceat(df['low'].to_numpy(dtype=np.float64), start),
+        'close': df['close'].to_numpy(dtype=np.float64)[end],
+        'volume': np.add.reduceat(df['volume'].to_numpy(dtype=np.float64), start),
+    }
+    return start, result
+
+
+def render(df: pd.DataFrame,
+           file_name: str,
+           title: Optional[str] = None,
+           alines: Optional[dict] = None,
+           chart_path: Optional[str] = None,
+           width: int = 1920,
+           height: int = 720,
+           dpi: int = 100) -> str:
+    """
+    无窗口快速出图，用于批量任务。
+
+    与 plot 不同：
+        1, 不经过 pyplot，直接画在 Agg 画布上，画布按尺寸复用；
+        2, K 线数量多于像素列数时，先按像素列合并（见 decimate），绘制量与数据量无关；
+        3, 文件格式由 file_name 的扩展名决定（png / svg）。
+    :param df: 以 datetime 为 index，含 open/high/low/close/volume 列。
+    :param file_name: 输出文件名。
+    :param title: 标题。
+    :param alines: 与 plot 的 alines 参数格式相同，{'alines': [[(datetime, price), ...], ...], 'colors': [...]}。
+    :param chart_path: 输出目录，默认为 get_chart_path()。
+    :return: 输出文件的完整路径。
+    """
+    if chart_path is None:
+        chart_path = get_chart_path()
+    os.makedirs(chart_path, exist_ok=True)
+
+    figure, ax_price, ax_volume = _get_canvas(width, height, dpi)
+    column_count: int = int(width * 0.93)
+    start, bar = decimate(df, column_count)
+    n: int = len(df.index)
+    x = np.arange(len(start))
+
+    is_up = bar['close'] >= bar['open']
+    color = np.where(is_up, COLOR_UP, COLOR_DOWN)
+    body_width: float = max(0.5, min(6.0, 0.6 * column_count / max(len(x), 1)))
+    ax_price.vlines(x, bar['low'], bar['high'], colors=color, linewidth=0.5)
+    ax_price.vlines(x, np.minimum(bar['open'], bar['close']), np.maximum(bar['open'], bar['close']),
+                    colors=color, linewidth=body_width)
+    ax_volume.vlines(x, 0, bar['volume'], colors=color, linewidth=body_width)
+
+    if alines:
+        index = df.index
+        line_list: List[list] = alines['alines']
+        color_list: list = alines.get('colors', [None] * len(line_list))
+        linewidth: float = alines.get('linewidths', 0.5)
+        for line, line_color in zip(line_list, color_list):
+            if not line:
+                continue
+            position = index.get_indexer([point[0] for point in line])
+            ax_price.plot(position * len(x) / n, [point[1] for point in line], color=line_color, linewidth=linewidth)
+
+    # 横轴标签，取若干个位置显示日期时间
+    tick = np.linspace(0, len(x) - 1, num=min(10, len(x)), dtype=np.int64)
+    ax_volume.set_xticks(tick)
+    ax_volume.set_xticklabels([f'{df.index[start[i]]:%Y-%m-%d %H:%M}' for i in tick], fontsize=7)
+    ax_price.tick_params(labelbottom=False)
+    ax_price.set_xlim(-1, len(x))
+    if title:
+        ax_price.set_title(title)
+
+    full_path: str = os.path.join(chart_path, file_name)
+    figure.savefig(full_path)
+    return full_path
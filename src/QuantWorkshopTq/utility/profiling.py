@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块负责性能分析。
+
+由环境变量 QW_PROFILER 选择分析器，可用逗号组合，未设置时不做分析：
+    cprofile:       cProfile，输出 .pstats，可用 snakeviz、python -m pstats 查看；
+    sample:         采样分析，另起线程每 QW_PROFILER_INTERVAL 秒（默认 0.005）采样一次目标线程的调用栈，
+                    开销小，输出 .collapsed（折叠栈格式），可用 flamegraph.pl、speedscope 生成火焰图；
+    tracemalloc:    内存分配，输出 _tracemalloc.txt，为分配最多的代码位置。
+
+    QW_PROFILER=cprofile,tracemalloc python backtest.py
+
+输出文件名为 Profile_{名称}[_{回测编号}]_{时间}，默认在日志目录（QW_LOG_PATH）下，策略运行时与策略日志在同一目录。
+已在分析中时，内层的 profile() 不再分析，整体结果已包含内层。
+"""
+
+
+from typing import Callable, Dict, List, Optional, Set
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import functools
+import os
+import sys
+import threading
+import tracemalloc
+
+from .app_path import get_log_path
+
+
+PROFILER_LIST: List[str] = ['cprofile', 'sample', 'tracemalloc']
+
+_active: bool = False      # 是否已在分析中
+
+
+def get_profiler_set(mode: Optional[str] = None) -> Set[str]:
+    """
+    :param mode: 逗号分隔的分析器名称，默认读取环境变量 QW_PROFILER。
+    """
+    if mode is None:
+        mode = os.environ.get('QW_PROFILER', '')
+    profiler_set: Set[str] = {item.strip().lower() for item in mode.split(',') if item.strip()}
+    for item in profiler_set:
+        if item not in PROFILER_LIST:
+            raise ValueError(f'Unknown profiler <{item}>, should be in {PROFILER_LIST}.')
+    return profiler_set
+
+
+class StackSampler(object):
+    """
+    采样分析器：后台线程定时读取目标线程的当前调用栈（sys._current_frames），按折叠栈计数。
+    """
+    interval: float
+    stack_counter: Counter
+    _thread_id: int
+    _thread: Optional[threading.Thread]
+    _stop_event: threading.Event
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stack_counter = Counter()
+        self._thread_id = threading.get_ident()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stack_counter[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name='QWStackSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stack_counter.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def dump_tracemalloc(snapshot: tracemalloc.Snapshot, path: str, limit: int = 30) -> None:
+    """
+    写出分配最多的 limit 个代码位置，及其中最大的一个的调用栈。
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    stat_list = snapshot.statistics('lineno')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'Total: {sum(stat.size for stat in stat_list) / 1024:,.1f} KiB\n\n')
+        for i, stat in enumerate(stat_list[:limit], 1):
+            frame = stat.traceback[0]
+            f.write(f'#{i:<3} {frame.filename}:{frame.lineno}: {stat.size / 1024:,.1f} KiB, {stat.count} blocks\n')
+        traceback_stat_list = snapshot.statistics('traceback')
+        if traceback_stat_list:
+            f.write('\nLargest traceback:\n')
+            f.write('\n'.join(traceback_stat_list[0].traceback.format()))
+            f.write('\n')
+
+
+@contextmanager
+def profile(name: str,
+            run_id: Optional[int] = None,
+            output_dir: Optional[str] = None,
+            mode: Optional[str] = None):
+    """
+    对 with 块做性能分析，退出时写出结果。
+    :param name: 名称，用于文件名。
+    :param run_id: 回测编号（BacktestRecord.id）。
+    :param output_dir: 输出目录，默认为日志目录。
+    :param mode: 分析器，默认读取环境变量 QW_PROFILER。
+    """
+    global _active
+    profiler_set: Set[str] = get_profiler_set(mode)
+    if not profiler_set or _active:
+        yield
+        return
+
+    _active = True
+    profiler: Optional[cProfile.Profile] = None
+    sampler: Optional[StackSampler] = None
+    is_tracing: bool = False
+    if 'tracemalloc' in profiler_set and not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+        is_tracing = True
+    if 'sample' in profiler_set:
+        sampler = StackSampler(float(os.environ.get('QW_PROFILER_INTERVAL', 0.005)))
+        sampler.start()
+    if 'cprofile' in profiler_set:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        snapshot: Optional[tracemalloc.Snapshot] = None
+        if is_tracing:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        _active = False
+
+        if output_dir is None:
+            output_dir = get_log_path()
+        os.makedirs(output_dir, exist_ok=True)
+        tag: str = f'{name}_{run_id}' if run_id is not None else name
+        prefix: str = os.path.join(output_dir, f'Profile_{tag}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}')
+        path_dict: Dict[str, str] = {}
+        if profiler is not None:
+            path_dict['cprofile'] = f'{prefix}.pstats'
+            profiler.dump_stats(path_dict['cprofile'])
+        if sampler is not None:
+            path_dict['sample'] = f'{prefix}.collapsed'
+            sampler.dump(path_dict['sample'])
+        if snapshot is not None:
+            path_dict['tracemalloc'] = f'{prefix}_tracemalloc.txt'
+            dump_tracemalloc(snapshot, path_dict['tracemalloc'])
+        for key, path in path_dict.items():
+            print(f'[{key}] {path}')
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    装饰器，QW_PROFILER 设置时对函数做性能分析。
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active or not os.environ.get('QW_PROFILER'):
+                return func(*args, **kwargs)
+            with profile(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
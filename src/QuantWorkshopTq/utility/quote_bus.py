@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块是本机多进程共享行情的总线。
+
+行情进程（quote_daemon.py）持有唯一的 TqApi，把订阅合约的每次 Quote 更新写入该合约的共享内存环形缓冲区；
+各策略进程按合约代码连接，读取最新行情或等待新的行情，不再各自连接天勤。
+
+共享内存 qw_{合约代码}（. 换为 _）：
+    头部 64 字节:   MAGIC、版本、容量、记录长度、已写入条数 write_count；
+    槽位 × 容量:    版本号 seq (uint64) + 记录（与 recorder.TICK_DTYPE 相同）。
+第 n 条（从 0 开始）写入槽位 n % 容量，seqlock 方式：
+    写：seq = 2n + 1 -> 写记录 -> seq = 2n + 2 -> write_count = n + 1；
+    读：seq == 2n + 2 -> 复制记录 -> seq 未变则有效，否则正在被覆盖，重读或判为已丢失。
+只有一个写进程，读进程不加锁、不影响写进程。x86 按顺序写内存，不需要额外的内存屏障。
+
+    # 行情进程
+    bus = QuoteBus(api, ['DCE.c2101'])
+    bus.run()
+
+    # 策略进程
+    ring = QuoteRing.attach('DCE.c2101')
+    tick = ring.latest()
+    count = ring.write_count
+    while True:
+        count, tick_list = ring.wait(count, timeout=5)
+"""
+
+
+from typing import Dict, List, Optional, Tuple
+from multiprocessing import shared_memory
+import struct
+import time
+
+import numpy as np
+from tqsdk import TqApi
+from tqsdk.objs import Quote
+
+from .recorder import TICK_DTYPE, TICK_RECORD, quote_to_tuple
+
+
+MAGIC: bytes = b'QWQBUS'
+VERSION: int = 1
+HEADER_SIZE: int = 64
+_HEADER = struct.Struct('<6sHII')       # MAGIC, 版本, 容量, 记录长度
+_COUNT_OFFSET: int = 32                 # write_count 的位置
+_U64 = struct.Struct('<Q')
+
+SLOT_DTYPE: np.dtype = np.dtype([('seq', '<u8'), ('tick', TICK_DTYPE)])
+
+
+class QuoteLost(Exception):
+    """
+    读取的记录已被覆盖：读进程落后写进程超过一圈。
+    """
+
+
+def get_bus_name(symbol: str) -> str:
+    return 'qw_' + symbol.replace('.', '_')
+
+
+def _track(shm: shared_memory.SharedMemory, register: bool) -> None:
+    try:
+        from multiprocessing import resource_tracker
+        if register:
+            resource_tracker.register(shm._name, 'shared_memory')
+        else:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    except (ImportError, AttributeError):
+        pass
+
+
+class QuoteRing(object):
+    """
+    一个合约的共享内存环形缓冲区。写进程用 create()，读进程用 attach()。
+    """
+    symbol: str
+    capacity: int
+    is_owner: bool
+    ring: np.ndarray                # 槽位的结构化数组，直接映射共享内存，不复制
+    _shm: shared_memory.SharedMemory
+    _buffer: memoryview
+
+    def __init__(self, symbol: str, shm: shared_memory.SharedMemory, is_owner: bool):
+        self.symbol = symbol
+        self._shm = shm
+        self._buffer = shm.buf
+        self.is_owner = is_owner
+        magic, version, self.capacity, record_size = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION or record_size != TICK_DTYPE.itemsize:
+            raise ValueError(f'Shared memory <{shm.name}> is not a quote bus of version {VERSION}.')
+        self.ring = np.ndarray((self.capacity,), dtype=SLOT_DTYPE, buffer=self._buffer, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, symbol: str, capacity: int = 4096) -> 'QuoteRing':
+        name: str = get_bus_name(symbol)
+        try:
+            # 上次行情进程异常退出时遗留的共享内存
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + capacity * SLOT_DTYPE.itemsize)
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        _HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, capacity, TICK_DTYPE.itemsize)
+        return cls(symbol, shm, True)
+
+    @classmethod
+    def attach(cls, symbol: str) -> 'QuoteRing':
+        shm = shared_memory.SharedMemory(name=get_bus_name(symbol))
+        # Python 3.13 之前 attach 也会登记到 resource_tracker，读进程退出时会删除共享内存
+        _track(shm, False)
+        return cls(symbol, shm, False)
+
+    @property
+    def write_count(self) -> int:
+        return _U64.unpack_from(self._buffer, _COUNT_OFFSET)[0]
+
+    def _slot_offset(self, n: int) -> int:
+        return HEADER_SIZE + (n % self.capacity) * SLOT_DTYPE.itemsize
+
+    def publish(self, quote: Quote, local_time: Optional[int] = None) -> int:
+        """
+        写入一条行情，只能由 create() 的进程调用。
+        :return: 写入后的 write_count。
+        """
+        n: int = self.write_count
+        offset: int = self._slot_offset(n)
+        _U64.pack_into(self._buffer, offset, 2 * n + 1)
+        TICK_RECORD.pack_into(self._buffer, offset + 8, *quote_to_tuple(quote, local_time or time.time_ns()))
+        _U64.pack_into(self._buffer, offset, 2 * n + 2)
+        _U64.pack_into(self._buffer, _COUNT_OFFSET, n + 1)
+        return n + 1
+
+    def read(self, n: int, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        读第 n 条记录。
+        :param out: 长度为 1 的 TICK_DTYPE 数组，复制到其中，避免每次分配。
+        :return: 长度为 1 的 TICK_DTYPE 数组；尚未写入时为 None。
+        :raise QuoteLost: 已被覆盖。
+        """
+        if out is None:
+            out = np.empty(1, dtype=TICK_DTYPE)
+        expected: int = 2 * n + 2
+        offset: int = self._slot_offset(n)
+        target: memoryview = out.view(np.uint8).data
+        while True:
+            seq: int = _U64.unpack_from(self._buffer, offset)[0]
+            if seq < expected - 1:
+                return None
+            if seq > expected:
+                raise QuoteLost(f'{self.symbol}: record {n} is overwritten.')
+            if seq == expected:
+                target[:] = self._buffer[offset + 8:offset + 8 + TICK_DTYPE.itemsize]
+                if _U64.unpack_from(self._buffer, offset)[0] == expected:
+                    return out
+            # 写进程正在写这个槽位，稍后重读
+
+    def latest(self, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        最新一条行情；还没有行情时为 None。
+        """
+        while True:
+            n: int = self.write_count
+            if n == 0:
+                return None
+            try:
+                return self.read(n - 1, out)
+            except QuoteLost:
+                continue
+
+    def wait(self, after: int, timeout: Optional[float] = None,
+             poll_interval: float = 0.0002) -> Tuple[int, List[np.ndarray]]:
+        """
+        等待第 after 条之后的行情。
+        :param after: 已读到的 write_count。
+        :return: (新的 write_count, [新的记录, ...])；超时时列表为空。
+        :raise QuoteLost: 落后超过一圈，丢失的记录无法读取，可以从 write_count 重新开始。
+        """
+        deadline: Optional[float] = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            count: int = self.write_count
+            if count > after:
+                if count - after > self.capacity:
+                    raise QuoteLost(f'{self.symbol}: {count - after - self.capacity} records are lost.')
+                return count, [self.read(n) for n in range(after, count)]
+            if deadline is not None and time.monotonic() >= deadline:
+                return after, []
+            time.sleep(poll_interval)
+
+    def close(self) -> None:
+        self.ring = None            # 释放对共享内存的引用，否则 close() 报 BufferError
+        self._buffer = None
+        self._shm.close()
+        if self.is_owner:
+            # 读进程由本进程 fork 时共用 resource_tracker，其 attach 已取消登记
+            _track(self._shm, True)
+            self._shm.unlink()
+
+
+class QuoteBus(object):
+    """
+    行情进程：一个 TqApi 订阅全部合约，写入各合约的 QuoteRing。
+    """
+    api: TqApi
+    symbol_list: List[str]
+    ring_dict: Dict[str, QuoteRing]
+    _task_list: list
+
+    def __init__(self, api: TqApi, symbol_list: List[str], capacity: int = 4096):
+        self.api = api
+        self.symbol_list = symbol_list
+        self.ring_dict = {symbol: QuoteRing.create(symbol, capacity) for symbol in symbol_list}
+        self._task_list = []
+
+    async def _publish(self, symbol: str):
+        quote: Quote = self.api.get_quote(symbol)
+        ring: QuoteRing = self.ring_dict[symbol]
+        async with self.api.register_update_notify(quote) as update_chan:
+            async for _ in update_chan:
+                ring.publish(quote)
+
+    def start(self) -> None:
+        for symbol in self.symbol_list:
+            self._task_list.append(self.api.create_task(self._publish(symbol)))
+
+    def close(self) -> None:
+        for task in self._task_list:
+            task.cancel()
+        self._task_list = []
+        for ring in self.ring_dict.values():
+            ring.close()
+        self.ring_dict = {}
+
+    def run(self) -> None:
+        """
+        持续发布行情，直到 KeyboardInterrupt。
+        """
+        self.start()
+        try:
+            while True:
+                self.api.wait_update()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            self.api.close()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+本模块负责实时行情的记录和读取。
+
+TickRecorder 在 TqApi 上为每个合约注册一个任务（register_update_notify），每次 Quote 更新追加一条定长记录；
+不单独循环，由策略的 wait_update() 驱动，可以和策略、StrategyRuntime 共用一个 api。
+
+文件为 {记录目录}/{合约代码}/{交易日 YYYYMMDD}.tick，交易日按夜盘归下一个交易日（周五夜盘归下周一，未考虑节假日）：
+    文件头 64 字节:   MAGIC、版本、记录长度、合约代码；
+    记录:            TICK_DTYPE，小端、无对齐，可直接 numpy.memmap 为结构化数组；
+    {文件}.idx:      每分钟第一条记录的 (datetime, 记录序号)，int64 对，用于按时间定位。
+TickFile 读取文件，data 为只读 memmap，slice() 按时间返回视图，不复制数据；
+to_dataframe() 与 DataDownloader 下载的 tick 数据列名相同，可以交给离线分析、复盘使用。
+
+    recorder = TickRecorder(api, ['DCE.c2101', 'SHFE.rb2101'])
+    recorder.start()
+    strategy.run()
+    recorder.close()
+"""
+
+
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from datetime import date, datetime, timedelta, timezone
+import os
+import os.path
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+from tqsdk import TqApi
+from tqsdk.objs import Quote
+
+from QuantWorkshopTq.define import get_trading_day
+
+from .app_path import get_record_path
+
+
+MAGIC: bytes = b'QWTICK'
+VERSION: int = 1
+HEADER_SIZE: int = 64
+_HEADER = struct.Struct('<6sHI32s')     # MAGIC, 版本, 记录长度, 合约代码
+
+# 与 DataDownloader 下载的 tick 数据列相同，另加本机接收时间
+TICK_DTYPE: np.dtype = np.dtype([
+    ('datetime', '<i8'),            # 行情时间，纳秒时间戳
+    ('local_time', '<i8'),          # 本机接收时间，纳秒时间戳
+    ('last_price', '<f8'),
+    ('highest', '<f8'),
+    ('lowest', '<f8'),
+    ('bid_price1', '<f8'),
+    ('bid_volume1', '<i8'),
+    ('ask_price1', '<f8'),
+    ('ask_volume1', '<i8'),
+    ('volume', '<i8'),
+    ('amount', '<f8'),
+    ('open_interest', '<f8'),
+])
+TICK_RECORD = struct.Struct('<qqddddqdqqdd')
+assert TICK_RECORD.size == TICK_DTYPE.itemsize
+
+INDEX_INTERVAL_NS: int = 60 * 1_000_000_000     # 每分钟一条索引
+CST = timezone(timedelta(hours=8))              # 行情时间为北京时间，不随本机时区变化
+_CST_OFFSET_NS: int = 8 * 3600 * 1_000_000_000
+
+
+def to_timestamp_ns(dt: Union[datetime, str]) -> int:
+    """
+    行情时间（datetime 或 Quote.datetime 字符串）转为纳秒时间戳，不带时区的按北京时间。
+    """
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=CST)
+    return int(dt.timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+
+
+def get_tick_file_path(symbol: str, trading_day: date, root_path: Optional[str] = None) -> str:
+    return os.path.join(root_path or get_record_path(), symbol, f'{trading_day:%Y%m%d}.tick')
+
+
+def _int(value: float) -> int:
+    return 0 if value != value else int(value)     # NaN 记为 0
+
+
+def quote_to_tuple(quote: Quote, local_time: int) -> tuple:
+    """
+    Quote 按 TICK_DTYPE 的字段顺序取值，用于 TICK_RECORD.pack()。
+    """
+    return (to_timestamp_ns(quote.datetime) if quote.datetime else local_time, local_time,
+            quote.last_price, quote.highest, quote.lowest,
+            quote.bid_price1, _int(quote.bid_volume1),
+            quote.ask_price1, _int(quote.ask_volume1),
+            _int(quote.volume), quote.amount, quote.open_interest)
+
+
+class TickWriter(object):
+    """
+    一个合约一个交易日的文件，只追加。
+    """
+    path: str
+    count: int                  # 已写入记录数
+    _file: BinaryIO
+    _index_file: BinaryIO
+    _next_index_time: int       # 下一条索引的分钟起点
+
+    def __init__(self, path: str, symbol: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new: bool = not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE
+        self._file = open(path, 'ab')
+        if is_new:
+            self._file.truncate(0)
+            self._file.write(_HEADER.pack(MAGIC, VERSION, TICK_DTYPE.itemsize, symbol.encode('ascii'))
+                             .ljust(HEADER_SIZE, b'\0'))
+            self.count = 0
+        else:
+            # 截掉中断时写了一半的记录
+            size: int = os.path.getsize(path) - HEADER_SIZE
+            self.count = size // TICK_DTYPE.itemsize
+            self._file.truncate(HEADER_SIZE + self.count * TICK_DTYPE.itemsize)
+        self._index_file = open(f'{path}.idx', 'ab')
+        self._next_index_time = 0
+        if self.count:
+            last_time: int = struct.unpack('<q', self._read_last_datetime())[0]
+            self._next_index_time = (last_time // INDEX_INTERVAL_NS + 1) * INDEX_INTERVAL_NS
+
+    def _read_last_datetime(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER_SIZE + (self.count - 1) * TICK_DTYPE.itemsize)
+            return f.read(8)
+
+    def write(self, quote: Quote, local_time: int) -> None:
+        value_tuple: tuple = quote_to_tuple(quote, local_time)
+        dt: int = value_tuple[0]
+        if dt >= self._next_index_time:
+            self._index_file.write(struct.pack('<qq', dt, self.count))
+            self._next_index_time = (dt // INDEX_INTERVAL_NS + 1) * INDEX_INTERVAL_NS
+        self._file.write(TICK_RECORD.pack(*value_tuple))
+        self.count += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._index_file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        self._index_file.close()
+
+
+class TickRecorder(object):
+    """
+    记录 TqApi 上若干合约的全部 Quote 更新。
+    """
+    api: TqApi
+    symbol_list: List[str]
+    root_path: str
+    flush_interval: float           # 秒，写入后最多隔多久 flush 一次
+
+    _writer_dict: Dict[str, Tuple[date, TickWriter]]
+    _task_list: list
+    _last_flush: float
+
+    def __init__(self, api: TqApi, symbol_list: List[str], root_path: Optional[str] = None,
+                 flush_interval: float = 1.0):
+        self.api = api
+        self.symbol_list = symbol_list
+        self.root_path = root_path or get_record_path()
+        self.flush_interval = flush_interval
+        self._writer_dict = {}
+        self._task_list = []
+        self._last_flush = time.monotonic()
+
+    def _get_writer(self, symbol: str, quote: Quote) -> TickWriter:
+        trading_day: date = get_trading_day(datetime.fromisoformat(quote.datetime)) if quote.datetime \
+            else date.today()
+        current: Optional[Tuple[date, TickWriter]] = self._writer_dict.get(symbol)
+        if current is not None and current[0] == trading_day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        writer = TickWriter(get_tick_file_path(symbol, trading_day, self.root_path), symbol)
+        self._writer_dict[symbol] = (trading_day, writer)
+        return writer
+
+    async def _record(self, symbol: str):
+        quote: Quote = self.api.get_quote(symbol)
+        async with self.api.register_update_notify(quote) as update_chan:
+            async for _ in update_chan:
+                self._get_writer(symbol, quote).write(quote, time.time_ns())
+                now: float = time.monotonic()
+                if now - self._last_flush >= self.flush_interval:
+                    self.flush()
+                    self._last_flush = now
+
+    def start(self) -> None:
+        for symbol in self.symbol_list:
+            self._task_list.append(self.api.create_task(self._record(symbol)))
+
+    def flush(self) -> None:
+        for _, writer in self._writer_dict.values():
+            writer.flush()
+
+    def close(self) -> None:
+        for task in self._task_list:
+            task.cancel()
+        self._task_list = []
+        for _, writer in self._writer_dict.values():
+            writer.close()
+        self._writer_dict = {}
+
+
+class TickFile(object):
+    """
+    读取 TickWriter 写出的文件。data 为只读 memmap，文件仍在写入时重新打开可读到新记录。
+    """
+    path: str
+    symbol: str
+    data: np.ndarray
+    _index: np.ndarray          # shape (n, 2)：分钟内第一条记录的 (datetime, 记录序号)
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, record_size, symbol = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != TICK_DTYPE.itemsize:
+            raise ValueError(f'<{path}> is not a tick file of version {VERSION}.')
+        self.symbol = symbol.rstrip(b'\0').decode('ascii')
+        count: int = (os.path.getsize(path) - HEADER_SIZE) // TICK_DTYPE.itemsize
+        if count:
+            self.data = np.memmap(path, dtype=TICK_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.data = np.zeros(0, dtype=TICK_DTYPE)
+        index_path: str = f'{path}.idx'
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= 16:
+            self._index = np.fromfile(index_path, dtype='<i8').reshape(-1, 2)
+            self._index = self._index[self._index[:, 1] < count]
+        else:
+            self._index = np.zeros((0, 2), dtype='<i8')
+
+    @classmethod
+    def open(cls, symbol: str, trading_day: date, root_path: Optional[str] = None) -> 'TickFile':
+        return cls(get_tick_file_path(symbol, trading_day, root_path))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def locate(self, t: Union[datetime, int]) -> int:
+        """
+        第一条 datetime >= t 的记录序号。先用分钟索引缩小范围，再二分查找。
+        """
+        ns: int = to_timestamp_ns(t) if isinstance(t, datetime) else t
+        lo: int = 0
+        hi: int = len(self.data)
+        if len(self._index):
+            i: int = int(np.searchsorted(self._index[:, 0], ns, side='right')) - 1
+            if i >= 0:
+                lo = int(self._index[i, 1])
+            if i + 1 < len(self._index):
+                hi = int(self._index[i + 1, 1])
+        return lo + int(np.searchsorted(self.data['datetime'][lo:hi], ns, side='left'))
+
+    def slice(self, start: Optional[Union[datetime, int]] = None,
+              end: Optional[Union[datetime, int]] = None) -> np.ndarray:
+        """
+        [start, end) 之间的记录，为 data 的视图。
+        """
+        i: int = self.locate(start) if start is not None else 0
+        j: int = self.locate(end) if end is not None else len(self.data)
+        return self.data[i:j]
+
+    def to_dataframe(self, start: Optional[Union[datetime, int]] = None,
+                     end: Optional[Union[datetime, int]] = None) -> pd.DataFrame:
+        """
+        与 DataDownloader 下载的 tick 数据列相同，以 datetime 为索引。
+        """
+        records: np.ndarray = self.slice(start, end)
+        df = pd.DataFrame({name: records[name] for name in TICK_DTYPE.names[2:]})
+        df.index = pd.to_datetime(records['datetime'] + _CST_OFFSET_NS, unit='ns')
+        df.index.name = 'datetime'
+        return df
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+模拟回测过程中的委托单事件，测量每个事件的数据库耗时随委托单数量的变化。
+
+每个事件：新增委托单并提交，再按 (backtest_id, order_id) 查回并修改状态，按 (backtest_id, trade_id) 查成交记录。
+使用临时 SQLite 库，不影响应用数据库。
+
+    python bench_order_lookup.py                    # 带索引
+    python bench_order_lookup.py --no-index         # 删除索引对比
+    python bench_order_lookup.py -n 20000 --step 2000
+"""
+
+
+from typing import List
+import argparse
+import os
+import os.path
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 导入 QuantWorkshopTq.database 时会按环境变量建立、初始化数据库，须在导入前指向临时目录，不影响应用数据库
+_temp_path: str = tempfile.mkdtemp(prefix='qw_bench_')
+os.environ['QW_DATABASE_URL'] = f'sqlite:///{os.path.join(_temp_path, "bench.sqlite")}'
+os.environ['QW_BACKTEST_DATABASE_URL'] = f'sqlite:///{os.path.join(_temp_path, "bench_backtest.sqlite")}'
+
+from QuantWorkshopTq.database import BacktestRecord, BacktestOrder, BacktestTrade
+
+
+TABLE_LIST = [BacktestRecord.__table__, BacktestOrder.__table__, BacktestTrade.__table__]
+
+
+def run(event_count: int, step: int, with_index: bool) -> List[tuple]:
+    db_path: str = os.path.join(tempfile.mkdtemp(), 'bench_order_lookup.sqlite')
+    engine = create_engine(f'sqlite:///{db_path}')
+    for table in TABLE_LIST:
+        table.create(engine)
+        if not with_index:
+            for index in table.indexes:
+                index.drop(engine)
+    session = sessionmaker(bind=engine)()
+
+    start: datetime = datetime(2020, 1, 2, 9)
+    record = BacktestRecord(strategy='bench', symbol='SHFE.rb2010',
+                            backtest_start=start, backtest_end=start, real_start=datetime.now())
+    session.add(record)
+    session.commit()
+    backtest_id: int = record.id
+
+    result: List[tuple] = []
+    elapsed: float = 0.0
+    worst: float = 0.0
+    for i in range(1, event_count + 1):
+        order_id: str = f'PYSDK_insert_{i:08d}'
+        dt: datetime = start + timedelta(seconds=i)
+        t0: float = time.perf_counter()
+
+        session.add(BacktestOrder(insert_datetime=dt, order_id=order_id, direction='BUY', offset='OPEN',
+                                  price=3500.0, volume_orign=1, volume_left=1, status='ALIVE',
+                                  backtest_id=backtest_id))
+        session.commit()
+        db_order = session.query(BacktestOrder).filter_by(backtest_id=backtest_id, order_id=order_id).one()
+        db_order.status = 'FINISHED'
+        db_order.volume_left = 0
+        db_order.last_datetime = dt
+        session.query(BacktestTrade).filter_by(backtest_id=backtest_id, trade_id=f'{order_id}|1').one_or_none()
+        session.commit()
+
+        t: float = time.perf_counter() - t0
+        elapsed += t
+        worst = max(worst, t)
+        if i % step == 0:
+            result.append((i, elapsed / step * 1e6, worst * 1e6))
+            print(f'{i:>9,d} 委托单, 平均 {elapsed / step * 1e6:>9.1f} us/事件, 最大 {worst * 1e6:>9.1f} us')
+            elapsed = 0.0
+            worst = 0.0
+
+    session.close()
+    engine.dispose()
+    os.remove(db_path)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='委托单查询耗时基准测试')
+    parser.add_argument('-n', '--number', type=int, default=100_000, help='委托单事件数')
+    parser.add_argument('--step', type=int, default=10_000, help='统计区间')
+    parser.add_argument('--no-index', action='store_true', help='删除索引，对比全表扫描')
+    args = parser.parse_args()
+
+    print(f'{"无" if args.no_index else "有"}索引, {args.number:,d} 个委托单事件:')
+    bucket_list = run(args.number, args.step, not args.no_index)
+    print(f'末段 / 首段: {bucket_list[-1][1] / bucket_list[0][1]:.2f}')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+比较不同 SQLite 配置（见 database.engine.SQLITE_PROFILE）下的写入、查询吞吐量。
+
+写入：每个委托单单独提交，与策略中的 db_add_order 一致；
+查询：按 (backtest_id, order_id) 随机查询。
+使用临时 SQLite 库，不影响应用数据库。
+
+    python bench_sqlite_profile.py
+    python bench_sqlite_profile.py -n 5000 default backtest
+"""
+
+
+from typing import Dict, List
+import argparse
+import os
+import os.path
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+
+# 导入 QuantWorkshopTq.database 时会按环境变量建立、初始化数据库，须在导入前指向临时目录，不影响应用数据库
+_temp_path: str = tempfile.mkdtemp(prefix='qw_bench_')
+os.environ['QW_DATABASE_URL'] = f'sqlite:///{os.path.join(_temp_path, "bench.sqlite")}'
+os.environ['QW_BACKTEST_DATABASE_URL'] = f'sqlite:///{os.path.join(_temp_path, "bench_backtest.sqlite")}'
+
+from QuantWorkshopTq.database import SQLITE_PROFILE, set_sqlite_profile, BacktestRecord, BacktestOrder
+
+
+def run(profile: str, insert_count: int, lookup_count: int) -> Dict[str, float]:
+    temp_path: str = tempfile.mkdtemp()
+    engine = create_engine(f'sqlite:///{os.path.join(temp_path, "bench_sqlite_profile.sqlite")}')
+    set_sqlite_profile(engine, profile)
+    BacktestRecord.__table__.create(engine)
+    BacktestOrder.__table__.create(engine)
+    order_table = BacktestOrder.__table__
+
+    start: datetime = datetime(2020, 1, 2, 9)
+    with engine.begin() as connection:
+        backtest_id: int = connection.execute(
+            BacktestRecord.__table__.insert().values(strategy='bench', symbol='SHFE.rb2010',
+                                                     backtest_start=start, backtest_end=start,
+                                                     real_start=datetime.now())
+        ).inserted_primary_key[0]
+
+    connection = engine.connect()
+    t0: float = time.perf_counter()
+    for i in range(insert_count):
+        with connection.begin():
+            connection.execute(order_table.insert().values(
+                insert_datetime=start + timedelta(seconds=i), order_id=f'PYSDK_insert_{i:08d}',
+                direction='BUY', offset='OPEN', price=3500.0, volume_orign=1, volume_left=1,
+                status='ALIVE', backtest_id=backtest_id
+            ))
+    insert_time: float = time.perf_counter() - t0
+
+    query = select([order_table]).where(order_table.c.backtest_id == backtest_id)
+    id_list: List[int] = [random.randrange(insert_count) for _ in range(lookup_count)]
+    t0 = time.perf_counter()
+    for i in id_list:
+        connection.execute(query.where(order_table.c.order_id == f'PYSDK_insert_{i:08d}')).first()
+    lookup_time: float = time.perf_counter() - t0
+
+    journal_mode: str = connection.execute('PRAGMA journal_mode').scalar()
+    connection.close()
+    engine.dispose()
+    shutil.rmtree(temp_path)
+    return {
+        'journal_mode': journal_mode,
+        'insert_per_second': insert_count / insert_time,
+        'lookup_per_second': lookup_count / lookup_time,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite 配置基准测试')
+    parser.add_argument('profile', nargs='*', default=list(SQLITE_PROFILE.keys()), help='配置名称')
+    parser.add_argument('-n', '--number', type=int, default=10_000, help='写入委托单数')
+    parser.add_argument('--lookup', type=int, default=100_000, help='查询次数')
+    args = parser.parse_args()
+
+    print(f'{"配置":<12}{"日志模式":<10}{"写入/秒":>12}{"查询/秒":>12}')
+    for name in args.profile:
+        result = run(name, args.number, args.lookup)
+        print(f'{name:<14}{result["journal_mode"]:<14}'
+              f'{result["insert_per_second"]:>12,.0f}{result["lookup_per_second"]:>12,.0f}')
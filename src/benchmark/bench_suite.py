@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+热点代码的微基准测试，全部使用合成数据，不需要网络和天勤账号。
+
+覆盖：
+    order.*:        QWOrderManager 的 add / fill / cancel、最优价查询，10 / 1k / 100k 个委托单；
+    position.*:     QWPositionManager 的汇总属性；
+    lots_at_price.*: 遍历 tq_order 式字典（strategy.test.lots_at_price）与 RiskGate 计数器；
+    trend.*:        trend_on_hl / trend_on_single_price，10k ~ 1M 根K线；
+    load.*:         load_csv（load_symbol 的读取部分）读取 csv 与 parquet 缓存；
+    trading_date:   generate_trading_date 十年；
+    statement.*:    read_order / read_trade 与列式版本 read_order_frame / read_trade_frame。
+
+每个用例先 setup（不计时），再计时执行，重复到 --repeat 次或累计超过 --budget 秒为止，记录每次操作的最短、中位耗时。
+结果按 git commit 保存在 results/ 下，--compare 比较两次结果，变慢超过 --threshold 的用例标出，并以返回码 1 退出。
+
+    python bench_suite.py                           # 全部用例，规模不超过 --max-n（默认 100,000）
+    python bench_suite.py order position --max-n 1000000
+    python bench_suite.py --list
+    python bench_suite.py --compare 1a2b3c4 HEAD
+"""
+
+
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import importlib
+import json
+import os
+import os.path
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+RESULT_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+ORDER_SIZE_LIST: List[int] = [10, 1_000, 100_000]
+BAR_SIZE_LIST: List[int] = [10_000, 100_000, 1_000_000]
+STATEMENT_SIZE_LIST: List[int] = [1_000, 100_000]
+
+# 策略模块导入时会连接数据库，基准测试使用临时 SQLite 库
+_temp_path: str = tempfile.mkdtemp(prefix='qw_bench_')
+os.environ.setdefault('QW_DATABASE_URL', f'sqlite:///{os.path.join(_temp_path, "bench.sqlite")}')
+os.environ.setdefault('QW_BACKTEST_DATABASE_URL', f'sqlite:///{os.path.join(_temp_path, "bench_backtest.sqlite")}')
+
+
+class Benchmark(object):
+    """
+    一个用例。setup(n) 返回的对象传给 func，func 返回本次执行的操作数（默认为 1）。
+    preload 中的模块在计时前导入，首次执行不计入导入耗时。
+    """
+    name: str
+    func: Callable[[Any], Optional[int]]
+    setup: Optional[Callable[[Any], Any]]
+    param_list: List[Any]
+    preload: List[str]
+
+    def __init__(self,
+                 name: str,
+                 func: Callable,
+                 setup: Optional[Callable],
+                 param_list: List[Any],
+                 preload: List[str]):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.param_list = param_list
+        self.preload = preload
+
+
+BENCHMARK_LIST: List[Benchmark] = []
+
+
+def benchmark(name: str,
+              param_list: Optional[List[Any]] = None,
+              setup: Optional[Callable] = None,
+              preload: Optional[List[str]] = None) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        BENCHMARK_LIST.append(Benchmark(name, func, setup, param_list or [None], preload or []))
+        return func
+    return decorator
+
+
+# ------------------------------------------------------------------------------------------------
+# 合成数据
+# ------------------------------------------------------------------------------------------------
+
+class FakeOrder(object):
+    """
+    tqsdk.objs.Order 中用到的字段。
+    """
+    __slots__ = ('order_id', 'exchange_id', 'exchange_order_id', 'direction', 'offset',
+                 'limit_price', 'volume_orign', 'volume_left', 'status')
+
+    def __init__(self, i: int, price: float, direction: str = 'BUY', offset: str = 'OPEN'):
+        self.order_id = f'PYSDK_insert_{i:08d}'
+        self.exchange_id = 'DCE'
+        self.exchange_order_id = ''
+        self.direction = direction
+        self.offset = offset
+        self.limit_price = price
+        self.volume_orign = 1
+        self.volume_left = 1
+        self.status = 'ALIVE'
+
+
+def make_order_list(n: int) -> list:
+    """
+    价格在 2400 ~ 2500 之间，买卖各半。
+    """
+    rng = random.Random(n)
+    return [FakeOrder(i, 2400.0 + rng.randrange(100), 'BUY' if i % 2 else 'SELL') for i in range(n)]
+
+
+def make_contract_spec():
+    """
+    与下单价格对应的合约规格（玉米，最小变动价位 1）。
+    """
+    from QuantWorkshopTq.define import QWContractSpec
+
+    return QWContractSpec('c', 'DCE', 1.0, 10, 0.05)
+
+
+def make_order_manager(n: int):
+    from QuantWorkshopTq.define import QWOrderManager
+
+    order_list = make_order_list(n)
+    manager = QWOrderManager(make_contract_spec())
+    for order in order_list:
+        manager.add(order)
+    return manager, order_list
+
+
+def make_bar_frame(n: int):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(n)
+    close = 2400.0 + np.cumsum(rng.standard_normal(n)).round()
+    spread = rng.integers(0, 4, size=(2, n))
+    return pd.DataFrame({
+        'open': close,
+        'high': close + spread[0],
+        'low': close - spread[1],
+        'close': close,
+    }, index=pd.date_range('2020-01-02 09:00', periods=n, freq='min'))
+
+
+# ------------------------------------------------------------------------------------------------
+# QWOrderManager
+# ------------------------------------------------------------------------------------------------
+
+OPERATION_COUNT: int = 100      # fill / cancel 每次计时的操作数，规模大时 list.remove 为 O(n)
+
+
+@benchmark('order.add', ORDER_SIZE_LIST, setup=make_order_list, preload=['QuantWorkshopTq.define'])
+def bench_order_add(order_list: list) -> int:
+    from QuantWorkshopTq.define import QWOrderManager
+
+    manager = QWOrderManager(make_contract_spec())
+    for order in order_list:
+        manager.add(order)
+    return len(order_list)
+
+
+@benchmark('order.fill', ORDER_SIZE_LIST, setup=make_order_manager, preload=['QuantWorkshopTq.define'])
+def bench_order_fill(state: tuple) -> int:
+    manager, order_list = state
+    for order in order_list[-OPERATION_COUNT:]:
+        manager.fill(order)
+    return min(OPERATION_COUNT, len(order_list))
+
+
+@benchmark('order.cancel', ORDER_SIZE_LIST, setup=make_order_manager, preload=['QuantWorkshopTq.define'])
+def bench_order_cancel(state: tuple) -> int:
+    manager, order_list = state
+    for order in order_list[-OPERATION_COUNT:]:
+        manager.cancel(order)
+    return min(OPERATION_COUNT, len(order_list))
+
+
+@benchmark('order.best_price', ORDER_SIZE_LIST, setup=make_order_manager, preload=['QuantWorkshopTq.define'])
+def bench_order_best_price(state: tuple) -> int:
+    manager, _ = state
+    for _ in range(10):
+        manager.lowest_bid_price
+        manager.highest_ask_price
+    return 20
+
+
+@benchmark('order.lots_at_price', ORDER_SIZE_LIST, setup=make_order_manager, preload=['QuantWorkshopTq.define'])
+def bench_order_lots_at_price(state: tuple) -> int:
+    manager, _ = state
+    for price in range(2400, 2500):
+        manager.unfilled_lots_at_price(float(price))
+    return 100
+
+
+# ------------------------------------------------------------------------------------------------
+# QWPositionManager
+# ------------------------------------------------------------------------------------------------
+
+def make_position_manager(n: int):
+    from QuantWorkshopTq.define import QWPosition, QWPositionManager, QWDirection
+
+    rng = random.Random(n)
+    manager = QWPositionManager(capital_available=1e9, price_per_lot=2400.0, contract_spec=make_contract_spec())
+    for i in range(n):
+        position = QWPosition()
+        position.order_id = f'PYSDK_insert_{i:08d}'
+        position.fill_datetime = datetime(2020, 9, 9, 9)
+        position.price = 2400.0 + rng.randrange(100)
+        position.lots = 1
+        position.direction = QWDirection.Buy if i % 2 else QWDirection.Sell
+        manager.add(position)
+    return manager
+
+
+@benchmark('position.aggregate', ORDER_SIZE_LIST, setup=make_position_manager)
+def bench_position_aggregate(manager) -> int:
+    manager.total_lots
+    manager.available_lots
+    manager.lots_at_price(2450.0)
+    return 3
+
+
+# ------------------------------------------------------------------------------------------------
+# lots_at_price
+# ------------------------------------------------------------------------------------------------
+
+def make_order_dict(n: int) -> dict:
+    return {order.order_id: order for order in make_order_list(n)}
+
+
+@benchmark('lots_at_price.scan', ORDER_SIZE_LIST, setup=make_order_dict,
+           preload=['QuantWorkshopTq.strategy.test'])
+def bench_lots_at_price_scan(order_dict: dict) -> int:
+    from QuantWorkshopTq.strategy.test import lots_at_price
+
+    lots_at_price(order_dict, 2450.0)
+    lots_at_price(order_dict, 2451.0)
+    return 2
+
+
+def make_risk_gate(n: int):
+    from QuantWorkshopTq.strategy.risk import RiskGate, RiskLimit
+
+    gate = RiskGate(RiskLimit(), make_contract_spec())
+    for order in make_order_list(n):
+        gate.on_insert(order.order_id, order.direction, order.offset, order.limit_price, order.volume_orign, 0.0)
+    return gate
+
+
+@benchmark('lots_at_price.risk_gate', ORDER_SIZE_LIST, setup=make_risk_gate)
+def bench_lots_at_price_risk_gate(gate) -> int:
+    gate.lots_at_price(2450.0)
+    gate.lots_at_price(2451.0)
+    return 2
+
+
+def make_sweeper(n: int):
+    from QuantWorkshopTq.strategy.sweeper import OrderSweeper
+
+    sweeper = OrderSweeper(None, make_contract_spec(), order_range=3)
+    for order in make_order_list(n):
+        sweeper.add(order)
+    return sweeper
+
+
+@benchmark('sweeper.find_stale', ORDER_SIZE_LIST, setup=make_sweeper)
+def bench_sweeper_find_stale(sweeper) -> int:
+    # 买单价格 <= 2404、卖单价格 >= 2496 的远离盘口，各约 5%，耗时应只与这部分成正比
+    sweeper.find_stale(2407.0, 2493.0)
+    return 1
+
+
+def make_closeout(n: int):
+    from QuantWorkshopTq.strategy.closeout import CloseoutEngine
+
+    closeout = CloseoutEngine(make_contract_spec(), closeout_long=3, closeout_short=3)
+    rng = random.Random(n)
+    for i in range(n):
+        # 多头开仓价 2400 ~ 2449、空头 2451 ~ 2500，盘口 2450 / 2451 时都没有触发
+        if i % 2:
+            closeout.on_trade(f'open_{i}', 'BUY', 'OPEN', 2400.0 + rng.randrange(50), 1)
+        else:
+            closeout.on_trade(f'open_{i}', 'SELL', 'OPEN', 2451.0 + rng.randrange(50), 1)
+    return closeout
+
+
+@benchmark('closeout.check', ORDER_SIZE_LIST, setup=make_closeout)
+def bench_closeout_check(closeout) -> int:
+    # 没有触发时只比较两个堆顶，耗时应与持仓笔数无关
+    closeout.check(2450.0, 2451.0)
+    return 1
+
+
+# ------------------------------------------------------------------------------------------------
+# 趋势分析
+# ------------------------------------------------------------------------------------------------
+
+@benchmark('trend.hl', BAR_SIZE_LIST, setup=make_bar_frame, preload=['QuantWorkshopTq.analysis'])
+def bench_trend_on_hl(df) -> int:
+    from QuantWorkshopTq.analysis import trend_on_hl
+
+    trend_on_hl(df)
+    return len(df)
+
+
+@benchmark('trend.single_price', BAR_SIZE_LIST, setup=make_bar_frame, preload=['QuantWorkshopTq.analysis'])
+def bench_trend_on_single_price(df) -> int:
+    from QuantWorkshopTq.analysis import PriceType, trend_on_single_price
+
+    trend_on_single_price(df, PriceType.Close, 5)
+    return len(df)
+
+
+# ------------------------------------------------------------------------------------------------
+# 读取K线
+# ------------------------------------------------------------------------------------------------
+
+def make_bar_csv(n: int) -> str:
+    """
+    天勤下载格式的 csv，列名带合约代码前缀。
+    """
+    df = make_bar_frame(n)
+    prefix: str = 'DCE.c2101'
+    path: str = os.path.join(_temp_path, f'{prefix}_minute_{n}.csv')
+    if not os.path.exists(path):
+        out = df.reset_index().rename(columns={'index': 'datetime'})
+        out['volume'] = 100
+        out['open_oi'] = 1000
+        out['close_oi'] = 1000
+        out.rename(columns={column: f'{prefix}.{column}' for column in out.columns if column != 'datetime'}) \
+            .to_csv(path, index=False)
+    return path
+
+
+def make_bar_parquet(n: int) -> Optional[str]:
+    try:
+        import pyarrow      # noqa: F401
+    except ImportError:
+        return None
+    from QuantWorkshopTq.utility import load_csv
+
+    path: str = make_bar_csv(n).replace('.csv', '.parquet')
+    if not os.path.exists(path):
+        load_csv(make_bar_csv(n)).to_parquet(path)
+    return path
+
+
+@benchmark('load.csv', BAR_SIZE_LIST, setup=make_bar_csv, preload=['QuantWorkshopTq.utility'])
+def bench_load_csv(path: str) -> int:
+    from QuantWorkshopTq.utility import load_csv
+
+    return len(load_csv(path))
+
+
+@benchmark('load.parquet', BAR_SIZE_LIST, setup=make_bar_parquet)
+def bench_load_parquet(path: Optional[str]) -> Optional[int]:
+    if path is None:
+        raise ImportError('pyarrow is not installed.')
+    import pandas as pd
+
+    return len(pd.read_parquet(path))
+
+
+# ------------------------------------------------------------------------------------------------
+# 交易日
+# ------------------------------------------------------------------------------------------------
+
+@benchmark('trading_date', preload=['QuantWorkshopTq.analyze'])
+def bench_trading_date(_) -> int:
+    from QuantWorkshopTq.analyze import TQ_DATA_BEGIN, generate_trading_date
+
+    return len(list(generate_trading_date(TQ_DATA_BEGIN.replace(year=TQ_DATA_BEGIN.year + 10))))
+
+
+# ------------------------------------------------------------------------------------------------
+# 对账单
+# ------------------------------------------------------------------------------------------------
+
+def make_order_statement(n: int) -> str:
+    """
+    委托记录：首行表头，之后每行以空白分隔的 14 列。
+    """
+    path: str = os.path.join(_temp_path, f'order_{n}.txt')
+    if not os.path.exists(path):
+        rng = random.Random(n)
+        start: datetime = datetime(2020, 9, 9, 9)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('交易日 委托时间 合约号 状态 买卖 开平 委托价 委托量 成交量 撤单量 投保 合同号 主场号 账号\n')
+            for i in range(n):
+                t: datetime = start + timedelta(seconds=i)
+                f.write(f'{t:%Y%m%d} {t:%H:%M:%S} c2101 全部成交 {rng.choice("买卖")} {rng.choice("开平")} '
+                        f'{2400 + rng.randrange(100)}.000 1 1 0 投机 {i:08d} {i:06d} 000001\n')
+    return path
+
+
+def make_trade_statement(n: int) -> str:
+    """
+    成交记录：首行表头、末行汇总，每行前 107 列为成交信息，之后为手续费、合同号、账号。
+    """
+    path: str = os.path.join(_temp_path, f'trade_{n}.txt')
+    if not os.path.exists(path):
+        rng = random.Random(n)
+        start: datetime = datetime(2020, 9, 9, 9)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('交易日 成交时间 合约号 买卖 开平 成交价 成交量 手续费 合同号 账号\n')
+            for i in range(n):
+                t: datetime = start + timedelta(seconds=i)
+                head: str = f'{t:%Y%m%d} {t:%H:%M:%S} c2101 {rng.choice("买卖")} {rng.choice("开平")} ' \
+                            f'{2400 + rng.randrange(100)}.000 1'
+                f.write(f'{head:<107}1.20 {i:08d} 000001\n')
+            f.write(f'合计 {n}\n')
+    return path
+
+
+@benchmark('statement.read_order', STATEMENT_SIZE_LIST, setup=make_order_statement,
+           preload=['QuantWorkshopTq.operate'])
+def bench_read_order(path: str) -> int:
+    from QuantWorkshopTq.operate import read_order
+
+    return len(read_order(path))
+
+
+@benchmark('statement.read_order_frame', STATEMENT_SIZE_LIST, setup=make_order_statement,
+           preload=['QuantWorkshopTq.operate'])
+def bench_read_order_frame(path: str) -> int:
+    from QuantWorkshopTq.operate import read_order_frame
+
+    return len(read_order_frame(path, encoding='utf-8'))
+
+
+@benchmark('statement.read_trade', STATEMENT_SIZE_LIST, setup=make_trade_statement,
+           preload=['QuantWorkshopTq.operate'])
+def bench_read_trade(path: str) -> int:
+    from QuantWorkshopTq.operate import read_trade
+
+    return len(read_trade(path))
+
+
+@benchmark('statement.read_trade_frame', STATEMENT_SIZE_LIST, setup=make_trade_statement,
+           preload=['QuantWorkshopTq.operate'])
+def bench_read_trade_frame(path: str) -> int:
+    from QuantWorkshopTq.operate import read_trade_frame
+
+    return len(read_trade_frame(path, encoding='utf-8'))
+
+
+# ------------------------------------------------------------------------------------------------
+# 运行、保存、比较
+# ------------------------------------------------------------------------------------------------
+
+def run_benchmark(bench: Benchmark, param: Any, repeat: int, budget: float) -> Dict[str, Any]:
+    """
+    :return: {'min': 秒/操作, 'median': 秒/操作, 'ops': 每次执行的操作数, 'repeat': 执行次数}
+    """
+    for module_name in bench.preload:
+        importlib.import_module(module_name)
+    elapsed_list: List[float] = []
+    ops: int = 1
+    total: float = 0.0
+    while len(elapsed_list) < repeat and (not elapsed_list or total < budget):
+        state = bench.setup(param) if bench.setup else param
+        t0: float = time.perf_counter()
+        ops = bench.func(state) or 1
+        elapsed: float = time.perf_counter() - t0
+        elapsed_list.append(elapsed / ops)
+        total += elapsed
+    return {'min': min(elapsed_list), 'median': statistics.median(elapsed_list), 'ops': ops,
+            'repeat': len(elapsed_list)}
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:8.2f} {unit:<2}'
+    return f'{seconds / 1e-9:8.1f} ns'
+
+
+def get_commit() -> str:
+    try:
+        commit: str = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                     check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        dirty: str = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        return f'{commit}-dirty' if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(pattern_list: List[str], repeat: int, budget: float, max_n: int) -> Dict[str, Dict[str, Any]]:
+    result_dict: Dict[str, Dict[str, Any]] = {}
+    for bench in BENCHMARK_LIST:
+        if pattern_list and not any(bench.name.startswith(pattern) for pattern in pattern_list):
+            continue
+        for param in bench.param_list:
+            if isinstance(param, int) and param > max_n:
+                continue
+            key: str = bench.name if param is None else f'{bench.name}[{param}]'
+            try:
+                result_dict[key] = run_benchmark(bench, param, repeat, budget)
+            except Exception as e:
+                print(f'{key:<40} 跳过: {e!r}')
+                continue
+            print(f'{key:<40} min {format_time(result_dict[key]["min"])}  '
+                  f'median {format_time(result_dict[key]["median"])}  / op')
+    return result_dict
+
+
+def save_result(result_dict: Dict[str, Dict[str, Any]]) -> str:
+    os.makedirs(RESULT_PATH, exist_ok=True)
+    commit: str = get_commit()
+    path: str = os.path.join(RESULT_PATH, f'{commit}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'datetime': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'result': result_dict,
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_result(name: str) -> Dict[str, Any]:
+    """
+    :param name: 结果文件路径，或 commit（HEAD 表示当前 commit）。
+    """
+    if not os.path.exists(name):
+        if name == 'HEAD':
+            name = get_commit()
+        name = os.path.join(RESULT_PATH, f'{name}.json')
+    with open(name, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(base_name: str, head_name: str, threshold: float) -> int:
+    """
+    按 min 比较，head / base > 1 + threshold 视为变慢。
+    :return: 变慢的用例数。
+    """
+    base: Dict[str, Any] = load_result(base_name)
+    head: Dict[str, Any] = load_result(head_name)
+    print(f'base: {base["commit"]} ({base["datetime"]}), head: {head["commit"]} ({head["datetime"]})')
+    regression_count: int = 0
+    for key in sorted(set(base['result']) | set(head['result'])):
+        if key not in base['result'] or key not in head['result']:
+            print(f'{key:<40} {"仅 base" if key in base["result"] else "仅 head"}')
+            continue
+        t_base: float = base['result'][key]['min']
+        t_head: float = head['result'][key]['min']
+        ratio: float = t_head / t_base if t_base else float('inf')
+        flag: str = ''
+        if ratio > 1 + threshold:
+            flag = '  变慢'
+            regression_count += 1
+        elif ratio < 1 / (1 + threshold):
+            flag = '  变快'
+        print(f'{key:<40} {format_time(t_base)} -> {format_time(t_head)}  x{ratio:6.2f}{flag}')
+    return regression_count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='热点代码微基准测试')
+    parser.add_argument('pattern', nargs='*', help='只运行名称以此开头的用例，如 order trend.hl')
+    parser.add_argument('--list', action='store_true', help='列出用例')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='每个用例最多执行次数')
+    parser.add_argument('-b', '--budget', type=float, default=2.0, help='每个用例累计超过该秒数后不再重复')
+    parser.add_argument('--max-n', type=int, default=100_000, help='跳过规模大于该值的用例，1000000 为全部')
+    parser.add_argument('--no-save', action='store_true', help='不保存结果')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='比较两次结果（commit 或文件路径）')
+    parser.add_argument('--threshold', type=float, default=0.1, help='比较时视为变化的比例')
+    args = parser.parse_args()
+
+    if args.list:
+        for bench in BENCHMARK_LIST:
+            print(f'{bench.name:<32} {", ".join(str(param) for param in bench.param_list if param is not None)}')
+        return 0
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.threshold) else 0
+
+    print(f'{platform.python_version()}, {platform.platform()}, commit {get_commit()}')
+    result_dict = run_suite(args.pattern, args.repeat, args.budget, args.max_n)
+    if not args.no_save and result_dict:
+        print(f'结果: {save_result(result_dict)}')
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        code: int = main()
+    finally:
+        shutil.rmtree(_temp_path, ignore_errors=True)
+    sys.exit(code)
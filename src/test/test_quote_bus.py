@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Bruce Frank Wong'
+
+
+"""
+用合成行情驱动 QuoteRing：一个写进程、多个读进程，检查读到的记录没有写了一半的，统计发布到读取的延迟。
+
+    python test_quote_bus.py --readers 4 --count 200000
+"""
+
+
+from types import SimpleNamespace
+from typing import List
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from QuantWorkshopTq.utility.quote_bus import QuoteRing, QuoteLost
+
+
+SYMBOL: str = 'TEST.bus0001'
+
+
+def make_quote(i: int) -> SimpleNamespace:
+    """
+    各字段都由 i 算出，读进程可以据此检查记录是否完整。
+    """
+    return SimpleNamespace(datetime='', last_price=float(i), highest=float(i + 1), lowest=float(i - 1),
+                           bid_price1=float(i), bid_volume1=i % 100, ask_price1=float(i + 2), ask_volume1=i % 7,
+                           volume=i, amount=float(i) * 10, open_interest=float(i) * 3)
+
+
+def check(tick: np.ndarray) -> bool:
+    i: int = int(tick['volume'][0])
+    return (tick['last_price'][0] == i and tick['highest'][0] == i + 1 and tick['lowest'][0] == i - 1
+            and tick['ask_price1'][0] == i + 2 and tick['bid_volume1'][0] == i % 100
+            and tick['amount'][0] == i * 10 and tick['open_interest'][0] == i * 3)
+
+
+def read_loop(reader_id: int, count: int, result_queue: multiprocessing.Queue):
+    ring: QuoteRing = QuoteRing.attach(SYMBOL)
+    received: int = 0
+    lost: int = 0
+    bad: int = 0
+    latency_list: List[int] = []
+    after: int = ring.write_count
+    while after < count:
+        try:
+            after, tick_list = ring.wait(after, timeout=5)
+        except QuoteLost:
+            new_after: int = ring.write_count
+            lost += new_after - after
+            after = new_after
+            continue
+        if not tick_list:
+            break
+        now: int = time.time_ns()
+        for tick in tick_list:
+            received += 1
+            if not check(tick):
+                bad += 1
+        latency_list.append(now - int(tick_list[-1]['local_time'][0]))
+    ring.close()
+    result_queue.put((reader_id, received, lost, bad, latency_list))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quote bus harness with synthetic quotes.')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--capacity', type=int, default=4096)
+    parser.add_argument('--interval', type=float, default=0.0, help='Seconds between quotes.')
+    args = parser.parse_args()
+
+    ring: QuoteRing = QuoteRing.create(SYMBOL, args.capacity)
+    result_queue: multiprocessing.Queue = multiprocessing.Queue()
+    process_list: List[multiprocessing.Process] = [
+        multiprocessing.Process(target=read_loop, args=(i, args.count, result_queue)) for i in range(args.readers)
+    ]
+    for process in process_list:
+        process.start()
+    time.sleep(0.5)
+
+    start: float = time.perf_counter()
+    for i in range(args.count):
+        ring.publish(make_quote(i))
+        if args.interval:
+            time.sleep(args.interval)
+    elapsed: float = time.perf_counter() - start
+    print(f'Published {args.count} quotes in {elapsed:.3f}s, {args.count / elapsed:,.0f} quotes/s.')
+
+    for _ in process_list:
+        reader_id, received, lost, bad, latency_list = result_queue.get()
+        latency: np.ndarray = np.array(latency_list) / 1000
+        print(f'Reader {reader_id}: received={received}, lost={lost}, torn={bad}, '
+              f'latency p50={np.percentile(latency, 50):.1f}us, p99={np.percentile(latency, 99):.1f}us')
+        assert bad == 0
+    for process in process_list:
+        process.join()
+    ring.close()
+
+
+if __name__ == '__main__':
+    main()